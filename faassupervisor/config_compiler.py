@@ -0,0 +1,64 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Build step that turns a function config file into a
+precompiled and validated artifact.
+
+The artifact is stored next to the config file and is loaded
+by ConfigUtils instead of parsing the YAML file, as long as
+the hash of the config file content matches.
+
+Usage:
+    python -m faassupervisor.config_compiler /var/task/function_config.yaml
+"""
+
+import argparse
+import copy
+import sys
+import yaml
+from faassupervisor.exceptions import FaasSupervisorError
+from faassupervisor.storage.config import validate_storage_providers
+from faassupervisor.utils import ConfigUtils, FileUtils
+
+
+def compile_config(config_path, artifact_path=None):
+    """Parses and validates the config file and stores the
+    resulting artifact. Returns the artifact path."""
+    content = FileUtils.read_file(config_path)
+    config = yaml.safe_load(content)
+    if config:
+        # Validation can complete the credentials, don't store them
+        validate_storage_providers(copy.deepcopy(config))
+    if not artifact_path:
+        artifact_path = ConfigUtils.get_config_artifact_path(config_path)
+    FileUtils.create_file_with_content(artifact_path,
+                                       ConfigUtils.build_config_artifact(content, config))
+    return artifact_path
+
+
+def main():
+    """Compiles the config file passed as argument."""
+    parser = argparse.ArgumentParser(description='Precompile a function config file.')
+    parser.add_argument('config_path', help='Path of the function config file')
+    parser.add_argument('-o', '--output', help='Path of the generated artifact')
+    args = parser.parse_args()
+    try:
+        artifact_path = compile_config(args.config_path, args.output)
+    except FaasSupervisorError as fse:
+        print(f'Invalid function config: {fse}', file=sys.stderr)
+        sys.exit(1)
+    print(f'Config artifact created in \'{artifact_path}\'')
+
+
+if __name__ == "__main__":
+    main()
@@ -153,3 +153,25 @@ def parse_event(event, storage_provider="default"):
         parsed_event = _parse_storage_event(event, storage_provider)
         _set_storage_env_vars(parsed_event, event)
     return parsed_event if parsed_event else UnknownEvent(event)
+
+
+def parse_events(event, storage_provider="default"):
+    """Parses the received event and returns a list of parsed events.
+
+    S3 and MinIO notifications can contain several records,
+    so one parsed event is returned for each of them."""
+    parsed_event = parse_event(event, storage_provider)
+    if not isinstance(parsed_event, (S3Event, MinioEvent)):
+        return [parsed_event]
+    parsed_events = [parsed_event]
+    records = parsed_event.event.get('Records', [])
+    for record in records[1:]:
+        if record.get('eventSource') != parsed_event.event_records.get('eventSource'):
+            get_logger().warning('Ignoring record from a different event source: %s',
+                                 record.get('eventSource'))
+            continue
+        parsed_events.append(type(parsed_event)({**parsed_event.event, 'Records': [record]},
+                                                parsed_event.provider_id))
+    if len(parsed_events) > 1:
+        get_logger().info('%d storage event records found.', len(parsed_events))
+    return parsed_events
@@ -63,3 +63,5 @@ class MinioEvent(UnknownEvent):
         self.object_key = unquote_plus(self.event_records['s3']['object']['key'])
         self.file_name = FileUtils.get_file_name(self.object_key)
         self.event_time = self.event_records['eventTime']
+        self.object_size = self.event_records['s3']['object'].get('size')
+        self.object_etag = self.event_records['s3']['object'].get('eTag')
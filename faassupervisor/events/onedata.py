@@ -35,3 +35,4 @@ class OnedataEvent(UnknownEvent):
         self.object_key = self.event['Key']
         self.file_name = self.event_records['objectKey']
         self.event_time = self.event_records['eventTime']
+        self.object_id = self.event_records.get('objectId')
@@ -164,6 +164,41 @@ class StorageAuthError(FaasSupervisorError):
     fmt = "The storage authentication of '{auth_type}' is not well-defined."
 
 
+class InputStreamError(FaasSupervisorError):
+    """
+    The input file could not be streamed.
+
+    """
+    fmt = "Error streaming input file '{file_name}': {error}"
+
+
+class StorageOperationNotSupportedError(FaasSupervisorError):
+    """
+    The storage provider doesn't support the requested operation.
+
+    """
+    fmt = "The '{storage_type}' storage provider doesn't support {operation}."
+
+
+class OutputUploadError(FaasSupervisorError):
+    """
+    Some output files could not be uploaded.
+
+    """
+    fmt = "Failed to upload {failed} of {total} output files: {details}"
+
+
+################################################
+##           S3 PROVIDER EXCEPTIONS           ##
+################################################
+class S3DownloadSizeError(FaasSupervisorError):
+    """
+    The size of the downloaded file doesn't match the object size.
+    """
+    fmt = ("Downloaded file '{file_name}' has {downloaded} bytes "
+           "but {expected} bytes were expected.")
+
+
 ################################################
 ##        ONEDATA PROVIDER EXCEPTIONS         ##
 ################################################
@@ -191,6 +226,24 @@ class OnedataFolderCreationError(FaasSupervisorError):
            "Status code: {status_code}")
 
 
+class OnedataDownloadSizeError(FaasSupervisorError):
+    """
+    The size of the downloaded file doesn't match the Onedata file size.
+    """
+    fmt = ("Downloaded file '{file_name}' has {downloaded} bytes "
+           "but {expected} bytes were expected.")
+
+
+################################################
+##         WEBDAV PROVIDER EXCEPTIONS         ##
+################################################
+class WebDavDownloadError(FaasSupervisorError):
+    """
+    Downloading file from WebDav failed after all the retries.
+    """
+    fmt = "Downloading file '{file_name}' from WebDav failed: {error}"
+
+
 ################################################
 #          RUCIO PROVIDER EXCEPTIONS           #
 ################################################
@@ -23,7 +23,9 @@ class DefaultSupervisor(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def execute_function(self):
         """Executes the function code
-        (udocker container or user script)."""
+        (udocker container or user script).
+
+        Returns True if the execution finished successfully."""
 
     @abc.abstractmethod
     def create_response(self):
@@ -15,7 +15,6 @@
 used to manage the batch jobs from the lambda environment."""
 
 import json
-import boto3
 from faassupervisor.utils import ConfigUtils
 
 
@@ -41,6 +40,8 @@ class Batch():
         }
 
     def _create_batch_client(self):
+        # Imported here to avoid loading boto3 when batch is not used
+        import boto3  # pylint: disable=import-outside-toplevel
         self.client = boto3.client('batch')
 
     def _set_job_variables(self):
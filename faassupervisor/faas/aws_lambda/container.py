@@ -31,6 +31,7 @@ class Container():
     def __init__(self, lambda_instance):
         self.lambda_instance = lambda_instance
         self.script = None
+        self.returncode = None
 
         if hasattr(self.lambda_instance, 'script_path'):
             self.script = self.lambda_instance.script_path
@@ -62,9 +63,9 @@ class Container():
                                       env=new_env,
                                       start_new_session=True) as process:
                     try:
-                        rc = process.wait(timeout=remaining_seconds)
-                        if rc != 0:
-                            get_logger().warning("User script exited with code %s!" % rc)
+                        self.returncode = process.wait(timeout=remaining_seconds)
+                        if self.returncode != 0:
+                            get_logger().warning("User script exited with code %s!" % self.returncode)
                     except subprocess.TimeoutExpired:
                         get_logger().info("Stopping process '%s'", process)
                         process.kill()
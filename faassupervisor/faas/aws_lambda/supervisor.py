@@ -53,6 +53,8 @@ class LambdaSupervisor(DefaultSupervisor):
                       f"  scar log -n {self.lambda_instance.get_function_name()} -ri {batch_ri}")
         get_logger().info(batch_logs)
         self.body["udocker_output"] = batch_logs.encode('utf-8')
+        # The outputs are generated by the batch job, not here
+        return False
 
     def _execute_udocker(self):
         try:
@@ -60,10 +62,12 @@ class LambdaSupervisor(DefaultSupervisor):
             udocker.prepare_container()
             self.body["udocker_output"] = udocker.launch_udocker_container()
             get_logger().debug("CONTAINER OUTPUT:\n %s", self.body["udocker_output"].decode(encoding='utf-8', errors='ignore'))
+            return udocker.returncode == 0
         except (subprocess.TimeoutExpired, ContainerTimeoutExpiredWarning):
             get_logger().warning("Container execution timed out")
             if _is_lambda_batch_execution():
                 self._execute_batch()
+            return False
 
     def _execute_container(self):
         get_logger().debug("EXECUTING CONTAINER!.")
@@ -71,16 +75,17 @@ class LambdaSupervisor(DefaultSupervisor):
             container = Container(self.lambda_instance)
             self.body["container_output"] = container.invoke_function()
             get_logger().debug("CONTAINER OUTPUT:\n %s", self.body["container_output"].decode(encoding='utf-8', errors='ignore'))
+            return container.returncode == 0
         except (subprocess.TimeoutExpired, ContainerTimeoutExpiredWarning):
             get_logger().warning("Container execution timed out")
+            return False
 
     def execute_function(self):
         if SysUtils.is_lambda_image_environment():
-            self._execute_container()
-        elif is_batch_execution():
-            self._execute_batch()
-        else:
-            self._execute_udocker()
+            return self._execute_container()
+        if is_batch_execution():
+            return self._execute_batch()
+        return self._execute_udocker()
 
     def create_error_response(self):
         exception_msg = traceback.format_exc()
@@ -35,6 +35,7 @@ class Udocker():
 
     def __init__(self, lambda_instance):
         self.lambda_instance = lambda_instance
+        self.returncode = None
         # Create required udocker folder
         FileUtils.create_folder(SysUtils.get_env_var("UDOCKER_DIR"))
         # Init the udocker command that will be executed
@@ -196,7 +197,7 @@ class Udocker():
                                   stdout=out,
                                   start_new_session=True) as process:
                 try:
-                    process.wait(timeout=remaining_seconds)
+                    self.returncode = process.wait(timeout=remaining_seconds)
                 except subprocess.TimeoutExpired:
                     get_logger().info("Stopping process '%s'", process)
                     process.kill()
@@ -48,6 +48,7 @@ class BinarySupervisor(DefaultSupervisor):
 
     def execute_function(self):
         script_path = self._get_script_path()
+        returncode = None
         if script_path:
             try:
                 pyinstaller_library_path = SysUtils.get_env_var('LD_LIBRARY_PATH')
@@ -66,6 +67,9 @@ class BinarySupervisor(DefaultSupervisor):
                 for line in proc.stdout:
                     get_logger().debug(line.strip())
                     self.output = self.output + line
+                returncode = proc.wait()
+                if returncode != 0:
+                    get_logger().warning("User script exited with code %s!", returncode)
             except subprocess.CalledProcessError as cpe:
                 # Exit with user script return code if an
                 # error occurs (Kubernetes handles the error)
@@ -73,6 +77,7 @@ class BinarySupervisor(DefaultSupervisor):
                 sys.exit(cpe.returncode)
         else:
             get_logger().error('No user script found!')
+        return returncode == 0
 
     def create_response(self):
         if self.event_type and self.event_type == 'UNKNOWN':
@@ -0,0 +1,192 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the event window used by the binary supervisor
+to process bursts of events with a single script execution.
+
+Enabled with the 'event_window' section of the function config:
+
+event_window:
+  max_events: 50              # Maximum events per batch
+  timeout: 2000               # Milliseconds to wait for more events
+  spool_dir: /mnt/spool       # Optional, read events from files instead of stdin
+
+Events are read from stdin (one JSON event per line) or from the files
+of the spool folder. The window starts when the first event arrives and
+ends when 'max_events' are gathered or 'timeout' expires.
+
+Spool files are kept in the '.claimed' folder while their batch is
+processed and moved to the '.failed' folder if it fails."""
+
+import os
+import select
+import time
+from faassupervisor.logger import get_logger
+from faassupervisor.utils import ConfigUtils, FileUtils, SysUtils
+
+
+class EventWindow():
+    """Gathers the received events in batches."""
+
+    _DEFAULT_MAX_EVENTS = 10
+    _DEFAULT_TIMEOUT = 1000
+    _POLL_INTERVAL = 0.05
+    _READ_SIZE = 64 * 1024
+    # Folder of the spool where the events are moved while being read
+    _CLAIMED_FOLDER = '.claimed'
+    # Folder of the spool where the events of failed batches are kept
+    _FAILED_FOLDER = '.failed'
+
+    def __init__(self, max_events=_DEFAULT_MAX_EVENTS, timeout=_DEFAULT_TIMEOUT, spool_dir=None):
+        self.max_events = max(int(max_events), 1)
+        self.timeout = max(int(timeout), 0) / 1000
+        self.spool_dir = spool_dir
+        self._buffer = b''
+        self._eof = False
+        # Spool files of the current batch
+        self._claimed_paths = []
+
+    @classmethod
+    def from_config(cls):
+        """Returns the event window defined in the function config or None."""
+        window_config = ConfigUtils.read_cfg_var('event_window')
+        if not isinstance(window_config, dict):
+            return None
+        try:
+            return cls(window_config.get('max_events', cls._DEFAULT_MAX_EVENTS),
+                       window_config.get('timeout', cls._DEFAULT_TIMEOUT),
+                       window_config.get('spool_dir'))
+        except (TypeError, ValueError) as exc:
+            get_logger().warning('Event window disabled: %s', exc)
+            return None
+
+    def get_batches(self, stream=None):
+        """Yields lists of events until the source is exhausted.
+
+        When reading from the spool, the source is exhausted when
+        no event arrives during 'timeout'."""
+        while True:
+            if self.spool_dir:
+                batch = self._read_spool_batch()
+            else:
+                batch = self._read_stream_batch(stream)
+            if not batch:
+                return
+            get_logger().info('Event window closed with %d events', len(batch))
+            yield batch
+
+    def _read_stream_batch(self, stream):
+        """Reads newline-delimited events from the stream.
+        Waits for the first event without timeout."""
+        batch = []
+        deadline = None
+        fd = stream.fileno()
+        while len(batch) < self.max_events:
+            line = self._pop_line()
+            if line is not None:
+                if line.strip():
+                    batch.append(line.decode('utf-8', errors='ignore'))
+                    if deadline is None:
+                        deadline = time.monotonic() + self.timeout
+                continue
+            if self._eof:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                break
+            data = os.read(fd, self._READ_SIZE)
+            if data:
+                self._buffer += data
+            else:
+                self._eof = True
+                # The last event may not end with a new line
+                self._buffer += b'\n' if self._buffer else b''
+        return batch
+
+    def _pop_line(self):
+        line, sep, rest = self._buffer.partition(b'\n')
+        if not sep:
+            return None
+        self._buffer = rest
+        return line
+
+    def _read_spool_batch(self):
+        """Claims the oldest event files of the spool folder.
+
+        Files are moved to a hidden folder before reading them, so several
+        supervisors can share the spool. Files starting with '.' are ignored
+        to allow writing the events atomically."""
+        claimed_dir = SysUtils.join_paths(self.spool_dir, self._CLAIMED_FOLDER)
+        FileUtils.create_folder(claimed_dir)
+        batch = []
+        deadline = time.monotonic() + self.timeout
+        while len(batch) < self.max_events:
+            for file_name in self._get_spool_files():
+                claimed_path = SysUtils.join_paths(claimed_dir, file_name)
+                try:
+                    os.rename(SysUtils.join_paths(self.spool_dir, file_name), claimed_path)
+                except FileNotFoundError:
+                    # Claimed by other supervisor
+                    continue
+                batch.append(FileUtils.read_file(claimed_path))
+                self._claimed_paths.append(claimed_path)
+                if len(batch) == 1:
+                    # The window starts with the first event
+                    deadline = time.monotonic() + self.timeout
+                if len(batch) == self.max_events:
+                    break
+            if len(batch) == self.max_events or time.monotonic() >= deadline:
+                break
+            time.sleep(self._POLL_INTERVAL)
+        return batch
+
+    def complete_batch(self):
+        """Removes the spool files of the last batch once it is processed."""
+        for claimed_path in self._claimed_paths:
+            try:
+                os.remove(claimed_path)
+            except FileNotFoundError:
+                pass
+        self._claimed_paths = []
+
+    def fail_batch(self):
+        """Moves the spool files of the last batch to the failed folder,
+        so they can be inspected or moved back to the spool to retry them."""
+        if not self._claimed_paths:
+            return
+        failed_dir = SysUtils.join_paths(self.spool_dir, self._FAILED_FOLDER)
+        FileUtils.create_folder(failed_dir)
+        for claimed_path in self._claimed_paths:
+            try:
+                os.replace(claimed_path,
+                           SysUtils.join_paths(failed_dir, os.path.basename(claimed_path)))
+            except FileNotFoundError:
+                pass
+        get_logger().warning('Batch failed, %d events moved to \'%s\'',
+                             len(self._claimed_paths), failed_dir)
+        self._claimed_paths = []
+
+    def _get_spool_files(self):
+        files = []
+        for entry in os.scandir(self.spool_dir):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_file():
+                    files.append((entry.stat().st_mtime_ns, entry.name))
+            except FileNotFoundError:
+                continue
+        return [file_name for _, file_name in sorted(files)]
@@ -0,0 +1,152 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the persistent cache of downloaded input files.
+
+Enabled with the 'input_cache' section of the function config:
+
+input_cache:
+  path: /mnt/cache          # Defaults to '<tmp_dir>/faas-supervisor-cache'
+  max_size: 536870912       # Bytes, defaults to 256 MiB
+
+Files are identified by provider, bucket, key and ETag (or version id),
+so only objects with a known version are cached. Entries are read-only
+and cloned (or copied) into the input folder, so scripts that modify
+their input never change the cached file."""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import uuid
+from faassupervisor.logger import get_logger
+from faassupervisor.utils import ConfigUtils, FileUtils, SysUtils
+
+
+class InputCache():
+    """Content-addressed cache with LRU eviction against a size budget.
+
+    The modification time of each entry is used as its last access time.
+    Entries are written to a temporary file and renamed, so concurrent
+    invocations sharing the cache folder never see partial files."""
+
+    _DEFAULT_FOLDER = 'faas-supervisor-cache'
+    _DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, path, max_size=_DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.objects_path = SysUtils.join_paths(path, 'objects')
+        self.tmp_path = SysUtils.join_paths(path, 'tmp')
+        FileUtils.create_folder(self.objects_path)
+        FileUtils.create_folder(self.tmp_path)
+
+    @classmethod
+    def from_config(cls):
+        """Returns the input cache defined in the function config or None."""
+        cache_config = ConfigUtils.read_cfg_var('input_cache')
+        if not isinstance(cache_config, dict):
+            return None
+        path = cache_config.get('path') or \
+            SysUtils.join_paths(FileUtils.get_tmp_dir(), cls._DEFAULT_FOLDER)
+        try:
+            max_size = int(cache_config.get('max_size', cls._DEFAULT_MAX_SIZE))
+            return cls(path, max_size)
+        except (OSError, TypeError, ValueError) as exc:
+            get_logger().warning('Input cache disabled: %s', exc)
+            return None
+
+    @staticmethod
+    def get_key(*identifiers):
+        """Returns the cache key of an object from its identifiers
+        (provider, bucket, object key, version...).
+        Returns None if any of them is unknown."""
+        if any(identifier in (None, '') for identifier in identifiers):
+            return None
+        return hashlib.sha256('\n'.join(str(i) for i in identifiers).encode('utf-8')).hexdigest()
+
+    def _get_entry_path(self, key):
+        return SysUtils.join_paths(self.objects_path, key)
+
+    def fetch(self, key, file_path):
+        """Places the cached file in 'file_path'.
+        Returns True on hit and False on miss or error."""
+        entry_path = self._get_entry_path(key)
+        try:
+            _clone_or_copy(entry_path, file_path)
+            # Mark the entry as recently used
+            os.utime(entry_path)
+        except OSError as exc:
+            if not isinstance(exc, FileNotFoundError):
+                get_logger().warning('Unable to read input file \'%s\' from cache: %s',
+                                     file_path, exc)
+            _remove_file(file_path)
+            return False
+        get_logger().info('Input file \'%s\' found in cache', file_path)
+        return True
+
+    def store(self, key, file_path):
+        """Adds a downloaded file to the cache and evicts
+        the least recently used entries if needed."""
+        tmp_entry_path = SysUtils.join_paths(self.tmp_path, f'{key}.{uuid.uuid4()}')
+        try:
+            if os.path.getsize(file_path) > self.max_size:
+                return
+            _clone_or_copy(file_path, tmp_entry_path)
+            os.chmod(tmp_entry_path, 0o444)
+            os.replace(tmp_entry_path, self._get_entry_path(key))
+            self._evict()
+        except OSError as exc:
+            get_logger().warning('Unable to cache input file \'%s\': %s', file_path, exc)
+            _remove_file(tmp_entry_path)
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.objects_path):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+def _remove_file(file_path):
+    """Removes a (partial) file if it exists."""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+# ioctl to share the blocks of a file (reflink) in btrfs, xfs...
+_FICLONE = 0x40049409
+
+
+def _clone_or_copy(src_path, dst_path):
+    """Clones 'src_path' into 'dst_path' with a copy-on-write reflink
+    or copies it if the file system doesn't support it.
+    The new file never shares the inode with the source."""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            shutil.copyfileobj(src, dst)
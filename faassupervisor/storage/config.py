@@ -13,47 +13,150 @@
 # limitations under the License.
 """Class to parse, store and manage storage information."""
 
-from faassupervisor.storage.providers.webdav import WebDav
-from faassupervisor.utils import ConfigUtils, FileUtils, StrUtils
+import copy
+import importlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from faassupervisor.utils import ConfigUtils, FileUtils, StrUtils, SysUtils
 from faassupervisor.exceptions import StorageAuthError, \
     InvalidStorageProviderError, exception
-from faassupervisor.storage.providers.local import Local
-from faassupervisor.storage.providers.minio import Minio
-from faassupervisor.storage.providers.onedata import Onedata
-from faassupervisor.storage.providers.s3 import S3
-from faassupervisor.storage.providers.rucio import Rucio
 from faassupervisor.logger import get_logger
+from faassupervisor.storage.cache import InputCache
+from faassupervisor.storage.origins import FileOrigins
+from faassupervisor.storage.routing import OutputRouter
+from faassupervisor.storage.stream import InputStream
+from faassupervisor.storage.uploader import OutputUploader
 
 _STORAGE_CREDENTIALS_PATH = "/var/run/secrets/providers/"
 
+# Maximum number of input files downloaded at the same time
+_DEFAULT_DOWNLOAD_CONCURRENCY = 8
+
+# Storage providers available by type.
+# Provider modules (and their SDKs) are only imported when requested.
+_STORAGE_PROVIDERS = {
+    'LOCAL': ('faassupervisor.storage.providers.local', 'Local'),
+    'MINIO': ('faassupervisor.storage.providers.minio', 'Minio'),
+    'ONEDATA': ('faassupervisor.storage.providers.onedata', 'Onedata'),
+    'S3': ('faassupervisor.storage.providers.s3', 'S3'),
+    'WEBDAV': ('faassupervisor.storage.providers.webdav', 'WebDav'),
+    'RUCIO': ('faassupervisor.storage.providers.rucio', 'Rucio'),
+}
+
+
+def get_provider_class(storage_type):
+    """Returns the storage provider class of the type specified,
+    importing its module the first time it is requested."""
+    if storage_type not in _STORAGE_PROVIDERS:
+        raise InvalidStorageProviderError(storage_type=storage_type)
+    module_name, class_name = _STORAGE_PROVIDERS[storage_type]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+# Storage data reused by warm invocations of the same execution environment.
+# Discarded when the function config changes.
+_RUNTIME_CACHE = {
+    'config_hash': None,
+    'storage_config': None,
+    'providers': {}
+}
+
+
+def _get_runtime_cache():
+    """Returns the runtime cache, resetting it
+    if the function config has changed."""
+    config_hash = ConfigUtils.get_config_hash()
+    if _RUNTIME_CACHE['config_hash'] != config_hash:
+        _RUNTIME_CACHE['config_hash'] = config_hash
+        _RUNTIME_CACHE['storage_config'] = None
+        _RUNTIME_CACHE['providers'] = {}
+    return _RUNTIME_CACHE
+
+
+def clear_runtime_cache():
+    """Discards the storage data reused between invocations."""
+    _RUNTIME_CACHE['config_hash'] = None
+    _RUNTIME_CACHE['storage_config'] = None
+    _RUNTIME_CACHE['providers'] = {}
+
+
 def create_provider(storage_auth):
     """Returns the storage provider needed
     based on the authentication type defined.
 
     If not storage auth provided, use local storage."""
     if not storage_auth:
-        provider = Local(storage_auth)
-    elif storage_auth.type == 'MINIO':
-        provider = Minio(storage_auth)
-    elif storage_auth.type == 'ONEDATA':
-        provider = Onedata(storage_auth)
-    elif storage_auth.type == 'S3':
-        provider = S3(storage_auth)
-    elif storage_auth.type == 'WEBDAV':
-        provider = WebDav(storage_auth)
-    elif storage_auth.type == 'RUCIO':
-        provider = Rucio(storage_auth)
-    else:
-        raise InvalidStorageProviderError(storage_type=storage_auth.type)
-    return provider
+        return get_provider_class('LOCAL')(storage_auth)
+    return get_provider_class(storage_auth.type)(storage_auth)
+
+
+def _get_concurrency_value(value):
+    """Returns a valid concurrency value (at least 1)."""
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        get_logger().warning('Invalid concurrency value \'%s\'. Using 1.', value)
+        return 1
+
+
+def _get_input_cache_key(auth_data, parsed_event):
+    """Returns the input cache key of the event object or None
+    if the object version (ETag) is unknown."""
+    if auth_data is None:
+        return None
+    return InputCache.get_key(auth_data.type,
+                              auth_data.provider_id,
+                              getattr(parsed_event, 'bucket_name', None),
+                              getattr(parsed_event, 'object_key', None),
+                              getattr(parsed_event, 'object_etag', None))
+
+
+def _download_file(stg_provider, auth_data, parsed_event, input_dir_path, input_cache=None):
+    """Downloads the file of the event through the input cache (if enabled)."""
+    cache_key = _get_input_cache_key(auth_data, parsed_event) if input_cache else None
+    if cache_key:
+        file_path = SysUtils.join_paths(input_dir_path, parsed_event.file_name)
+        if input_cache.fetch(cache_key, file_path):
+            return file_path
+    file_path = stg_provider.download_file(parsed_event, input_dir_path)
+    if cache_key:
+        input_cache.store(cache_key, file_path)
+    return file_path
+
+
+def _stage_object(stg_provider, stg_object, file_path, input_cache=None):
+    """Downloads an object listed by the provider through the input cache (if enabled)."""
+    FileUtils.create_folder(os.path.dirname(file_path))
+    cache_key = None
+    if input_cache:
+        cache_key = InputCache.get_key(stg_provider.get_type(),
+                                       stg_provider.stg_auth.provider_id,
+                                       stg_object['bucket'],
+                                       stg_object['key'],
+                                       stg_object.get('etag'))
+    if cache_key and input_cache.fetch(cache_key, file_path):
+        return
+    stg_provider.download_object(stg_object, file_path)
+    if cache_key:
+        input_cache.store(cache_key, file_path)
+
+
+def validate_storage_providers(config):
+    """Checks the storage providers credentials of a parsed function config.
+
+    Raises StorageAuthError if any provider is not well-defined."""
+    StorageConfig(read_config=False)._parse_storage_providers(config.get('storage_providers'))
 
 
 class AuthData():
     """Stores provider authentication values."""
 
-    def __init__(self, storage_type, credentials):
+    def __init__(self, storage_type, credentials, provider_id='default'):
         self.type = storage_type
         self.creds = credentials
+        self.provider_id = provider_id
 
     def get_credential(self, key):
         """Return authentication credentials previously stored."""
@@ -63,7 +166,7 @@ class AuthData():
 class StorageConfig():
     """Parses providers authentication variables and defined outputs."""
 
-    def __init__(self):
+    def __init__(self, read_config=True):
         # Create s3_auth with empty credentials
         self.s3_auth = {'default': AuthData('S3', None)}
         self.minio_auth = {}
@@ -72,7 +175,74 @@ class StorageConfig():
         self.rucio_auth = {}
         self.input = []
         self.output = []
-        self._parse_config()
+        self._output_router = None
+        # Provider registry counters of the invocation
+        self.provider_hits = 0
+        self.provider_misses = 0
+        # Downloaded files that can be copied server-side to the outputs
+        self.file_origins = FileOrigins()
+        # Pool shared by the downloads started in 'download_pool'
+        self._download_pool = None
+        # Locks of the providers that are not thread-safe
+        self._provider_locks = {}
+        self._provider_locks_lock = threading.Lock()
+        self._runtime_cache = None
+        if not read_config:
+            return
+        self._runtime_cache = _get_runtime_cache()
+        if self._runtime_cache['storage_config'] is None:
+            self._parse_config()
+            self._runtime_cache['storage_config'] = self._get_parsed_values()
+        else:
+            get_logger().info('Reusing storage configuration from previous invocation')
+            self._set_parsed_values(self._runtime_cache['storage_config'])
+
+    def _get_parsed_values(self):
+        return {
+            's3_auth': self.s3_auth,
+            'minio_auth': self.minio_auth,
+            'onedata_auth': self.onedata_auth,
+            'webdav_auth': self.webdav_auth,
+            'rucio_auth': self.rucio_auth,
+            'input': copy.deepcopy(self.input),
+            'output': copy.deepcopy(self.output)
+        }
+
+    def _set_parsed_values(self, values):
+        # Auth dicts are shared, input and output are copied because
+        # they can be modified during the invocation
+        self.s3_auth = values['s3_auth']
+        self.minio_auth = values['minio_auth']
+        self.onedata_auth = values['onedata_auth']
+        self.webdav_auth = values['webdav_auth']
+        self.rucio_auth = values['rucio_auth']
+        self.input = copy.deepcopy(values['input'])
+        self.output = copy.deepcopy(values['output'])
+
+    def _get_provider(self, auth_data):
+        """Returns the storage provider for the auth data.
+
+        Only one provider (and so one client) is created per (type, id),
+        shared by the download and upload phases and reused by warm invocations."""
+        if self._runtime_cache is None:
+            return create_provider(auth_data)
+        providers = self._runtime_cache['providers']
+        key = (auth_data.type, auth_data.provider_id) if auth_data else ('LOCAL', 'default')
+        if key in providers:
+            self.provider_hits += 1
+        else:
+            self.provider_misses += 1
+            providers[key] = create_provider(auth_data)
+        return providers[key]
+
+    def get_provider(self, storage_provider):
+        """Returns the storage provider defined as '<TYPE>.<ID>'
+        in the function config or None if it is not defined."""
+        auth_data = self._get_auth_data(StrUtils.get_storage_type(storage_provider),
+                                        StrUtils.get_storage_id(storage_provider))
+        if auth_data is None:
+            return None
+        return self._get_provider(auth_data)
 
     @exception()
     def _parse_config(self):
@@ -89,7 +259,9 @@ class StorageConfig():
         else:
             get_logger().warning('There is no input defined for this function.')
         # Read storage_providers dict
-        storage_providers = ConfigUtils.read_cfg_var('storage_providers')
+        self._parse_storage_providers(ConfigUtils.read_cfg_var('storage_providers'))
+
+    def _parse_storage_providers(self, storage_providers):
         if (storage_providers and
                 storage_providers != ''):
             # s3 storage provider auth
@@ -130,7 +302,7 @@ class StorageConfig():
                     if access_key != '' and secret_key != '':
                         minio_creds[provider_id]["access_key"] = access_key
                         minio_creds[provider_id]["secret_key"] = secret_key
-                        self.minio_auth[provider_id] = AuthData('MINIO', minio_creds[provider_id])
+                        self.minio_auth[provider_id] = AuthData('MINIO', minio_creds[provider_id], provider_id)
                     else:
                         raise StorageAuthError(auth_type='MINIO')
                 
@@ -141,7 +313,7 @@ class StorageConfig():
                         and minio_creds[provider_id]['secret_key'] is not None
                         and minio_creds[provider_id]['secret_key'] != ''):
                     # Validate other credentials present on the FDL (temporal)
-                    self.minio_auth[provider_id] = AuthData('MINIO', minio_creds[provider_id])
+                    self.minio_auth[provider_id] = AuthData('MINIO', minio_creds[provider_id], provider_id)
                 else:
                     raise StorageAuthError(auth_type='MINIO')
         else:
@@ -150,13 +322,18 @@ class StorageConfig():
     def _validate_s3_creds(self, s3_creds):
         if isinstance(s3_creds, dict):
             for provider_id in s3_creds:
-                if ('access_key' in s3_creds[provider_id]
+                if (isinstance(s3_creds[provider_id], dict)
+                        and not s3_creds[provider_id].get('access_key')
+                        and not s3_creds[provider_id].get('secret_key')):
+                    # Only tuning settings, the credentials are read from the environment
+                    self.s3_auth[provider_id] = AuthData('S3', s3_creds[provider_id], provider_id)
+                elif ('access_key' in s3_creds[provider_id]
                         and s3_creds[provider_id]['access_key'] is not None
                         and s3_creds[provider_id]['access_key'] != ''
                         and 'secret_key' in s3_creds[provider_id]
                         and s3_creds[provider_id]['secret_key'] is not None
                         and s3_creds[provider_id]['secret_key'] != ''):
-                    self.s3_auth[provider_id] = AuthData('S3', s3_creds[provider_id])
+                    self.s3_auth[provider_id] = AuthData('S3', s3_creds[provider_id], provider_id)
                 else:
                     raise StorageAuthError(auth_type='S3')
         else:
@@ -174,7 +351,7 @@ class StorageConfig():
                         and 'space' in onedata_creds[provider_id]
                         and onedata_creds[provider_id]['space'] is not None
                         and onedata_creds[provider_id]['space'] != ''):
-                    self.onedata_auth[provider_id] = AuthData('ONEDATA', onedata_creds[provider_id])
+                    self.onedata_auth[provider_id] = AuthData('ONEDATA', onedata_creds[provider_id], provider_id)
                 else:
                     raise StorageAuthError(auth_type='ONEDATA')
         else:
@@ -192,7 +369,7 @@ class StorageConfig():
                     and 'password' in webdav_creds[provider_id]
                     and webdav_creds[provider_id]['password'] is not None
                     and webdav_creds[provider_id]['password'] != ''):
-                    self.webdav_auth[provider_id] = AuthData('WEBDAV', webdav_creds[provider_id])
+                    self.webdav_auth[provider_id] = AuthData('WEBDAV', webdav_creds[provider_id], provider_id)
                 else:
                     raise StorageAuthError(auth_type='WEBDAV')
         else:
@@ -219,7 +396,7 @@ class StorageConfig():
                         and 'auth_host' in rucio_creds[provider_id]
                         and rucio_creds[provider_id]['auth_host'] is not None
                         and rucio_creds[provider_id]['auth_host'] != ''):
-                    self.rucio_auth[provider_id] = AuthData('RUCIO', rucio_creds[provider_id])
+                    self.rucio_auth[provider_id] = AuthData('RUCIO', rucio_creds[provider_id], provider_id)
                 else:
                     raise StorageAuthError(auth_type='RUCIO')
         else:
@@ -270,68 +447,222 @@ class StorageConfig():
 
         Returns the file path where the file is downloaded."""
         auth_data = self._get_input_auth_data(parsed_event)
-        stg_provider = create_provider(auth_data)
+        stg_provider = self._get_provider(auth_data)
         get_logger().info('Found \'%s\' input provider', stg_provider.get_type())
-        
-        return stg_provider.download_file(parsed_event, input_dir_path)
+        input_cache = InputCache.from_config()
+        file_path, = self._run_downloads(
+            lambda download: _download_file(*download, input_cache),
+            [(stg_provider, auth_data, parsed_event, input_dir_path)])
+        self._register_origin(auth_data, parsed_event, file_path)
+        return file_path
+
+    def download_inputs(self, parsed_events, input_dir_path):
+        """Downloads concurrently the files of several events.
+
+        Files with the same name are downloaded into numbered subfolders.
+        Returns the list of (parsed_event, file_path) downloaded."""
+        input_cache = InputCache.from_config()
+        downloads = []
+        file_names = set()
+        for index, parsed_event in enumerate(parsed_events):
+            auth_data = self._get_input_auth_data(parsed_event)
+            dir_path = input_dir_path
+            if parsed_event.file_name in file_names:
+                dir_path = SysUtils.join_paths(input_dir_path, str(index))
+                FileUtils.create_folder(dir_path)
+            file_names.add(parsed_event.file_name)
+            downloads.append((self._get_provider(auth_data), auth_data, parsed_event, dir_path))
+        get_logger().info('Downloading %d input files', len(downloads))
+        file_paths = self._run_downloads(
+            lambda download: _download_file(*download, input_cache), downloads)
+        for (_, auth_data, parsed_event, _), file_path in zip(downloads, file_paths):
+            self._register_origin(auth_data, parsed_event, file_path)
+        return list(zip(parsed_events, file_paths))
+
+    def stage_inputs(self, input_dir_path):
+        """Downloads concurrently the objects of the 'stage' paths of the inputs
+        to '<input_dir_path>/<bucket>/<key>'. Paths ending with '/' are prefixes.
+
+        Returns the list of staged file paths."""
+        input_cache = InputCache.from_config()
+        downloads = []
+        for input_value in self.input:
+            stage_paths = input_value.get('stage') or []
+            if not stage_paths:
+                continue
+            stg_provider = self.get_provider(input_value.get('storage_provider'))
+            if stg_provider is None or not stg_provider.supports_staging():
+                get_logger().warning('Unable to stage files from \'%s\' input provider',
+                                     input_value.get('storage_provider'))
+                continue
+            for path in stage_paths:
+                for stg_object in stg_provider.list_objects(path):
+                    file_path = os.path.normpath(SysUtils.join_paths(input_dir_path,
+                                                                     stg_object['bucket'],
+                                                                     stg_object['key']))
+                    if not file_path.startswith(f'{input_dir_path}/'):
+                        get_logger().warning('Skipping staging of object with invalid key \'%s\'',
+                                             stg_object['key'])
+                        continue
+                    downloads.append((stg_provider, stg_object, file_path))
+        if not downloads:
+            return []
+        get_logger().info('Staging %d input files', len(downloads))
+        self._run_downloads(lambda download: _stage_object(*download, input_cache), downloads)
+        for stg_provider, stg_object, file_path in downloads:
+            self.file_origins.register(file_path, {'type': stg_provider.get_type(),
+                                                   'provider_id': stg_provider.stg_auth.provider_id,
+                                                   **stg_object})
+        return [file_path for _, _, file_path in downloads]
+
+    @contextmanager
+    def download_pool(self):
+        """Runs the downloads started inside the context (from any thread)
+        in the same pool, so all of them are bounded by 'download_concurrency'."""
+        with ThreadPoolExecutor(
+                max_workers=_get_concurrency_value(self._get_download_concurrency())) as pool:
+            self._download_pool = pool
+            try:
+                yield
+            finally:
+                self._download_pool = None
+
+    def _get_provider_lock(self, stg_provider):
+        """Returns the lock of a provider that is not thread-safe or None."""
+        if stg_provider.is_thread_safe():
+            return None
+        with self._provider_locks_lock:
+            return self._provider_locks.setdefault(id(stg_provider), threading.Lock())
+
+    def _run_downloads(self, download_func, downloads):
+        """Calls 'download_func' for each download concurrently and returns the results.
+        The first item of each download must be its storage provider.
+
+        Providers that are not thread-safe download their files one at a time."""
+        provider_locks = {id(download[0]): self._get_provider_lock(download[0])
+                          for download in downloads}
+
+        def _download(download):
+            lock = provider_locks[id(download[0])]
+            if lock:
+                with lock:
+                    return download_func(download)
+            return download_func(download)
 
-    def upload_output(self, output_dir_path, parsed_event=None):
+        if self._download_pool:
+            futures = [self._download_pool.submit(_download, download) for download in downloads]
+            return [future.result() for future in futures]
+        concurrency = min(_get_concurrency_value(self._get_download_concurrency()),
+                          max(len(downloads), 1))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(_download, downloads))
+
+    def _register_origin(self, auth_data, parsed_event, file_path):
+        """Registers the downloaded file as a copy of the event object."""
+        if auth_data is None or not hasattr(parsed_event, 'bucket_name') or \
+                not FileUtils.is_file(file_path):
+            return
+        self.file_origins.register(file_path, {'type': auth_data.type,
+                                               'provider_id': auth_data.provider_id,
+                                               'bucket': parsed_event.bucket_name,
+                                               'key': parsed_event.object_key,
+                                               'etag': getattr(parsed_event, 'object_etag', None)})
+
+    @staticmethod
+    def _get_download_concurrency():
+        concurrency = ConfigUtils.read_cfg_var('download_concurrency')
+        return concurrency if concurrency != '' else _DEFAULT_DOWNLOAD_CONCURRENCY
+
+    def stream_input(self, parsed_event, input_dir_path):
+        """Starts streaming the event file through a named pipe
+        created in the input folder.
+
+        Returns the InputStream or None if the provider can't stream."""
+        auth_data = self._get_input_auth_data(parsed_event)
+        stg_provider = self._get_provider(auth_data)
+        if not stg_provider.supports_streaming():
+            get_logger().warning('\'%s\' provider does not support input streaming',
+                                 stg_provider.get_type())
+            return None
+        input_stream = InputStream(stg_provider, parsed_event, input_dir_path)
+        input_stream.start()
+        return input_stream
+
+    def upload_output(self, output_dir_path, parsed_event=None, output_files=None):
         """Receives the tmp_dir_path where the files to upload are stored and
-        uploads files whose name matches the prefixes and suffixes specified
-        in 'output'."""
-        get_logger().info('Searching for files to upload in folder \'%s\'', output_dir_path)
-        output_files = FileUtils.get_all_files_in_dir(output_dir_path)
-        stg_providers = {}
-        # Filter files by prefix and suffix
+        uploads files whose name matches the prefixes, suffixes and globs
+        specified in 'output'.
+
+        If 'output_files' is passed, only those files are considered."""
+        if output_files is None:
+            get_logger().info('Searching for files to upload in folder \'%s\'', output_dir_path)
+            output_files = FileUtils.get_all_files_in_dir(output_dir_path)
+        uploader = OutputUploader(self._get_upload_concurrency())
+        if self._output_router is None:
+            self._output_router = OutputRouter(self.output)
+        destinations = self._get_output_destinations(parsed_event)
+        # Uploads to outputs with 'skip_unchanged' are checked together before submitting them
+        uploads_to_check = []
+        for file_path in output_files:
+            # Make sure the file name does not contain new lines or starting slashes
+            file_name = file_path.replace(f'{output_dir_path}/', '').strip().lstrip('/')
+            # Only upload file to the outputs whose prefixes, suffixes and globs match its name
+            indexes = self._output_router.route(file_name)
+            # Remote object the file is a copy of (if any)
+            file_origin = self.file_origins.get(file_path) if indexes and self.file_origins else None
+            for index in indexes:
+                provider_type, provider_id, output_path, limiter = destinations[index]
+                auth_data = self._get_auth_data(provider_type, provider_id)
+                stg_provider = self._get_provider(auth_data)
+                origin = file_origin if file_origin and stg_provider.can_copy_from(file_origin) \
+                    else None
+                upload = (stg_provider, file_path, file_name, output_path, limiter, origin)
+                if self.output[index].get('skip_unchanged', False):
+                    uploads_to_check.append(upload)
+                else:
+                    uploader.submit(*upload)
+        for upload in uploader.discard_unchanged(uploads_to_check):
+            uploader.submit(*upload)
+        get_logger().debug('Storage providers reused: %d, created: %d',
+                           self.provider_hits, self.provider_misses)
+        uploader.wait()
+
+    def _get_output_destinations(self, parsed_event=None):
+        """Returns the provider type, provider id, path and upload
+        limiter of each output defined."""
+        isolation_level = ConfigUtils.read_cfg_var('isolation_level')
+        bucket_list = ConfigUtils.read_cfg_var('bucket_list')
+        destinations = []
         for output in self.output:
             get_logger().info('Checking files for uploading to \'%s\' on path: \'%s\'',
                               output['storage_provider'],
                               output['path'])
             provider_type = StrUtils.get_storage_type(output['storage_provider'])
             provider_id = StrUtils.get_storage_id(output['storage_provider'])
-            #Change the output to a private bucket
+            output_path = output['path']
+            # Change the output to a private bucket
             try:
-                if provider_type == 'MINIO' and ConfigUtils.read_cfg_var('isolation_level') == 'USER' and  \
-                parsed_event != None and  parsed_event.bucket_name in ConfigUtils.read_cfg_var('bucket_list'):
-                    folder_key =output['path'].split("/")
+                if provider_type == 'MINIO' and isolation_level == 'USER' and \
+                        parsed_event is not None and parsed_event.bucket_name in bucket_list:
+                    folder_key = output_path.split('/')
                     if len(folder_key) > 1:
-                        print(folder_key)
-                        delimiter = "/"
-                        print(parsed_event.bucket_name + "/" +   delimiter.join(folder_key[1:]))
-                        output['path'] = parsed_event.bucket_name + "/" + delimiter.join(folder_key[1:])
-            except:
+                        output_path = parsed_event.bucket_name + '/' + '/'.join(folder_key[1:])
+                        get_logger().debug('Output path changed to \'%s\'', output_path)
+            except (AttributeError, TypeError):
                 pass
-            for file_path in output_files:
-                # Make sure the file name does not contain new lines or starting slashes
-                file_name = file_path.replace(f'{output_dir_path}/', '').strip().lstrip('/')
-                prefix_ok = False
-                suffix_ok = False
-                # Check prefixes
-                if ('prefix' not in output
-                        or len(output['prefix']) == 0):
-                    prefix_ok = True
-                else:
-                    for pref in output['prefix']:
-                        if file_name.startswith(pref):
-                            prefix_ok = True
-                            break
-                if prefix_ok:
-                    # Check suffixes
-                    if ('suffix' not in output
-                            or len(output['suffix']) == 0):
-                        suffix_ok = True
-                    else:
-                        for suff in output['suffix']:
-                            if file_name.endswith(suff):
-                                suffix_ok = True
-                                break
-                    # Only upload file if name matches the prefixes and suffixes
-                    if suffix_ok:
-                        if provider_type not in stg_providers:
-                            stg_providers[provider_type] = {}
-                        if provider_id not in stg_providers[provider_type]:
-                            auth_data = self._get_auth_data(provider_type, provider_id)
-                            stg_providers[provider_type][provider_id] = create_provider(auth_data)
-                        stg_providers[provider_type][provider_id].upload_file(file_path,
-                                                                              file_name,
-                                                                              output['path'])
+            limiter = None
+            if 'concurrency' in output:
+                limiter = threading.BoundedSemaphore(_get_concurrency_value(output['concurrency']))
+            destinations.append((provider_type, provider_id, output_path, limiter))
+        return destinations
+
+    def _get_upload_concurrency(self):
+        """Returns the maximum number of concurrent uploads.
+
+        Defined globally with 'upload_concurrency' in the function config.
+        If not set, the highest 'concurrency' of the outputs is used."""
+        concurrency = ConfigUtils.read_cfg_var('upload_concurrency')
+        if concurrency != '':
+            return _get_concurrency_value(concurrency)
+        return max([_get_concurrency_value(output['concurrency'])
+                    for output in self.output if 'concurrency' in output], default=1)
@@ -0,0 +1,102 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the registry of local files that are copies of remote objects.
+
+It allows providers to copy outputs server-side instead of uploading them."""
+
+import os
+import re
+import threading
+from faassupervisor.storage.providers import get_file_md5
+
+_MD5_REGEX = re.compile('^[0-9a-f]{32}$')
+
+
+def _get_file_state(file_path):
+    """Returns the (device, inode, size, mtime) of a file or None if it doesn't exist."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _get_origin_md5(origin):
+    """Returns the ETag of the origin if it is the MD5 of the object."""
+    etag = (origin.get('etag') or '').strip('"').lower()
+    return etag if _MD5_REGEX.match(etag) else None
+
+
+class FileOrigins():
+    """Tracks the downloaded files and the remote object they come from.
+
+    A file is identified as a copy of a registered one if it is the same
+    unmodified inode (hardlinks or renames) or if it has the same content.
+    Registering a file doesn't read it: the digest of a registered file
+    (its MD5 ETag if available) is only computed, and then kept, when an
+    output of the same size is looked up."""
+
+    def __init__(self):
+        # (device, inode) -> (state, origin)
+        self._files = {}
+        # size -> [{'path', 'mtime', 'origin', 'md5'}]
+        self._candidates = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._files)
+
+    def register(self, file_path, origin):
+        """Registers a local file downloaded from 'origin', a dict with
+        the provider 'type', 'provider_id', 'bucket', 'key' and 'etag'."""
+        state = _get_file_state(file_path)
+        if state is None:
+            return
+        candidate = {'path': file_path,
+                     'mtime': state[3],
+                     'origin': origin,
+                     'md5': _get_origin_md5(origin)}
+        with self._lock:
+            self._files[state[:2]] = (state, origin)
+            self._candidates.setdefault(state[2], []).append(candidate)
+
+    @staticmethod
+    def _get_candidate_md5(candidate, file_size):
+        """Returns the digest of a registered file, hashing it the first time.
+        Returns None if the file was modified or removed before being hashed."""
+        if candidate['md5'] is None:
+            state = _get_file_state(candidate['path'])
+            if state is None or state[2:] != (file_size, candidate['mtime']):
+                return None
+            candidate['md5'] = get_file_md5(candidate['path'])
+        return candidate['md5']
+
+    def get(self, file_path):
+        """Returns the origin of a file or None if it is not a copy of a registered file."""
+        state = _get_file_state(file_path)
+        if state is None:
+            return None
+        with self._lock:
+            same_inode = self._files.get(state[:2])
+            candidates = list(self._candidates.get(state[2], []))
+        if same_inode:
+            # Hardlinked or renamed, the content is the same if not modified
+            return same_inode[1] if same_inode[0] == state else None
+        if not candidates:
+            return None
+        file_md5 = get_file_md5(file_path)
+        for candidate in candidates:
+            if self._get_candidate_md5(candidate, state[2]) == file_md5:
+                return candidate['origin']
+        return None
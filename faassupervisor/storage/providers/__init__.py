@@ -15,6 +15,10 @@
 used to define storage providers."""
 
 import abc
+import hashlib
+from faassupervisor.exceptions import StorageOperationNotSupportedError
+
+_HASH_BLOCK_SIZE = 1024 * 1024
 
 
 def get_bucket_name(output_path):
@@ -34,11 +38,48 @@ def get_file_key(output_path, file_name):
     return file_name
 
 
+def get_file_md5(file_path, part_size=None):
+    """Returns the hex MD5 of a file.
+
+    If 'part_size' is set, returns the ETag of an S3 multipart upload
+    with parts of that size: '<MD5 of the parts MD5s>-<number of parts>'."""
+    file_md5 = hashlib.md5()  # nosec
+    parts_md5 = []
+    part_md5 = hashlib.md5()  # nosec
+    part_read = 0
+    with open(file_path, 'rb') as data:
+        while True:
+            block = data.read(min(_HASH_BLOCK_SIZE, part_size - part_read)
+                              if part_size else _HASH_BLOCK_SIZE)
+            if not block:
+                break
+            if not part_size:
+                file_md5.update(block)
+                continue
+            part_md5.update(block)
+            part_read += len(block)
+            if part_read == part_size:
+                parts_md5.append(part_md5.digest())
+                part_md5 = hashlib.md5()  # nosec
+                part_read = 0
+    if not part_size:
+        return file_md5.hexdigest()
+    if part_read:
+        parts_md5.append(part_md5.digest())
+    return f'{hashlib.md5(b"".join(parts_md5)).hexdigest()}-{len(parts_md5)}'  # nosec
+
+
 class DefaultStorageProvider(metaclass=abc.ABCMeta):
     """All the different data providers must inherit from this class
     to ensure that the commands are defined consistently."""
 
     _TYPE = 'DEFAULT'
+    # Set to True if 'upload_file' can be called concurrently
+    _THREAD_SAFE = False
+    # Set to True if 'download_stream' is implemented
+    _STREAMING = False
+    # Set to True if 'list_objects' and 'download_object' are implemented
+    _STAGING = False
 
     def __init__(self, stg_auth):
         self.stg_auth = stg_auth
@@ -51,7 +92,53 @@ class DefaultStorageProvider(metaclass=abc.ABCMeta):
     def upload_file(self, file_path, file_name, output_path):
         """Generic method to be implemented by all the storage providers."""
 
+    def is_unchanged(self, file_path, file_name, output_path):  # pylint: disable=unused-argument
+        """Returns True if the destination already has a file identical
+        to 'file_path'. Providers that can't check it always return False."""
+        return False
+
+    def can_copy_from(self, origin):  # pylint: disable=unused-argument
+        """Returns True if the provider can copy server-side the remote
+        object described by 'origin' (see 'FileOrigins')."""
+        return False
+
+    def copy_file(self, origin, file_name, output_path):
+        """Copies the remote object 'origin' to the output path without
+        uploading it. Only available if 'can_copy_from' returns True."""
+        raise StorageOperationNotSupportedError(storage_type=self._TYPE,
+                                                operation='server-side copies')
+
+    def download_stream(self, parsed_event, data):
+        """Writes the content of the event file into the file-like object 'data'
+        as it is downloaded. Only available if the provider supports streaming."""
+        raise StorageOperationNotSupportedError(storage_type=self._TYPE,
+                                                operation='streaming downloads')
+
+    def list_objects(self, path):
+        """Returns the objects of a path as dicts with their 'bucket', 'key',
+        'size' and 'etag'. Only available if the provider supports staging."""
+        raise StorageOperationNotSupportedError(storage_type=self._TYPE,
+                                                operation='staging objects')
+
+    def download_object(self, stg_object, file_path):
+        """Downloads an object returned by 'list_objects' to 'file_path'.
+        Only available if the provider supports staging."""
+        raise StorageOperationNotSupportedError(storage_type=self._TYPE,
+                                                operation='staging objects')
+
     def get_type(self):
         """Returns the storage type.
         Can be LOCAL, MINIO, ONEDATA, S3, WEBDAV, RUCIO."""
         return self._TYPE
+
+    def is_thread_safe(self):
+        """Returns True if the provider supports concurrent uploads."""
+        return self._THREAD_SAFE
+
+    def supports_streaming(self):
+        """Returns True if the provider can stream downloads."""
+        return self._STREAMING
+
+    def supports_staging(self):
+        """Returns True if the provider can list and download any object."""
+        return self._STAGING
@@ -21,6 +21,7 @@ class Local(DefaultStorageProvider):
     """Class to manage saving files in local storage."""
 
     _TYPE = 'LOCAL'
+    _THREAD_SAFE = True
 
     def download_file(self, parsed_event, input_dir_path):
         """Delegates the 'download' and local storage to the event."""
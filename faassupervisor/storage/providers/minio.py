@@ -40,4 +40,5 @@ class Minio(S3):
                             region_name=region,
                             verify=verify,
                             aws_access_key_id=self.stg_auth.get_credential('access_key'),
-                            aws_secret_access_key=self.stg_auth.get_credential('secret_key'))
+                            aws_secret_access_key=self.stg_auth.get_credential('secret_key'),
+                            config=self._get_client_config())
@@ -14,34 +14,107 @@
 """ Module containing all the classes and methods
 related with the Onedata storage provider. """
 
+import os
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from faassupervisor.logger import get_logger
 from faassupervisor.storage.providers import DefaultStorageProvider
 from faassupervisor.utils import SysUtils, FileUtils
 from faassupervisor.exceptions import OnedataDownloadError, \
-    OnedataUploadError, OnedataFolderCreationError
+    OnedataUploadError, OnedataFolderCreationError, OnedataDownloadSizeError
+
+
+def _get_peak_rss():
+    """Returns the peak resident set size of the process in MiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _get_total_size(response):
+    """Returns the object size of a ranged GET response or None if unknown."""
+    try:
+        return int(response.headers['Content-Range'].rpartition('/')[2])
+    except (KeyError, TypeError, ValueError):
+        return None
 
 
 class Onedata(DefaultStorageProvider):
     """Class that manages downloads and uploads from Onedata. """
 
     _TYPE = 'ONEDATA'
+    _STREAMING = True
+    _STREAM_CHUNK_SIZE = 1024 * 1024
     _CDMI_PATH = '/cdmi'
+    _CDMI_OBJECT_ID_PATH = '/cdmi/cdmi_objectid'
     _CDMI_VERSION_HEADER = {'X-CDMI-Specification-Version': '1.1.1'}
+    # Default connection pool size and retries of the HTTP session
+    _POOL_SIZE = 10
+    _MAX_RETRIES = 3
+    _RETRY_BACKOFF = 0.5
+    _RETRY_STATUS = (502, 503, 504)
+    # Default ranged download threshold and sizes (bytes)
+    _RANGED_DOWNLOAD_THRESHOLD = 64 * 1024 * 1024
+    _RANGE_SIZE = 16 * 1024 * 1024
+    _RANGE_CONCURRENCY = 8
 
     def __init__(self, stg_auth):
         super().__init__(stg_auth)
         self._set_onedata_environment()
+        self.session = self._get_session()
+        # Folders of the space known to exist
+        self._known_folders = set()
 
     def _set_onedata_environment(self):
         self.oneprovider_space = self.stg_auth.get_credential('space')
         self.oneprovider_host = self.stg_auth.get_credential('oneprovider_host')
         self.headers = {'X-Auth-Token': self.stg_auth.get_credential('token')}
+        self.chunk_size = max(self._get_setting('chunk_size', self._STREAM_CHUNK_SIZE), 1)
+        self.range_size = max(self._get_setting('range_size', self._RANGE_SIZE), 1)
+        self.range_concurrency = max(self._get_setting('range_concurrency',
+                                                       self._RANGE_CONCURRENCY), 1)
+        # Resolve the input files by id instead of by path
+        self.download_by_id = str(self.stg_auth.get_credential('download_by_id')).lower() \
+            in ('true', 'yes', '1')
+
+    def _get_setting(self, key, default):
+        """Returns an integer setting of the provider credentials or its default value."""
+        value = self.stg_auth.get_credential(key)
+        if value in ('', None):
+            return default
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            get_logger().warning('Invalid value \'%s\' for \'%s\'. Using %s.', value, key, default)
+            return default
+
+    def _get_session(self):
+        """Returns an HTTP session that keeps the connections to the Oneprovider alive.
+
+        The pool size and retries can be set with 'pool_size' and 'max_retries'
+        in the provider credentials. Failed responses are only retried for
+        GET and HEAD requests, as uploads can't be replayed."""
+        # Keep a connection for each concurrent range
+        pool_size = max(self._get_setting('pool_size', self._POOL_SIZE),
+                        self.range_concurrency, 1)
+        max_retries = max(self._get_setting('max_retries', self._MAX_RETRIES), 0)
+        retries = Retry(total=max_retries,
+                        backoff_factor=self._RETRY_BACKOFF,
+                        status_forcelist=self._RETRY_STATUS,
+                        allowed_methods=frozenset(['GET', 'HEAD']),
+                        raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retries)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        return session
 
     def _create_folder(self, folder_name):
         url = (f'https://{self.oneprovider_host}{self._CDMI_PATH}/'
                f'{self.oneprovider_space}/{folder_name}/')
-        response = requests.put(url, headers=self.headers)
+        response = self.session.put(url, headers=self.headers)
         if response.status_code != 201:
             raise OnedataFolderCreationError(folder_name=folder_name,
                                              status_code=response.status_code)
@@ -50,33 +123,162 @@ class Onedata(DefaultStorageProvider):
         url = (f'https://{self.oneprovider_host}{self._CDMI_PATH}/'
                f'{self.oneprovider_space}/{folder_name}/')
         headers = {**self._CDMI_VERSION_HEADER, **self.headers}
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return True
         return False
 
+    def _add_known_folder(self, folder_name):
+        """Marks the folder and all its parents as existing."""
+        while folder_name and folder_name not in self._known_folders:
+            self._known_folders.add(folder_name)
+            folder_name = FileUtils.get_dir_name(folder_name)
+
+    def _ensure_folder(self, folder_name):
+        """Creates the folder and its missing parents.
+        Each folder is only checked once per provider."""
+        if not folder_name or folder_name in self._known_folders:
+            return
+        if not self._folder_exists(folder_name):
+            path = ''
+            for folder in folder_name.split('/'):
+                path = f'{path}/{folder}' if path else folder
+                if path in self._known_folders:
+                    continue
+                # The last folder was already checked
+                if path == folder_name or not self._folder_exists(path):
+                    self._create_folder(path)
+                self._known_folders.add(path)
+        self._add_known_folder(folder_name)
+
+    def _get_object_url(self, parsed_event):
+        """Returns the CDMI URL of the file, by id if enabled and sent in the event."""
+        object_id = getattr(parsed_event, 'object_id', None)
+        if self.download_by_id and object_id:
+            return f'https://{self.oneprovider_host}{self._CDMI_OBJECT_ID_PATH}/{object_id}'
+        return f'https://{self.oneprovider_host}{self._CDMI_PATH}{parsed_event.object_key}'
+
+    def _write_response(self, response, data):
+        """Writes the response content into 'data' by chunks, so
+        the memory used doesn't depend on the object size.
+        Returns the number of bytes written."""
+        size = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            data.write(chunk)
+            size += len(chunk)
+        return size
+
+    def _write_content(self, parsed_event, data):
+        """Writes the object content into 'data' with a single GET.
+        Returns the number of bytes written."""
+        url = self._get_object_url(parsed_event)
+        with self.session.get(url, headers=self.headers, stream=True) as response:
+            if response.status_code != 200:
+                raise OnedataDownloadError(file_name=parsed_event.object_key,
+                                           status_code=response.status_code)
+            return self._write_response(response, data)
+
+    def _download_range(self, fd, parsed_event, start, end):
+        """Writes a range of the object at its offset of the file.
+        Returns the bytes written or None if the server ignored the range."""
+        headers = {**self.headers, 'Range': f'bytes={start}-{end}'}
+        offset = start
+        with self.session.get(self._get_object_url(parsed_event),
+                              headers=headers, stream=True) as response:
+            if response.status_code == 200:
+                return None
+            if response.status_code != 206:
+                raise OnedataDownloadError(file_name=parsed_event.object_key,
+                                           status_code=response.status_code)
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+        return offset - start
+
+    def _download_to(self, parsed_event, data):
+        """Downloads the object into the file 'data'. Returns the bytes written.
+
+        The first range of the object is requested first to get its size,
+        so small files only need one request. The rest of files above
+        'ranged_download_threshold' are downloaded with concurrent ranged GETs
+        written at their offset of the preallocated file. Servers that
+        ignore ranges send the whole file in a single response."""
+        headers = {**self.headers, 'Range': f'bytes=0-{self.range_size - 1}'}
+        with self.session.get(self._get_object_url(parsed_event),
+                              headers=headers, stream=True) as response:
+            if response.status_code == 200:
+                return self._write_response(response, data)
+            # Empty files have no ranges (416)
+            if response.status_code not in (206, 416):
+                raise OnedataDownloadError(file_name=parsed_event.object_key,
+                                           status_code=response.status_code)
+            total = _get_total_size(response) if response.status_code == 206 else None
+            size = self._write_response(response, data) if total else 0
+        if not total:
+            # Empty file or unknown size, download it with a single GET
+            return self._write_content(parsed_event, data)
+        if size >= total:
+            return size
+        threshold = self._get_setting('ranged_download_threshold', self._RANGED_DOWNLOAD_THRESHOLD)
+        if total >= threshold:
+            ranges = [(start, min(start + self.range_size, total) - 1)
+                      for start in range(size, total, self.range_size)]
+        else:
+            ranges = [(size, total - 1)]
+        get_logger().info('Downloading %d bytes of \'%s\' in %d ranges',
+                          total - size, parsed_event.object_key, len(ranges))
+        data.flush()
+        fd = data.fileno()
+        os.ftruncate(fd, total)
+        with ThreadPoolExecutor(max_workers=min(self.range_concurrency, len(ranges))) as executor:
+            downloaded = list(executor.map(lambda r: self._download_range(fd, parsed_event, *r),
+                                           ranges))
+        if None in downloaded:
+            get_logger().warning('Ranges not supported for \'%s\', downloading it again',
+                                 parsed_event.object_key)
+            data.seek(0)
+            data.truncate()
+            return self._write_content(parsed_event, data)
+        size += sum(downloaded)
+        if size != total:
+            raise OnedataDownloadSizeError(file_name=parsed_event.object_key,
+                                           expected=total,
+                                           downloaded=size)
+        return size
+
     def download_file(self, parsed_event, input_dir_path):
         """Downloads the file from the space of Onedata and
-        returns the path were the download is placed. """
-        file_download_path = ""
-        url = f'https://{self.oneprovider_host}{self._CDMI_PATH}{parsed_event.object_key}'
+        returns the path were the download is placed."""
         get_logger().info('Downloading item from host \'%s\' with key \'%s\'',
                           self.oneprovider_host,
                           parsed_event.object_key)
-        response = requests.get(url, headers=self.headers)
-        if response.status_code == 200:
-            file_download_path = SysUtils.join_paths(input_dir_path, parsed_event.file_name)
-            FileUtils.create_file_with_content(file_download_path, response.content, mode='wb')
-
-            get_logger().info('Successful download of file \'%s\' with key \'%s\' in path \'%s\'',
-                              parsed_event.file_name,
-                              parsed_event.object_key,
-                              file_download_path)
-        else:
-            raise OnedataDownloadError(file_name=parsed_event.object_key,
-                                       status_code=response.status_code)
+        file_download_path = SysUtils.join_paths(input_dir_path, parsed_event.file_name)
+        start = time.monotonic()
+        try:
+            with open(file_download_path, 'wb') as data:
+                size = self._download_to(parsed_event, data)
+        except BaseException:
+            # Don't leave partial files in the input folder
+            if os.path.isfile(file_download_path):
+                os.remove(file_download_path)
+            raise
+        get_logger().info('Successful download of file \'%s\' with key \'%s\' in path \'%s\' '
+                          '(%d bytes in %.2f s, peak RSS %.1f MiB)',
+                          parsed_event.file_name,
+                          parsed_event.object_key,
+                          file_download_path,
+                          size,
+                          time.monotonic() - start,
+                          _get_peak_rss())
         return file_download_path
 
+    def download_stream(self, parsed_event, data):
+        """Writes the file content into 'data' as it is downloaded."""
+        get_logger().info('Streaming item from host \'%s\' with key \'%s\'',
+                          self.oneprovider_host,
+                          parsed_event.object_key)
+        self._write_content(parsed_event, data)
+
     def upload_file(self, file_path, file_name, output_path):
         """Uploads the file to the Onedata output path."""
         file_name = file_name.strip('/')
@@ -84,13 +286,7 @@ class Onedata(DefaultStorageProvider):
         upload_path = f'{output_path}/{file_name}'
         upload_folder = FileUtils.get_dir_name(upload_path)
         # Create output folder (and subfolders) if it does not exists
-        if not self._folder_exists(upload_folder):
-            folders = upload_folder.split('/')
-            path = ''
-            for folder in folders:
-                path = f'{path}/{folder}'
-                if not self._folder_exists(path):
-                    self._create_folder(path)
+        self._ensure_folder(upload_folder)
         # Upload the file
         url = (f'https://{self.oneprovider_host}{self._CDMI_PATH}/'
                f'{self.oneprovider_space}/{upload_path}')
@@ -98,7 +294,9 @@ class Onedata(DefaultStorageProvider):
                           upload_path,
                           self.oneprovider_space)
         with open(file_path, 'rb') as data:
-            response = requests.put(url, data=data, headers=self.headers)
+            response = self.session.put(url, data=data, headers=self.headers)
             if response.status_code not in [201, 202, 204]:
+                # The folder may have been removed since it was checked
+                self._known_folders.discard(upload_folder)
                 raise OnedataUploadError(file_name=file_name,
                                          status_code=response.status_code)
@@ -16,6 +16,7 @@ related with the Rucio storage provider. """
 
 import os
 import tempfile
+import threading
 
 # Import classes to force pyinstaller to add them to the package
 try:
@@ -36,6 +37,9 @@ from faassupervisor.logger import get_logger
 from faassupervisor.storage.providers import DefaultStorageProvider
 from faassupervisor.utils import SysUtils, OIDCUtils, FileUtils
 
+# The Rucio client config is global to the process
+_CONFIG_LOCK = threading.Lock()
+
 
 class Rucio(DefaultStorageProvider):
     """ Class that manages downloads and uploads from Rucio. """
@@ -64,6 +68,9 @@ class Rucio(DefaultStorageProvider):
             self.scopes = self._OIDC_SCOPE.split()
         self.token_temp_file = tempfile.mktemp(prefix='rucio_token_',
                                                suffix='.token')  # nosec
+        # Rucio clients reused while the access token does not change
+        self._clients = {}
+        self._clients_token = None
         self._create_rucio_config()
 
     def __del__(self):
@@ -100,17 +107,32 @@ class Rucio(DefaultStorageProvider):
         config_set(section="client", option="account", value=self.scope)
         config_set(section="client", option="auth_type", value="oidc")
 
+    def _new_client(self, client_class):
+        """Creates a Rucio client with the config of this provider.
+
+        The config is applied again right before creating the client,
+        as other Rucio providers may have changed it."""
+        with _CONFIG_LOCK:
+            self._create_rucio_config()
+            return client_class(rucio_host=self.rucio_host,
+                                auth_host=self.auth_host,
+                                account=self.scope,
+                                auth_type='oidc')
+
     def _get_rucio_client(self, client_type=None):
-        # Create token file
-        with open(self.token_temp_file, 'w') as f:
-            f.write(self._get_access_token())
-        client = Client()
-        if not client_type:
-            return client
-        elif client_type == "upload":
-            return UploadClient(client)
-        elif client_type == "download":
-            return DownloadClient(client)
+        access_token = self._get_access_token()
+        if access_token != self._clients_token:
+            # Create token file
+            with open(self.token_temp_file, 'w') as f:
+                f.write(access_token)
+            self._clients = {None: self._new_client(Client)}
+            self._clients_token = access_token
+        if client_type not in self._clients:
+            if client_type == "upload":
+                self._clients[client_type] = UploadClient(self._clients[None])
+            elif client_type == "download":
+                self._clients[client_type] = DownloadClient(self._clients[None])
+        return self._clients.get(client_type)
 
     def download_file(self, parsed_event, input_dir_path):
         """Downloads the dataset from Rucio and
@@ -157,7 +179,7 @@ class Rucio(DefaultStorageProvider):
         else:
             # if not set, get the first RSE available
             try:
-                rses = RSEClient().list_rses()
+                rses = self._new_client(RSEClient).list_rses()
                 file['rse'] = list(rses)[0]['rse']
             except Exception as exc:
                 raise RucioNotRSE(msg=str(exc))
@@ -14,12 +14,18 @@
 """ Module containing all the classes and methods
 related with the S3 storage provider. """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 import urllib3
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from faassupervisor.logger import get_logger
 from faassupervisor.storage.providers import DefaultStorageProvider, \
-    get_bucket_name, get_file_key
-from faassupervisor.utils import SysUtils
+    get_bucket_name, get_file_key, get_file_md5
+from faassupervisor.utils import SysUtils, FileUtils
+from faassupervisor.exceptions import S3DownloadSizeError
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -27,39 +33,214 @@ class S3(DefaultStorageProvider):
     """Class that manages downloads and uploads from S3."""
 
     _TYPE = 'S3'
+    # boto3 clients are thread-safe
+    _THREAD_SAFE = True
+    _STREAMING = True
+    _STAGING = True
+
+    # Default download strategy thresholds and sizes (bytes)
+    _SINGLE_GET_THRESHOLD = 8 * 1024 * 1024
+    _RANGED_DOWNLOAD_THRESHOLD = 64 * 1024 * 1024
+    _RANGE_SIZE = 16 * 1024 * 1024
+    _RANGE_CONCURRENCY = 10
+    _RANGE_READ_SIZE = 1024 * 1024
+    # Transfer settings that can be defined in the provider credentials
+    _TRANSFER_SETTINGS = ['multipart_threshold', 'multipart_chunksize', 'max_concurrency']
+    _CLIENT_SETTINGS = ['max_pool_connections', 'max_attempts', 'connect_timeout', 'read_timeout']
 
     def __init__(self, stg_auth):
         super().__init__(stg_auth)
         self.client = self._get_client()
+        self.transfer_args = self._get_transfer_args()
+
+    def _get_setting(self, key, value_type=int):
+        """Returns a tuning value of the provider credentials or None if not set."""
+        if self.stg_auth.creds is None:
+            return None
+        value = self.stg_auth.get_credential(key)
+        if value in ('', None):
+            return None
+        try:
+            return value_type(value)
+        except (TypeError, ValueError):
+            get_logger().warning('Invalid value \'%s\' for \'%s\'. Ignoring it.', value, key)
+            return None
+
+    def _get_client_config(self):
+        """Returns the botocore config with the connection settings
+        or None if they are not defined."""
+        settings = {key: self._get_setting(key, float if key.endswith('timeout') else int)
+                    for key in self._CLIENT_SETTINGS}
+        max_concurrency = self._get_setting('max_concurrency')
+        if settings['max_pool_connections'] is None and max_concurrency:
+            # Allow one connection per transfer thread
+            settings['max_pool_connections'] = max(max_concurrency, 10)
+        retries = {}
+        retry_mode = self._get_setting('retry_mode', str)
+        if retry_mode:
+            retries['mode'] = retry_mode
+        max_attempts = settings.pop('max_attempts')
+        if max_attempts is not None:
+            retries['max_attempts'] = max_attempts
+        if retries:
+            settings['retries'] = retries
+        settings = {key: value for key, value in settings.items() if value is not None}
+        return Config(**settings) if settings else None
+
+    def _get_transfer_args(self):
+        """Returns the extra arguments of the transfer calls."""
+        settings = {key: self._get_setting(key) for key in self._TRANSFER_SETTINGS}
+        settings = {key: value for key, value in settings.items() if value is not None}
+        return {'Config': TransferConfig(**settings)} if settings else {}
 
     def _get_client(self):
-        """Returns S3 client with default configuration."""
+        """Returns S3 client with default configuration.
+
+        The credentials are read from the environment (or the role)
+        if the provider only defines tuning settings."""
         if self.stg_auth.creds is None:
-            return boto3.client('s3')
+            return boto3.client('s3', config=self._get_client_config())
         region = self.stg_auth.get_credential('region')
         if region == '':
             region = None
+        access_key = self.stg_auth.get_credential('access_key')
+        if access_key in ('', None):
+            return boto3.client('s3', region_name=region, config=self._get_client_config())
         return boto3.client('s3',
                             region_name=region,
-                            aws_access_key_id=self.stg_auth.get_credential('access_key'),
-                            aws_secret_access_key=self.stg_auth.get_credential('secret_key'))
+                            aws_access_key_id=access_key,
+                            aws_secret_access_key=self.stg_auth.get_credential('secret_key'),
+                            config=self._get_client_config())
+
+    def _get_download_strategy(self, object_size):
+        """Returns the download strategy based on the object size:
+        'single' (one GET into memory), 'ranged' (parallel ranged GETs)
+        or 'transfer' (boto3 managed transfer)."""
+        if object_size is None:
+            return 'transfer'
+        single_threshold = self._get_setting('single_get_threshold')
+        if single_threshold is None:
+            single_threshold = self._SINGLE_GET_THRESHOLD
+        ranged_threshold = self._get_setting('ranged_download_threshold')
+        if ranged_threshold is None:
+            ranged_threshold = self._RANGED_DOWNLOAD_THRESHOLD
+        if object_size <= single_threshold:
+            return 'single'
+        if object_size >= ranged_threshold:
+            return 'ranged'
+        return 'transfer'
+
+    def _download_single(self, bucket_name, object_key, file_download_path):
+        response = self.client.get_object(Bucket=bucket_name, Key=object_key)
+        FileUtils.create_file_with_content(file_download_path, response['Body'].read(), mode='wb')
+
+    def _download_range(self, fd, bucket_name, object_key, etag, start, end):
+        kwargs = {'Bucket': bucket_name, 'Key': object_key, 'Range': f'bytes={start}-{end}'}
+        if etag:
+            # Fail if the object changes during the download
+            kwargs['IfMatch'] = etag
+        body = self.client.get_object(**kwargs)['Body']
+        offset = start
+        for chunk in iter(lambda: body.read(self._RANGE_READ_SIZE), b''):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+        return offset - start
+
+    def _download_ranged(self, bucket_name, object_key, file_download_path, object_size, etag):
+        part_size = self._get_setting('multipart_chunksize') or self._RANGE_SIZE
+        concurrency = self._get_setting('max_concurrency') or self._RANGE_CONCURRENCY
+        if etag and not etag.startswith('"'):
+            etag = f'"{etag}"'
+        fd = os.open(file_download_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # Preallocate the file so each range is written at its offset
+            os.ftruncate(fd, object_size)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(self._download_range, fd, bucket_name, object_key, etag,
+                                           start, min(start + part_size, object_size) - 1)
+                           for start in range(0, object_size, part_size)]
+                downloaded = sum(future.result() for future in futures)
+        finally:
+            os.close(fd)
+        if downloaded != object_size or os.path.getsize(file_download_path) != object_size:
+            raise S3DownloadSizeError(file_name=object_key,
+                                      expected=object_size,
+                                      downloaded=downloaded)
 
     def download_file(self, parsed_event, input_dir_path):
         """Downloads the file from the S3 bucket and
-        returns the path were the download is placed."""
+        returns the path were the download is placed.
+
+        The download strategy depends on the object size sent in the event."""
         file_download_path = SysUtils.join_paths(input_dir_path, parsed_event.file_name)
-        get_logger().info('Downloading item from bucket \'%s\' with key \'%s\'',
-                          parsed_event.bucket_name,
-                          parsed_event.object_key)
-        with open(file_download_path, 'wb') as data:
-            self.client.download_fileobj(parsed_event.bucket_name,
-                                         parsed_event.object_key,
-                                         data)
+        self.download_object({'bucket': parsed_event.bucket_name,
+                              'key': parsed_event.object_key,
+                              'size': getattr(parsed_event, 'object_size', None),
+                              'etag': getattr(parsed_event, 'object_etag', None)},
+                             file_download_path)
+        return file_download_path
+
+    def download_object(self, stg_object, file_path):
+        """Downloads an object described by its 'bucket', 'key' and
+        the optional 'size' and 'etag' to 'file_path'."""
+        bucket_name = stg_object['bucket']
+        object_key = stg_object['key']
+        object_size = stg_object.get('size')
+        strategy = self._get_download_strategy(object_size)
+        get_logger().info('Downloading item from bucket \'%s\' with key \'%s\' (strategy: %s)',
+                          bucket_name,
+                          object_key,
+                          strategy)
+        if strategy == 'single':
+            self._download_single(bucket_name, object_key, file_path)
+        elif strategy == 'ranged':
+            self._download_ranged(bucket_name,
+                                  object_key,
+                                  file_path,
+                                  object_size,
+                                  stg_object.get('etag'))
+        else:
+            with open(file_path, 'wb') as data:
+                self.client.download_fileobj(bucket_name,
+                                             object_key,
+                                             data,
+                                             **self.transfer_args)
         get_logger().info('Successful download of file \'%s\' from bucket \'%s\' in path \'%s\'',
-                          parsed_event.object_key,
+                          object_key,
+                          bucket_name,
+                          file_path)
+
+    def list_objects(self, path):
+        """Returns the objects of a path. Paths ending with '/' (or only
+        with the bucket name) are prefixes, the rest are object keys."""
+        bucket_name, _, object_key = path.strip('/').partition('/')
+        if not object_key or path.endswith('/'):
+            prefix = f'{object_key}/' if object_key else ''
+            objects = []
+            paginator = self.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                objects.extend({'bucket': bucket_name,
+                                'key': obj['Key'],
+                                'size': obj['Size'],
+                                'etag': obj.get('ETag', '').strip('"')}
+                               for obj in page.get('Contents', [])
+                               if not obj['Key'].endswith('/'))
+            return objects
+        head = self.client.head_object(Bucket=bucket_name, Key=object_key)
+        return [{'bucket': bucket_name,
+                 'key': object_key,
+                 'size': head.get('ContentLength'),
+                 'etag': head.get('ETag', '').strip('"')}]
+
+    def download_stream(self, parsed_event, data):
+        """Writes the object content into 'data' as it is downloaded."""
+        get_logger().info('Streaming item from bucket \'%s\' with key \'%s\'',
                           parsed_event.bucket_name,
-                          file_download_path)
-        return file_download_path
+                          parsed_event.object_key)
+        body = self.client.get_object(Bucket=parsed_event.bucket_name,
+                                      Key=parsed_event.object_key)['Body']
+        for chunk in iter(lambda: body.read(self._RANGE_READ_SIZE), b''):
+            data.write(chunk)
 
     def upload_file(self, file_path, file_name, output_path):
         """Uploads the file to the S3 output path."""
@@ -67,4 +248,46 @@ class S3(DefaultStorageProvider):
         bucket_name = get_bucket_name(output_path)
         get_logger().info('Uploading file \'%s\' to bucket \'%s\'', file_key, bucket_name)
         with open(file_path, 'rb') as data:
-            self.client.upload_fileobj(data, bucket_name, file_key)
+            self.client.upload_fileobj(data, bucket_name, file_key, **self.transfer_args)
+
+    def is_unchanged(self, file_path, file_name, output_path):
+        """Compares the local file with the ETag of the destination object.
+
+        The ETag of multipart uploads is computed with the size
+        of the first part of the remote object. The local file is only
+        read (once, to hash it) when the sizes match."""
+        file_key = get_file_key(output_path, file_name)
+        bucket_name = get_bucket_name(output_path)
+        try:
+            head = self.client.head_object(Bucket=bucket_name, Key=file_key)
+        except ClientError:
+            return False
+        if head.get('ContentLength') != os.path.getsize(file_path):
+            return False
+        etag = head.get('ETag', '').strip('"')
+        part_size = None
+        if '-' in etag:
+            part_size = self.client.head_object(Bucket=bucket_name, Key=file_key,
+                                                PartNumber=1).get('ContentLength')
+        return get_file_md5(file_path, part_size) == etag
+
+    def can_copy_from(self, origin):
+        """Objects can be copied inside the same provider (endpoint and credentials)."""
+        return origin.get('type') == self.get_type() and \
+            origin.get('provider_id') == self.stg_auth.provider_id
+
+    def copy_file(self, origin, file_name, output_path):
+        """Copies the object server-side to the output path.
+
+        Big objects are copied with multipart 'upload_part_copy' requests.
+        The copy fails if the source object has changed (ETag)."""
+        file_key = get_file_key(output_path, file_name)
+        bucket_name = get_bucket_name(output_path)
+        get_logger().info('Copying \'%s/%s\' to \'%s\' in bucket \'%s\'',
+                          origin['bucket'], origin['key'], file_key, bucket_name)
+        extra_args = {'CopySourceIfMatch': origin['etag']} if origin.get('etag') else None
+        self.client.copy({'Bucket': origin['bucket'], 'Key': origin['key']},
+                         bucket_name,
+                         file_key,
+                         ExtraArgs=extra_args,
+                         **self.transfer_args)
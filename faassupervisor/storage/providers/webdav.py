@@ -14,18 +14,82 @@
 """ Module containing all the classes and methods
 related with the WebDav storage provider. """
 
-from faassupervisor.storage.providers import DefaultStorageProvider
+import base64
+import os
+import queue
+import re
+import time
+from contextlib import contextmanager
+from requests.exceptions import RequestException
+from faassupervisor.logger import get_logger
+from faassupervisor.storage.providers import DefaultStorageProvider, get_file_md5
 from webdav3.client import Client
+from webdav3.exceptions import MethodNotSupported, ResponseErrorCode, WebDavException
+from webdav3.urn import Urn
 from faassupervisor.utils import SysUtils
+from faassupervisor.exceptions import WebDavDownloadError
+
+_MD5_ETAG_REGEX = re.compile('^[0-9a-f]{32}$')
+
+
+def _get_digest_md5(digest_header):
+    """Returns the hex MD5 of a 'Digest' header (RFC 3230) or None."""
+    for digest in digest_header.split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        if algorithm.lower() == 'md5' and value:
+            try:
+                return base64.b64decode(value).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def _get_upload_path(file_name, output_path):
+    """Returns the remote path of an output file."""
+    return f'{output_path.strip("/")}/{file_name.strip("/")}'
+
+
+def _get_total_size(response):
+    """Returns the total size of the file from a (ranged) GET response or None if unknown."""
+    try:
+        if response.status_code == 206:
+            return int(response.headers['Content-Range'].rpartition('/')[2])
+        return int(response.headers['Content-Length'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
 
 class WebDav(DefaultStorageProvider):
     """Class that manages downloads and uploads from providers that use WebDav."""
 
     _TYPE = "WEBDAV"
+    # webdav3 clients are not thread-safe, each thread uses its own client of the pool
+    _THREAD_SAFE = True
+    # Default download chunk size (bytes) and retries without progress
+    _CHUNK_SIZE = 1024 * 1024
+    _MAX_RETRIES = 3
+    _RETRY_BACKOFF = 1
 
     def __init__(self, stg_auth):
         super().__init__(stg_auth)
+        self.chunk_size = max(self._get_setting('chunk_size', self._CHUNK_SIZE), 1)
+        self.max_retries = max(self._get_setting('max_retries', self._MAX_RETRIES), 0)
         self.client = self._get_client()
+        self._clients = queue.SimpleQueue()
+        self._clients.put(self.client)
+        # Folders known to exist
+        self._known_folders = set()
+
+    def _get_setting(self, key, default):
+        """Returns an integer setting of the provider credentials or its default value."""
+        value = self.stg_auth.get_credential(key)
+        if value in ('', None):
+            return default
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            get_logger().warning('Invalid value \'%s\' for \'%s\'. Using %s.', value, key, default)
+            return default
 
     def _get_client(self):
         """Returns a WebDav client to connect to the https endpoint of the storage provider"""
@@ -36,14 +100,141 @@ class WebDav(DefaultStorageProvider):
         }
         return Client(options=options)
 
+    @contextmanager
+    def _pooled_client(self):
+        """Yields an idle client of the pool, creating a new one if all are in use."""
+        try:
+            client = self._clients.get_nowait()
+        except queue.Empty:
+            client = self._get_client()
+        try:
+            yield client
+        finally:
+            self._clients.put(client)
+
+    def _add_known_folder(self, folder_name):
+        """Marks the folder and all its parents as existing."""
+        while folder_name and folder_name not in self._known_folders:
+            self._known_folders.add(folder_name)
+            folder_name = os.path.dirname(folder_name)
+
+    def _ensure_folder(self, client, folder_name):
+        """Creates the folder and its missing parents.
+        Each folder is only checked once per provider."""
+        if not folder_name or folder_name in self._known_folders:
+            return
+        if not client.check(folder_name):
+            path = ''
+            for folder in folder_name.split('/'):
+                path = f'{path}/{folder}' if path else folder
+                if path in self._known_folders:
+                    continue
+                try:
+                    client.execute_request('mkdir', Urn(path, directory=True).quote())
+                except MethodNotSupported:
+                    # MKCOL returns 405 if the folder already exists
+                    pass
+                self._known_folders.add(path)
+        self._add_known_folder(folder_name)
+
+    def _download_from(self, client, remote_path, data):
+        """GETs the file from the current size of 'data' and appends it.
+        Returns the total size of the file or None if unknown."""
+        offset = data.tell()
+        headers = [f'Range: bytes={offset}-'] if offset else None
+        with client.execute_request('download', Urn(remote_path).quote(),
+                                    headers_ext=headers) as response:
+            if offset and response.status_code != 206:
+                # Range not supported by the server, start again
+                get_logger().warning('Unable to resume the download of \'%s\'', remote_path)
+                data.seek(0)
+                data.truncate()
+            total = _get_total_size(response)
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                data.write(chunk)
+        return total
+
+    def _download_resumable(self, client, remote_path, file_path):
+        """Downloads the file resuming from the received bytes after transient errors.
+        Returns the downloaded bytes and the number of resumes."""
+        failures = 0
+        resumes = 0
+        with open(file_path, 'wb') as data:
+            while True:
+                offset = data.tell()
+                try:
+                    total = self._download_from(client, remote_path, data)
+                    if total is None or data.tell() == total:
+                        return data.tell(), resumes
+                    error = f'connection closed at byte {data.tell()} of {total}'
+                except (RequestException, ResponseErrorCode) as exc:
+                    if isinstance(exc, ResponseErrorCode) and int(exc.code) < 500:
+                        raise
+                    error = exc
+                # Only the consecutive failures without progress are counted
+                failures = 1 if data.tell() > offset else failures + 1
+                if failures > self.max_retries:
+                    raise WebDavDownloadError(file_name=remote_path, error=error)
+                get_logger().warning('Download of \'%s\' interrupted at byte %d: %s. Resuming.',
+                                     remote_path, data.tell(), error)
+                resumes += 1
+                time.sleep(self._RETRY_BACKOFF * failures)
+
     def download_file(self, parsed_event, input_dir_path):
+        """Downloads the file with a streamed GET that is resumed
+        with a Range request if the transfer is interrupted."""
         file_download_path = SysUtils.join_paths(input_dir_path, parsed_event.file_name)
-        self.client.download_sync(remote_path=parsed_event.object_key, local_path=file_download_path)
+        start = time.monotonic()
+        try:
+            with self._pooled_client() as client:
+                size, resumes = self._download_resumable(client, parsed_event.object_key,
+                                                         file_download_path)
+        except BaseException:
+            # Don't leave partial files in the input folder
+            if os.path.isfile(file_download_path):
+                os.remove(file_download_path)
+            raise
+        elapsed = time.monotonic() - start
+        get_logger().info('Successful download of file \'%s\' in path \'%s\' '
+                          '(%d bytes in %.2f s, %.2f MiB/s, %d resumes)',
+                          parsed_event.object_key,
+                          file_download_path,
+                          size,
+                          elapsed,
+                          size / (1024 * 1024) / max(elapsed, 1e-6),
+                          resumes)
         return file_download_path
 
     def upload_file(self, file_path, file_name, output_path):
-        if self.client.check(output_path):
-            self.client.upload_sync(remote_path=output_path+"/"+file_name, local_path=file_path)
-        else:
-            self.client.mkdir(output_path)
-            self.client.upload_sync(remote_path=output_path+"/"+file_name, local_path=file_path)
+        upload_path = _get_upload_path(file_name, output_path)
+        upload_folder = os.path.dirname(upload_path)
+        with self._pooled_client() as client:
+            self._ensure_folder(client, upload_folder)
+            # PUT the file directly, 'upload_sync' checks the parent folder for each file
+            with open(file_path, 'rb') as data:
+                try:
+                    client.execute_request('upload', Urn(upload_path).quote(), data=data)
+                except WebDavException:
+                    # The folder may have been removed since it was checked
+                    self._known_folders.discard(upload_folder)
+                    raise
+
+    def is_unchanged(self, file_path, file_name, output_path):
+        """Compares the local MD5 with the digest of the remote file.
+
+        The MD5 is requested through the 'Want-Digest' header and, if not
+        sent by the server, the ETag is used when it is an MD5 hash."""
+        try:
+            with self._pooled_client() as client:
+                response = client.execute_request(
+                    'check', Urn(_get_upload_path(file_name, output_path)).quote(),
+                    headers_ext=['Want-Digest: MD5'])
+        except WebDavException:
+            return False
+        remote_md5 = _get_digest_md5(response.headers.get('Digest', ''))
+        if remote_md5 is None:
+            etag = response.headers.get('ETag', '').strip('"').lower()
+            if not _MD5_ETAG_REGEX.match(etag):
+                return False
+            remote_md5 = etag
+        return get_file_md5(file_path) == remote_md5
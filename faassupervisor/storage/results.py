@@ -0,0 +1,240 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the cache of function results (output files).
+
+Enabled with the 'result_cache' section of the function config:
+
+result_cache:
+  store: local                # 'local' or 's3'
+  path: /mnt/results          # Folder or 'bucket/prefix' for the s3 store
+  storage_provider: minio.x   # Provider of the s3 store, defaults to 's3'
+
+Results are identified by the input objects (with their ETag), the
+user script, the container image and the function config, so only
+pure functions should enable it."""
+
+import abc
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from faassupervisor.logger import get_logger
+from faassupervisor.storage.providers import get_bucket_name, get_file_key
+from faassupervisor.utils import ConfigUtils, FileUtils, SysUtils
+
+_OSCAR_SCRIPT_PATH = '/oscar/config/script.sh'
+# Object with the list of result files. Written last in the s3 store
+_RESULT_MANIFEST_NAME = '.manifest.json'
+
+
+def _get_script_hash():
+    """Returns the hash of the user script or None if not found."""
+    script = SysUtils.get_env_var('SCRIPT') or ConfigUtils.read_cfg_var('script')
+    if not script and FileUtils.is_file(_OSCAR_SCRIPT_PATH):
+        script = FileUtils.read_file(_OSCAR_SCRIPT_PATH)
+    if not script:
+        return None
+    return hashlib.sha256(script.encode('utf-8')).hexdigest()
+
+
+def _get_tmp_path(output_dir_path, key):
+    """Returns a temporary folder in the output folder to download
+    a result, so the output folder never holds partial results."""
+    return SysUtils.join_paths(output_dir_path, f'.{key}.{uuid.uuid4()}')
+
+
+def _move_files(tmp_path, output_dir_path, file_names):
+    """Moves the files of the temporary folder into the output
+    folder and returns their new paths."""
+    file_paths = []
+    for file_name in file_names:
+        file_path = SysUtils.join_paths(output_dir_path, file_name)
+        FileUtils.create_folder(os.path.dirname(file_path))
+        os.replace(SysUtils.join_paths(tmp_path, file_name), file_path)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def _get_image():
+    container = ConfigUtils.read_cfg_var('container')
+    if isinstance(container, dict) and container.get('image'):
+        return container['image']
+    return ConfigUtils.read_cfg_var('image') or None
+
+
+class ResultStore(metaclass=abc.ABCMeta):
+    """All the result stores must inherit from this class."""
+
+    @abc.abstractmethod
+    def fetch(self, key, output_dir_path):
+        """Copies the result files into the output folder.
+        Returns True on hit and False on miss."""
+
+    @abc.abstractmethod
+    def store(self, key, output_dir_path):
+        """Stores all the files of the output folder as the result."""
+
+
+class LocalResultStore(ResultStore):
+    """Stores the results in a local (or mounted) folder."""
+
+    def __init__(self, path):
+        self.path = path
+        FileUtils.create_folder(path)
+
+    def fetch(self, key, output_dir_path):
+        result_path = SysUtils.join_paths(self.path, key)
+        if not os.path.isdir(result_path):
+            return False
+        tmp_path = _get_tmp_path(output_dir_path, key)
+        try:
+            shutil.copytree(result_path, tmp_path)
+            _move_files(tmp_path, output_dir_path,
+                        [os.path.relpath(file_path, tmp_path)
+                         for file_path in FileUtils.get_all_files_in_dir(tmp_path)])
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return True
+
+    def store(self, key, output_dir_path):
+        # Copy to a temporary folder and rename it to publish the result atomically
+        tmp_path = SysUtils.join_paths(self.path, f'.{key}.{uuid.uuid4()}')
+        shutil.copytree(output_dir_path, tmp_path)
+        try:
+            os.rename(tmp_path, SysUtils.join_paths(self.path, key))
+        except OSError:
+            # Already stored by other invocation
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+class S3ResultStore(ResultStore):
+    """Stores the results in a bucket prefix through an S3/MinIO provider.
+
+    The result manifest is uploaded after the files,
+    so partial results are never fetched. The files are moved to the
+    output folder only when all of them are downloaded and then
+    registered in 'file_origins' to copy them server-side when possible."""
+
+    def __init__(self, stg_provider, path, file_origins=None):
+        self.stg_provider = stg_provider
+        self.path = path.strip('/')
+        self.file_origins = file_origins
+
+    def _get_result_path(self, key):
+        return f'{self.path}/{key}'
+
+    def fetch(self, key, output_dir_path):
+        client = self.stg_provider.client
+        result_path = self._get_result_path(key)
+        bucket_name = get_bucket_name(result_path)
+        try:
+            manifest = client.get_object(Bucket=bucket_name,
+                                         Key=get_file_key(result_path, _RESULT_MANIFEST_NAME))
+        except client.exceptions.NoSuchKey:
+            return False
+        tmp_path = _get_tmp_path(output_dir_path, key)
+        file_names = json.loads(manifest['Body'].read())
+        try:
+            for file_name in file_names:
+                file_path = SysUtils.join_paths(tmp_path, file_name)
+                FileUtils.create_folder(os.path.dirname(file_path))
+                client.download_file(bucket_name, get_file_key(result_path, file_name),
+                                     file_path, **self.stg_provider.transfer_args)
+            file_paths = _move_files(tmp_path, output_dir_path, file_names)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        if self.file_origins is not None:
+            for file_name, file_path in zip(file_names, file_paths):
+                self.file_origins.register(file_path, {
+                    'type': self.stg_provider.get_type(),
+                    'provider_id': self.stg_provider.stg_auth.provider_id,
+                    'bucket': bucket_name,
+                    'key': get_file_key(result_path, file_name),
+                    'etag': None})
+        return True
+
+    def store(self, key, output_dir_path):
+        result_path = self._get_result_path(key)
+        file_names = []
+        for file_path in FileUtils.get_all_files_in_dir(output_dir_path):
+            file_name = os.path.relpath(file_path, output_dir_path)
+            self.stg_provider.upload_file(file_path, file_name, result_path)
+            file_names.append(file_name)
+        self.stg_provider.client.put_object(Bucket=get_bucket_name(result_path),
+                                            Key=get_file_key(result_path, _RESULT_MANIFEST_NAME),
+                                            Body=json.dumps(file_names).encode('utf-8'))
+
+
+class ResultCache():
+    """Memoizes the output files of the function for the same inputs."""
+
+    def __init__(self, result_store):
+        self.result_store = result_store
+
+    @classmethod
+    def from_config(cls, stg_config):
+        """Returns the result cache defined in the function config or None."""
+        cache_config = ConfigUtils.read_cfg_var('result_cache')
+        if not isinstance(cache_config, dict) or not cache_config.get('path'):
+            return None
+        store_type = cache_config.get('store', 'local')
+        if store_type == 'local':
+            return cls(LocalResultStore(cache_config['path']))
+        if store_type == 's3':
+            stg_provider = stg_config.get_provider(cache_config.get('storage_provider', 's3'))
+            if stg_provider and stg_provider.get_type() in ('S3', 'MINIO'):
+                return cls(S3ResultStore(stg_provider, cache_config['path'],
+                                         stg_config.file_origins))
+        get_logger().warning('Result cache disabled: invalid store \'%s\'', store_type)
+        return None
+
+    @staticmethod
+    def get_key(parsed_events):
+        """Returns the result key of the events or None if
+        the content of any input object is unknown."""
+        inputs = []
+        for parsed_event in parsed_events:
+            identifiers = [parsed_event.get_type(),
+                           getattr(parsed_event, 'provider_id', None),
+                           getattr(parsed_event, 'bucket_name', None),
+                           getattr(parsed_event, 'object_key', None),
+                           getattr(parsed_event, 'object_etag', None)]
+            if any(identifier in (None, '') for identifier in identifiers):
+                return None
+            inputs.append(identifiers)
+        content = json.dumps({'inputs': inputs,
+                              'script': _get_script_hash(),
+                              'image': _get_image(),
+                              'config': ConfigUtils.get_config_hash()}, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def fetch(self, key, output_dir_path):
+        """Restores the cached output files. Returns True on hit."""
+        try:
+            found = self.result_store.fetch(key, output_dir_path)
+        except Exception as exc:  # pylint: disable=broad-except
+            get_logger().warning('Unable to read cached result \'%s\': %s', key, exc)
+            return False
+        if found:
+            get_logger().info('Cached result \'%s\' found', key)
+        return found
+
+    def store(self, key, output_dir_path):
+        """Stores the output files as the result of the key."""
+        try:
+            self.result_store.store(key, output_dir_path)
+            get_logger().info('Result \'%s\' stored in cache', key)
+        except Exception as exc:  # pylint: disable=broad-except
+            get_logger().warning('Unable to store result \'%s\': %s', key, exc)
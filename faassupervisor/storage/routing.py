@@ -0,0 +1,84 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the matcher used to route output files to the defined outputs.
+
+An output accepts a file if its name starts with any of the output
+'prefix' values, ends with any of the 'suffix' values and matches any
+of the 'glob' patterns. Empty or undefined filters accept all the files."""
+
+import fnmatch
+import re
+
+# Key used to store the outputs that end in a trie node
+_OUTPUTS_KEY = None
+
+
+def _add_to_trie(trie, text, index):
+    node = trie
+    for char in text:
+        node = node.setdefault(char, {})
+    node.setdefault(_OUTPUTS_KEY, set()).add(index)
+
+
+def _search_trie(trie, text):
+    """Returns the outputs of all the trie entries that are a prefix of 'text'."""
+    found = set(trie.get(_OUTPUTS_KEY, ()))
+    node = trie
+    for char in text:
+        node = node.get(char)
+        if node is None:
+            break
+        if _OUTPUTS_KEY in node:
+            found.update(node[_OUTPUTS_KEY])
+    return found
+
+
+class OutputRouter():
+    """Precompiled routing plan that maps each file to its outputs in a single pass."""
+
+    def __init__(self, outputs):
+        self._prefix_trie = {}
+        self._suffix_trie = {}
+        self._any_prefix = set()
+        self._any_suffix = set()
+        self._globs = {}
+        for index, output in enumerate(outputs):
+            prefixes = output.get('prefix') or []
+            suffixes = output.get('suffix') or []
+            globs = output.get('glob') or []
+            if prefixes:
+                for prefix in prefixes:
+                    _add_to_trie(self._prefix_trie, prefix, index)
+            else:
+                self._any_prefix.add(index)
+            if suffixes:
+                # Suffixes are stored reversed
+                for suffix in suffixes:
+                    _add_to_trie(self._suffix_trie, suffix[::-1], index)
+            else:
+                self._any_suffix.add(index)
+            if globs:
+                self._globs[index] = re.compile('|'.join(fnmatch.translate(glob)
+                                                         for glob in globs))
+
+    def route(self, file_name):
+        """Returns the sorted indexes of the outputs that accept the file."""
+        matches = self._any_prefix | _search_trie(self._prefix_trie, file_name)
+        if not matches:
+            return []
+        matches &= self._any_suffix | _search_trie(self._suffix_trie, file_name[::-1])
+        if self._globs:
+            matches = {index for index in matches
+                       if index not in self._globs or self._globs[index].match(file_name)}
+        return sorted(matches)
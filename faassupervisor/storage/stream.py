@@ -0,0 +1,70 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the classes used to stream the input file
+to the user script through a named pipe."""
+
+import os
+import threading
+from faassupervisor.exceptions import InputStreamError
+from faassupervisor.logger import get_logger
+from faassupervisor.utils import SysUtils
+
+
+class InputStream():
+    """Creates a named pipe in the input folder and feeds it
+    from a background thread with the provider download."""
+
+    _STOP_INTERVAL = 0.1
+
+    def __init__(self, stg_provider, parsed_event, input_dir_path):
+        self.stg_provider = stg_provider
+        self.parsed_event = parsed_event
+        self.fifo_path = SysUtils.join_paths(input_dir_path, parsed_event.file_name)
+        self.error = None
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+
+    def start(self):
+        """Creates the named pipe and starts the download.
+        Returns the path of the pipe."""
+        os.mkfifo(self.fifo_path)
+        self._thread.start()
+        return self.fifo_path
+
+    def _feed(self):
+        try:
+            # Blocks until the user script opens the pipe
+            with open(self.fifo_path, 'wb') as fifo:
+                self.stg_provider.download_stream(self.parsed_event, fifo)
+            get_logger().info('Input file streamed to \'%s\'', self.fifo_path)
+        except BrokenPipeError:
+            get_logger().warning('Input stream closed by the reader before the end of the file')
+        except Exception as exc:  # pylint: disable=broad-except
+            self.error = exc
+            get_logger().error('Error streaming input file: %s', exc)
+
+    def stop(self):
+        """Waits for the download thread to finish.
+        Raises InputStreamError if the download failed.
+
+        If the pipe was never opened by the reader, it is opened
+        and closed to unblock the download thread."""
+        while self._thread.is_alive():
+            try:
+                fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+                os.close(fd)
+            except OSError:
+                pass
+            self._thread.join(self._STOP_INTERVAL)
+        if self.error:
+            raise InputStreamError(file_name=self.parsed_event.file_name, error=self.error)
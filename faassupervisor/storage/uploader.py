@@ -0,0 +1,139 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the engine used to upload the output files."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from faassupervisor.exceptions import OutputUploadError
+from faassupervisor.logger import get_logger
+
+
+class OutputUploader():
+    """Uploads files through the storage providers using a bounded thread pool.
+
+    Uploads are run in the calling thread if the concurrency is 1.
+    Providers that are not thread-safe upload their files one at a time.
+    The errors are collected and reported together when calling 'wait'."""
+
+    # Number of destinations checked at the same time by 'discard_unchanged'
+    _CHECK_CONCURRENCY = 16
+
+    def __init__(self, concurrency=1):
+        self.concurrency = max(concurrency, 1)
+        self._executor = None
+        if self.concurrency > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._futures = []
+        self._provider_locks = {}
+        self._errors = []
+        self._errors_lock = threading.Lock()
+        self.uploaded = 0
+        self.skipped = 0
+
+    def _get_provider_lock(self, provider):
+        if provider.is_thread_safe():
+            return None
+        return self._provider_locks.setdefault(id(provider), threading.Lock())
+
+    @staticmethod
+    def _upload_or_copy(provider, file_path, file_name, output_path, origin):
+        if origin:
+            try:
+                provider.copy_file(origin, file_name, output_path)
+                return
+            except Exception as exc:  # pylint: disable=broad-except
+                get_logger().warning('Unable to copy file \'%s\' server-side, uploading it: %s',
+                                     file_name, exc)
+        provider.upload_file(file_path, file_name, output_path)
+
+    def _upload(self, provider, file_path, file_name, output_path, lock, origin=None):
+        try:
+            if lock:
+                with lock:
+                    self._upload_or_copy(provider, file_path, file_name, output_path, origin)
+            else:
+                self._upload_or_copy(provider, file_path, file_name, output_path, origin)
+        except Exception as exc:  # pylint: disable=broad-except
+            get_logger().error('Error uploading file \'%s\' to \'%s\': %s',
+                               file_name, output_path, exc)
+            with self._errors_lock:
+                self._errors.append((file_name, output_path, exc))
+        else:
+            with self._errors_lock:
+                self.uploaded += 1
+
+    def _is_unchanged(self, provider, file_path, file_name, output_path):
+        lock = self._get_provider_lock(provider)
+        try:
+            if lock:
+                with lock:
+                    return provider.is_unchanged(file_path, file_name, output_path)
+            return provider.is_unchanged(file_path, file_name, output_path)
+        except Exception as exc:  # pylint: disable=broad-except
+            get_logger().warning('Unable to check file \'%s\' in \'%s\': %s',
+                                 file_name, output_path, exc)
+            return False
+
+    def discard_unchanged(self, uploads):
+        """Receives a list of (provider, file_path, file_name, output_path, ...)
+        submit arguments and returns the uploads whose destination is not identical to the local file.
+
+        The destinations are checked concurrently."""
+        if not uploads:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self._CHECK_CONCURRENCY, len(uploads))) as pool:
+            unchanged = list(pool.map(lambda upload: self._is_unchanged(*upload[:4]), uploads))
+        pending = []
+        for upload, is_unchanged in zip(uploads, unchanged):
+            if is_unchanged:
+                get_logger().info('Skipping upload of unchanged file \'%s\' to \'%s\'',
+                                  upload[2], upload[3])
+                self.skipped += 1
+            else:
+                pending.append(upload)
+        return pending
+
+    def submit(self, provider, file_path, file_name, output_path, limiter=None, origin=None):
+        """Schedules the upload of a file.
+
+        'limiter' is an optional semaphore used to bound the number of
+        uploads in progress of the same output. If 'origin' is set, the
+        file is copied server-side from that remote object."""
+        lock = self._get_provider_lock(provider)
+        if not self._executor:
+            self._upload(provider, file_path, file_name, output_path, lock, origin)
+            return
+        if limiter:
+            limiter.acquire()
+        future = self._executor.submit(self._upload, provider, file_path,
+                                       file_name, output_path, lock, origin)
+        if limiter:
+            future.add_done_callback(lambda _: limiter.release())
+        self._futures.append(future)
+
+    def wait(self):
+        """Waits until all the uploads finish.
+        Raises OutputUploadError if any of them failed."""
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        if self._errors:
+            details = '; '.join(f"'{file_name}' to '{output_path}' ({exc})"
+                                for file_name, output_path, exc in self._errors)
+            raise OutputUploadError(failed=len(self._errors),
+                                    total=len(self._errors) + self.uploaded,
+                                    details=details)
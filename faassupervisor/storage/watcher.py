@@ -0,0 +1,102 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module with the watcher used to upload output files
+while the user script is still running."""
+
+import os
+import threading
+from faassupervisor.logger import get_logger
+from faassupervisor.utils import FileUtils
+
+
+def _get_file_state(file_path):
+    """Returns the (size, mtime) of a file or None if it doesn't exist."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class OutputWatcher():
+    """Polls the output folder and uploads the files that are complete.
+
+    The user script marks a file as complete by creating an empty
+    '<file_name>.done' file after closing it. Unmarked files (partial or
+    temporary ones) are only uploaded when the watcher stops, and markers
+    are never uploaded. Files modified after being uploaded are returned
+    again as pending when stopping the watcher."""
+
+    _DEFAULT_INTERVAL = 1.0
+    _MARKER_SUFFIX = '.done'
+
+    def __init__(self, output_dir_path, upload_callback, interval=_DEFAULT_INTERVAL):
+        self.output_dir_path = output_dir_path
+        self.upload_callback = upload_callback
+        self.interval = interval
+        # File states when uploaded
+        self._uploaded = {}
+        self._errors = []
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Starts watching the output folder."""
+        get_logger().info('Watching folder \'%s\' to upload output files', self.output_dir_path)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._upload_complete_files()
+
+    def _is_marker(self, file_path, file_paths):
+        return file_path.endswith(self._MARKER_SUFFIX) and \
+            file_path[:-len(self._MARKER_SUFFIX)] in file_paths
+
+    def _get_output_files(self):
+        """Returns the output files without the markers."""
+        file_paths = set(FileUtils.get_all_files_in_dir(self.output_dir_path))
+        return sorted(file_path for file_path in file_paths
+                      if not self._is_marker(file_path, file_paths))
+
+    def _upload_complete_files(self):
+        complete = {}
+        for file_path in self._get_output_files():
+            if not os.path.isfile(f'{file_path}{self._MARKER_SUFFIX}'):
+                continue
+            state = _get_file_state(file_path)
+            if state is not None and self._uploaded.get(file_path) != state:
+                complete[file_path] = state
+        if not complete:
+            return
+        try:
+            self.upload_callback(list(complete))
+        except Exception as exc:  # pylint: disable=broad-except
+            # The files are uploaded again when the watcher stops
+            get_logger().warning('Error uploading output files while running: %s', exc)
+            self._errors.append(exc)
+        else:
+            self._uploaded.update(complete)
+
+    def stop(self):
+        """Stops the watcher and returns the files not uploaded
+        (or modified after being uploaded)."""
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        for error in self._errors:
+            get_logger().warning('Output files not uploaded while running '
+                                 '(retrying them now): %s', error)
+        return [file_path for file_path in self._get_output_files()
+                if self._uploaded.get(file_path) != _get_file_state(file_path)]
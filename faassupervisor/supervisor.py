@@ -15,15 +15,28 @@
 """ Module with all the generic supervisor classes and methods.
 Also entry point of the faassupervisor package."""
 
+import json
 import os
+import sys
 import distutils.util
-from faassupervisor.events import parse_event
+from concurrent.futures import ThreadPoolExecutor
+from faassupervisor.events import parse_events
 from faassupervisor.exceptions import exception, FaasSupervisorError
 from faassupervisor.storage.config import StorageConfig
+from faassupervisor.storage.results import ResultCache
+from faassupervisor.storage.watcher import OutputWatcher
 from faassupervisor.utils import SysUtils, FileUtils, ConfigUtils
 from faassupervisor.logger import configure_logger, get_logger
 from faassupervisor.faas.aws_lambda.supervisor import LambdaSupervisor, is_batch_execution
 from faassupervisor.faas.binary.supervisor import BinarySupervisor
+from faassupervisor.faas.binary.window import EventWindow
+
+# File of the input folder with the list of downloaded files (multi-record events)
+_INPUT_MANIFEST_FILE_NAME = '.input_manifest.json'
+# Subfolder of the input folder with the staged files
+_STAGE_FOLDER_NAME = '.staged'
+# Prefix of the output subfolders of each event (multi-record events)
+_EVENT_OUTPUT_FOLDER_PREFIX = 'event-'
 
 
 class Supervisor():
@@ -32,10 +45,14 @@ class Supervisor():
 
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, event, context=None):
+    def __init__(self, event, context=None, parsed_events=None):
         self._create_tmp_dirs()
-        # Parse the event_info data
-        self.parsed_event = parse_event(event)
+        self.input_stream = None
+        self.output_watcher = None
+        self.result_cache = None
+        # Parse the event_info data (storage notifications can contain several records)
+        self.parsed_events = parsed_events or parse_events(event)
+        self.parsed_event = self.parsed_events[0]
         # Read storage config
         self._read_storage_config()
         # Create the supervisor
@@ -57,15 +74,41 @@ class Supervisor():
         get_logger().info("Reading storage configuration")
         self.stg_config = StorageConfig()
 
+    def _get_result_key(self):
+        """Returns the key of the function result if the result cache
+        is enabled and the inputs are identified by their content."""
+        self.result_cache = ResultCache.from_config(self.stg_config)
+        if self.result_cache is None:
+            return None
+        return ResultCache.get_key(self.parsed_events)
+
     @exception()
     def _parse_input(self):
         """Download input data from storage provider
         or save data from POST request.
 
         A function can have information from several storage providers
-        but one event always represents only one file (so far), so only
-        one provider is going to be used for each event received.
+        but each event record represents only one file. If the event has
+        several records, all the files are downloaded to the input folder.
+
+        The 'stage' paths of the inputs are downloaded at the same time
+        to their own subfolder, set in the STAGED_INPUT_DIR variable.
+        Both share the pool bounded by 'download_concurrency'.
         """
+        # Don't expose the inputs of a previous invocation (warm containers)
+        SysUtils.delete_env_var('INPUT_FILE_PATH')
+        SysUtils.delete_env_var('INPUT_MANIFEST_PATH')
+        SysUtils.delete_env_var('STAGED_INPUT_DIR')
+        stage_dir = SysUtils.join_paths(self.input_tmp_dir.name, _STAGE_FOLDER_NAME)
+        with self.stg_config.download_pool(), ThreadPoolExecutor(max_workers=1) as stager:
+            staging = stager.submit(self.stg_config.stage_inputs, stage_dir)
+            self._download_event_input()
+            staged_files = staging.result()
+        if staged_files:
+            SysUtils.set_env_var('STAGED_INPUT_DIR', stage_dir)
+            get_logger().info('%d input files staged in \'%s\'', len(staged_files), stage_dir)
+
+    def _download_event_input(self):
         # Parse the 'file_stage_in' config var
         skip_download = ConfigUtils.read_cfg_var('file_stage_in')
         if skip_download == '':
@@ -73,6 +116,10 @@ class Supervisor():
         # Parse input file
         if skip_download is True:
             get_logger().info('Skipping download of input file.')
+        elif skip_download == 'stream' and len(self.parsed_events) == 1 and self._stream_input():
+            return
+        elif len(self.parsed_events) > 1:
+            self._download_inputs()
         else:
             input_file_path = self.stg_config.download_input(self.parsed_event,
                                                              self.input_tmp_dir.name)
@@ -83,9 +130,88 @@ class Supervisor():
                 SysUtils.set_env_var('INPUT_FILE_PATH', self.input_tmp_dir.name)
                 get_logger().info('INPUT_FILE_PATH variable of set to \'%s\'', self.input_tmp_dir.name)
 
+    def _download_inputs(self):
+        """Downloads the files of all the event records and writes
+        the input manifest with their paths and origin."""
+        downloads = self.stg_config.download_inputs(self.parsed_events, self.input_tmp_dir.name)
+        manifest = [{'file_path': file_path,
+                     'output_dir': self._get_event_output_dir(index),
+                     'storage_provider': parsed_event.get_type().lower(),
+                     'provider_id': getattr(parsed_event, 'provider_id', None),
+                     'bucket_name': getattr(parsed_event, 'bucket_name', None),
+                     'object_key': getattr(parsed_event, 'object_key', None),
+                     'event_time': getattr(parsed_event, 'event_time', None)}
+                    for index, (parsed_event, file_path) in enumerate(downloads)]
+        manifest_path = SysUtils.join_paths(self.input_tmp_dir.name, _INPUT_MANIFEST_FILE_NAME)
+        FileUtils.create_file_with_content(manifest_path, json.dumps(manifest, indent=2))
+        SysUtils.set_env_var('INPUT_FILE_PATH', self.input_tmp_dir.name)
+        SysUtils.set_env_var('INPUT_MANIFEST_PATH', manifest_path)
+        get_logger().info('INPUT_FILE_PATH variable set to \'%s\' with %d files',
+                          self.input_tmp_dir.name, len(downloads))
+
+    def _get_event_output_dir(self, index):
+        """Returns (and creates) the output folder of an event.
+
+        The files stored there are uploaded with the event of the same index."""
+        output_dir = SysUtils.join_paths(self.output_tmp_dir.name,
+                                         f'{_EVENT_OUTPUT_FOLDER_PREFIX}{index}')
+        FileUtils.create_folder(output_dir)
+        return output_dir
+
+    def _upload_outputs(self, output_files=None):
+        """Uploads the output files. With several events, the files of each
+        event output folder are uploaded with its event and the rest with the first one."""
+        if len(self.parsed_events) == 1:
+            self.stg_config.upload_output(self.output_tmp_dir.name, self.parsed_event, output_files)
+            return
+        if output_files is None:
+            output_files = FileUtils.get_all_files_in_dir(self.output_tmp_dir.name)
+        remaining_files = set(output_files)
+        for index, parsed_event in enumerate(self.parsed_events):
+            event_output_dir = self._get_event_output_dir(index)
+            event_files = [file_path for file_path in output_files
+                           if file_path.startswith(f'{event_output_dir}/')]
+            if event_files:
+                self.stg_config.upload_output(event_output_dir, parsed_event, event_files)
+                remaining_files.difference_update(event_files)
+        if remaining_files:
+            self.stg_config.upload_output(self.output_tmp_dir.name, self.parsed_event,
+                                          sorted(remaining_files))
+
+    def _stream_input(self):
+        """Sets INPUT_FILE_PATH to a named pipe fed with the input file
+        while it is downloaded. Returns False if streaming is not possible."""
+        self.input_stream = self.stg_config.stream_input(self.parsed_event,
+                                                         self.input_tmp_dir.name)
+        if not self.input_stream:
+            return False
+        SysUtils.set_env_var('INPUT_FILE_PATH', self.input_stream.fifo_path)
+        get_logger().info('INPUT_FILE_PATH variable set to stream \'%s\'',
+                          self.input_stream.fifo_path)
+        return True
+
+    @exception()
+    def _stop_input_stream(self):
+        if self.input_stream:
+            self.input_stream.stop()
+
+    def _start_output_watcher(self):
+        """Starts uploading the output files while the function
+        is running if 'file_stage_out' is set to 'stream'.
+        Only the files marked as complete ('<file_name>.done') are
+        uploaded before the function ends."""
+        self.output_watcher = None
+        if ConfigUtils.read_cfg_var('file_stage_out') == 'stream':
+            self.output_watcher = OutputWatcher(self.output_tmp_dir.name, self._upload_outputs)
+            self.output_watcher.start()
+
     @exception()
     def _parse_output(self):
-        self.stg_config.upload_output(self.output_tmp_dir.name,self.parsed_event)
+        output_files = None
+        if self.output_watcher:
+            # Upload the files not uploaded while running
+            output_files = self.output_watcher.stop()
+        self._upload_outputs(output_files)
 
     @exception()
     def run(self):
@@ -95,9 +221,18 @@ class Supervisor():
                 # Only delegate to batch
                 self.supervisor.execute_function()
             else:
-                self._parse_input()
-                self.supervisor.execute_function()
-                self._parse_output()
+                result_key = self._get_result_key()
+                if result_key and self.result_cache.fetch(result_key, self.output_tmp_dir.name):
+                    # Skip the execution and upload the cached outputs
+                    self._parse_output()
+                else:
+                    self._parse_input()
+                    self._start_output_watcher()
+                    succeeded = self.supervisor.execute_function()
+                    self._stop_input_stream()
+                    self._parse_output()
+                    if result_key and succeeded:
+                        self.result_cache.store(result_key, self.output_tmp_dir.name)
             get_logger().info('Creating response')
             return self.supervisor.create_response()
         except FaasSupervisorError as fse:
@@ -130,6 +265,36 @@ def main(event, context=None):
     return supervisor.run()
 
 
+def _is_batchable(parsed_events):
+    """Returns True if the events refer to single files that can be
+    downloaded together (Rucio datasets and unknown events can't)."""
+    return all(parsed_event.get_type() not in ('UNKNOWN', 'RUCIO')
+               and hasattr(parsed_event, 'file_name') for parsed_event in parsed_events)
+
+
+def main_batch(events):
+    """Processes the events gathered by the event window (binary mode).
+
+    Storage events of single files are processed together with a single
+    execution of the user script. The rest of events are processed one by one.
+    Returns the list of responses."""
+    configure_logger()
+    get_logger().debug("EVENTS received: %s", events)
+    responses = []
+    storage_event = None
+    parsed_events = []
+    for event in events:
+        event_parsed_events = parse_events(event)
+        if not _is_batchable(event_parsed_events):
+            responses.append(main(event))
+        else:
+            storage_event = storage_event or event
+            parsed_events.extend(event_parsed_events)
+    if parsed_events:
+        responses.append(Supervisor(storage_event, parsed_events=parsed_events).run())
+    return responses
+
+
 if __name__ == "__main__":
 
     if SysUtils.is_lambda_image_environment():
@@ -143,6 +308,21 @@ if __name__ == "__main__":
     else:
         # If supervisor is running as a binary
         # receive the input from stdin.
-        ret = main(SysUtils.get_stdin())
-        if ret is not None:
-            print(ret)
+        event_window = EventWindow.from_config()
+        if event_window:
+            # Process the events received in batches
+            for batch in event_window.get_batches(sys.stdin):
+                try:
+                    responses = main_batch(batch)
+                except BaseException:
+                    # Keep the events of the batch (exits from errors included)
+                    event_window.fail_batch()
+                    raise
+                event_window.complete_batch()
+                for ret in responses:
+                    if ret is not None:
+                        print(ret)
+        else:
+            ret = main(SysUtils.get_stdin())
+            if ret is not None:
+                print(ret)
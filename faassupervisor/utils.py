@@ -14,6 +14,8 @@
 """Module with methods shared by all the classes."""
 
 import base64
+import copy
+import hashlib
 import json
 import os
 import subprocess
@@ -261,41 +263,135 @@ class ConfigUtils():
         'udocker_dir',
         'udocker_bin',
         'udocker_lib',
-        'download_input'
+        'download_input',
+        'upload_concurrency',
+        'download_concurrency'
     ]
+    _CONFIG_ARTIFACT_EXTENSION = '.compiled.json'
+    _CONFIG_ARTIFACT_VERSION = 1
+
+    # Parsed config shared by all the 'read_cfg_var' calls of the process
+    _config_snapshot = {'signature': None, 'config': None, 'hash': None}
+
+    @classmethod
+    def _get_config_source(cls):
+        """Returns the config file path and the environment variable
+        that can contain the function configuration."""
+        if SysUtils.is_lambda_environment():
+            return cls._LAMBDA_STORAGE_CONFIG_PATH, cls._LAMBDA_STORAGE_CONFIG_ENV
+        return cls._BINARY_OSCAR_STORAGE_CONFIG_PATH, cls._BINARY_STORAGE_CONFIG_ENV
+
+    @classmethod
+    def _get_config_signature(cls):
+        """Returns a value that changes whenever the config source changes
+        (file inode, mtime or size, or the content of the environment variable).
+        Returns None if the source can not be identified."""
+        config_path, config_env = cls._get_config_source()
+        if FileUtils.is_file(config_path):
+            try:
+                stat = os.stat(config_path)
+            except OSError:
+                return None
+            return ('file', config_path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return ('env', config_env, SysUtils.get_env_var(config_env))
+
+    @staticmethod
+    def get_config_artifact_path(config_path):
+        """Returns the path of the precompiled artifact of a config file."""
+        return f'{os.path.splitext(config_path)[0]}{ConfigUtils._CONFIG_ARTIFACT_EXTENSION}'
+
+    @staticmethod
+    def get_content_hash(content):
+        """Returns the SHA256 hex digest of a config file content."""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def build_config_artifact(cls, content, config):
+        """Returns the precompiled artifact of a parsed config file."""
+        return {
+            'version': cls._CONFIG_ARTIFACT_VERSION,
+            'source_hash': cls.get_content_hash(content),
+            'config': config
+        }
+
+    @classmethod
+    def _load_config_artifact(cls, config_path, content):
+        """Returns the config stored in the precompiled artifact
+        or None if it is missing, invalid or stale."""
+        artifact_path = cls.get_config_artifact_path(config_path)
+        if not FileUtils.is_file(artifact_path):
+            return None
+        try:
+            with open(artifact_path) as file:
+                artifact = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(artifact, dict)
+                or artifact.get('version') != cls._CONFIG_ARTIFACT_VERSION
+                or artifact.get('source_hash') != cls.get_content_hash(content)):
+            return None
+        return artifact.get('config')
+
+    @classmethod
+    def _load_config(cls):
+        """Reads and parses the function configuration from its source."""
+        config_path, config_env = cls._get_config_source()
+        # Check if config file exists in the config path
+        if FileUtils.is_file(config_path):
+            # Read config file
+            with open(config_path) as file:
+                content = file.read()
+            # Use the precompiled config if it matches the file content
+            config = cls._load_config_artifact(config_path, content)
+            if config is not None:
+                return config
+            return yaml.safe_load(content)
+        # Get and decode content of the config environment variable
+        encoded = SysUtils.get_env_var(config_env)
+        decoded = StrUtils.base64_to_str(encoded)
+        return yaml.safe_load(decoded)
+
+    @classmethod
+    def get_config(cls):
+        """Returns the parsed function configuration.
+
+        The configuration is parsed only once per process and reused
+        until its source (file or environment variable) changes."""
+        signature = cls._get_config_signature()
+        if signature is None or signature != cls._config_snapshot['signature']:
+            config = cls._load_config()
+            cls._config_snapshot = {'signature': signature, 'config': config, 'hash': None}
+        return cls._config_snapshot['config']
+
+    @classmethod
+    def get_config_hash(cls):
+        """Returns a hash of the parsed function configuration content."""
+        config = cls.get_config()
+        if cls._config_snapshot['hash'] is None:
+            content = json.dumps(config, sort_keys=True, default=str)
+            cls._config_snapshot['hash'] = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return cls._config_snapshot['hash']
+
+    @classmethod
+    def clear_config_cache(cls):
+        """Discards the parsed function configuration."""
+        cls._config_snapshot = {'signature': None, 'config': None, 'hash': None}
 
     @classmethod
     def read_cfg_var(cls, variable):
         """Returns the value of a config variable or an empty
         string if not found."""
-        if SysUtils.is_lambda_environment():
-            # Check if config file exsits in '_LAMBDA_STORAGE_CONFIG_PATH'
-            if FileUtils.is_file(cls._LAMBDA_STORAGE_CONFIG_PATH):
-                # Read config file
-                with open(cls._LAMBDA_STORAGE_CONFIG_PATH) as file:
-                    config = yaml.safe_load(file)
-            else:
-                # Get and decode content of '_LAMBDA_STORAGE_CONFIG_ENV'
-                encoded = SysUtils.get_env_var(cls._LAMBDA_STORAGE_CONFIG_ENV)
-                decoded = StrUtils.base64_to_str(encoded)
-                config = yaml.safe_load(decoded)
-        else:
-            # Check if config file exsits in '_BINARY_OSCAR_STORAGE_CONFIG_PATH'
-            if FileUtils.is_file(cls._BINARY_OSCAR_STORAGE_CONFIG_PATH):
-                # Read config file
-                with open(cls._BINARY_OSCAR_STORAGE_CONFIG_PATH) as file:
-                    config = yaml.safe_load(file)
-            else:
-                # Get and decode content of '_BINARY_STORAGE_CONFIG_ENV'
-                encoded = SysUtils.get_env_var(cls._BINARY_STORAGE_CONFIG_ENV)
-                decoded = StrUtils.base64_to_str(encoded)
-                config = yaml.safe_load(decoded)
         # Manage variables that could be defined in environment
         if variable in cls._CUSTOM_VARIABLES:
             value = SysUtils.get_env_var(variable.upper())
             if value != '':
                 return value
-        return config.get(variable, '') if config else ''
+        config = cls.get_config()
+        value = config.get(variable, '') if config else ''
+        # Return a copy so callers can't modify the cached config
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        return value
 
 
 class OIDCUtils():
@@ -0,0 +1,75 @@
+# Copyright (C) GRyCAP - I3M - UPV
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro-benchmark of the output routing with synthetic file names.
+
+Compares the precompiled OutputRouter with the previous nested
+prefix/suffix loops.
+
+Usage:
+    python test/benchmark/output_routing.py [NUM_FILES]
+"""
+
+import random
+import sys
+import timeit
+from faassupervisor.storage.routing import OutputRouter
+
+OUTPUTS = [
+    {'storage_provider': 's3', 'path': 'bucket/all'},
+    {'storage_provider': 'minio.a', 'path': 'bucket/tiles',
+     'prefix': [f'tile-{i}-' for i in range(20)], 'suffix': ['.png', '.jpg', '.tif']},
+    {'storage_provider': 'minio.b', 'path': 'bucket/frames',
+     'prefix': ['frames/', 'thumbs/'], 'suffix': ['.jpg']},
+    {'storage_provider': 'minio.c', 'path': 'bucket/logs', 'suffix': ['.log', '.txt', '.json']},
+    {'storage_provider': 'minio.d', 'path': 'bucket/results',
+     'prefix': ['result-', 'output-', 'final-'], 'suffix': ['.csv', '.parquet']},
+]
+
+
+def _generate_file_names(num_files):
+    rnd = random.Random(0)
+    prefixes = ['tile-3-', 'tile-17-', 'frames/', 'thumbs/', 'result-', 'other-', 'logs/']
+    suffixes = ['.png', '.jpg', '.tif', '.log', '.txt', '.csv', '.bin']
+    return [f'{rnd.choice(prefixes)}{i:07d}{rnd.choice(suffixes)}' for i in range(num_files)]
+
+
+def _route_nested_loops(outputs, file_names):
+    routes = []
+    for index, output in enumerate(outputs):
+        for file_name in file_names:
+            prefix_ok = not output.get('prefix') or \
+                any(file_name.startswith(pref) for pref in output['prefix'])
+            if prefix_ok and (not output.get('suffix') or
+                              any(file_name.endswith(suff) for suff in output['suffix'])):
+                routes.append((file_name, index))
+    return routes
+
+
+def _route_compiled(outputs, file_names):
+    router = OutputRouter(outputs)
+    return [(file_name, index) for file_name in file_names for index in router.route(file_name)]
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    file_names = _generate_file_names(num_files)
+    assert sorted(_route_nested_loops(OUTPUTS, file_names)) == \
+        sorted(_route_compiled(OUTPUTS, file_names))
+    for name, func in [('nested loops', _route_nested_loops), ('compiled router', _route_compiled)]:
+        elapsed = min(timeit.repeat(lambda: func(OUTPUTS, file_names), number=1, repeat=3))
+        print(f'{name:16}: {elapsed:.3f}s for {num_files} files and {len(OUTPUTS)} outputs')
+
+
+if __name__ == "__main__":
+    main()
@@ -42,6 +42,7 @@ DELEGATED_MINIO_EVENT = {"storage_provider": "minio.cluster2",
 
 ONEDATA_EVENT = {"Key": "/my-onedata-space/files/file.txt",
                  "Records": [{"objectKey": "file.txt",
+                              "objectId": "0000034500046EE9C6775...",
                               "eventSource": "OneTrigger",
                               "eventTime": "2018-06-29T10:23:44Z"}]}
 
@@ -135,6 +136,21 @@ class EventModuleTest(unittest.TestCase):
         result = events.parse_event(S3_EVENT)
         self.assertIsInstance(result, S3Event)
 
+    def test_parse_events_multiple_records(self):
+        record = S3_EVENT['Records'][0]
+        second_record = {**record, 's3': {**record['s3'],
+                                          'object': {'key': 'darknet-s3/input/cat.jpg'}}}
+        event = {'Records': [record, second_record, {'eventSource': 'narnia'}]}
+        result = events.parse_events(event)
+        self.assertEqual(len(result), 2)
+        self.assertTrue(all(isinstance(parsed, S3Event) for parsed in result))
+        self.assertEqual([parsed.object_key for parsed in result],
+                         ['darknet-s3/input/dog.jpg', 'darknet-s3/input/cat.jpg'])
+
+    def test_parse_events_single(self):
+        self.assertIsInstance(events.parse_events(MINIO_EVENT)[0], MinioEvent)
+        self.assertIsInstance(events.parse_events(UNKNOWN_EVENT)[0], UnknownEvent)
+
     def test_parse_event_rucio(self):
         result = events.parse_event(RUCIO_EVENT)
         self.assertIsInstance(result, RucioEvent)
@@ -208,6 +224,7 @@ class OnedataEventTest(unittest.TestCase):
         event = OnedataEvent(ONEDATA_EVENT)
         self.assertEqual(event.object_key, "/my-onedata-space/files/file.txt")
         self.assertEqual(event.file_name, "file.txt")
+        self.assertEqual(event.object_id, "0000034500046EE9C6775...")
         self.assertEqual(event.get_type(), "ONEDATA")
 
 
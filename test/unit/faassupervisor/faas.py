@@ -15,17 +15,23 @@
 
 import unittest
 from unittest import mock
+import json
 import os
 import subprocess
+import tempfile
+import threading
 # from faassupervisor.events.minio import MinioEvent
 from faassupervisor.faas.binary.supervisor import BinarySupervisor
+from faassupervisor.faas.binary.window import EventWindow
 from faassupervisor.faas.aws_lambda.supervisor import LambdaSupervisor, \
                                                       is_batch_execution, \
                                                       _is_lambda_batch_execution
 from faassupervisor.exceptions import NoLambdaContextError
 # from faassupervisor.storage.config import StorageConfig
-# from faassupervisor.supervisor import Supervisor
+# from faassupervisor.supervisor import Supervisor, main_batch
 # from faassupervisor.utils import FileUtils, StrUtils
+from faassupervisor.utils import StrUtils
+from faassupervisor.supervisor import Supervisor, main_batch
 # from faassupervisor.utils import ConfigUtils
 
 # pylint: disable=missing-docstring
@@ -68,9 +74,10 @@ class BinarySupervisorTest(unittest.TestCase):
     @mock.patch('faassupervisor.utils.FileUtils.create_file_with_content')
     def test_execute_function(self, mock_create, mock_popen):
         supervisor = BinarySupervisor('UNKNOWN')
+        mock_popen.return_value.wait.return_value = 0
         with mock.patch.dict('os.environ', {'SCRIPT': 'ZmFrZSBzY3JpcHQh',
                                             'TMP_INPUT_DIR': '/tmp/input'}, clear=True):
-            supervisor.execute_function()
+            self.assertTrue(supervisor.execute_function())
             # Check script file creation
             mock_create.assert_called_once_with('/tmp/input/script.sh', 'fake script!')
             # Check process execution
@@ -79,6 +86,197 @@ class BinarySupervisorTest(unittest.TestCase):
                                                stderr=subprocess.STDOUT,
                                                encoding='utf-8',
                                                errors='ignore')
+            mock_popen.return_value.wait.return_value = 1
+            self.assertFalse(supervisor.execute_function())
+
+
+class EventWindowTest(unittest.TestCase):
+
+    def test_stream_batches(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, ''.join(json.dumps(MINIO_EVENT) + '\n' for _ in range(5)).encode())
+        os.write(write_fd, b'\n{"last": "event"}')
+        os.close(write_fd)
+        with os.fdopen(read_fd) as stream:
+            batches = list(EventWindow(max_events=2, timeout=100).get_batches(stream))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2])
+        self.assertEqual(json.loads(batches[0][0]), MINIO_EVENT)
+        self.assertEqual(batches[2][1], '{"last": "event"}')
+
+    def test_stream_timeout(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'{"event": 1}\n')
+        with os.fdopen(read_fd) as stream:
+            window = EventWindow(max_events=10, timeout=50)
+            self.assertEqual(window._read_stream_batch(stream), ['{"event": 1}'])
+        os.close(write_fd)
+
+    def test_spool_batches(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            for i in range(3):
+                with open(os.path.join(spool_dir, f'event{i}.json'), 'w') as f:
+                    f.write(json.dumps({'event': i}))
+                os.utime(os.path.join(spool_dir, f'event{i}.json'), (i, i))
+            with open(os.path.join(spool_dir, '.event3.json.tmp'), 'w') as f:
+                f.write('partial')
+            window = EventWindow(max_events=2, timeout=50, spool_dir=spool_dir)
+            claimed_dir = os.path.join(spool_dir, '.claimed')
+            batches = []
+            for batch in window.get_batches():
+                batches.append(batch)
+                # The events are kept until the batch is processed
+                self.assertEqual(len(os.listdir(claimed_dir)), len(batch))
+                if len(batches) == 1:
+                    window.complete_batch()
+                else:
+                    window.fail_batch()
+                self.assertEqual(os.listdir(claimed_dir), [])
+            self.assertEqual(batches, [['{"event": 0}', '{"event": 1}'], ['{"event": 2}']])
+            self.assertEqual(sorted(os.listdir(spool_dir)),
+                             ['.claimed', '.event3.json.tmp', '.failed'])
+            self.assertEqual(os.listdir(os.path.join(spool_dir, '.failed')), ['event2.json'])
+
+    def test_from_config(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertIsNone(EventWindow.from_config())
+        config = "event_window:\n  max_events: 20\n  timeout: 500\n"
+        with mock.patch.dict('os.environ', {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config)},
+                             clear=True):
+            window = EventWindow.from_config()
+            self.assertEqual(window.max_events, 20)
+            self.assertEqual(window.timeout, 0.5)
+            self.assertIsNone(window.spool_dir)
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def _get_supervisor(self):
+        supervisor = Supervisor.__new__(Supervisor)
+        supervisor._create_tmp_dirs()
+        self.addCleanup(supervisor.input_tmp_dir.cleanup)
+        self.addCleanup(supervisor.output_tmp_dir.cleanup)
+        return supervisor
+
+    def test_upload_outputs_per_event(self):
+        supervisor = self._get_supervisor()
+        supervisor.parsed_events = [mock.Mock(), mock.Mock()]
+        supervisor.parsed_event = supervisor.parsed_events[0]
+        supervisor.stg_config = mock.MagicMock()
+        output_dir = supervisor.output_tmp_dir.name
+        files = [os.path.join(output_dir, 'event-0', 'out0'),
+                 os.path.join(output_dir, 'event-1', 'out1'),
+                 os.path.join(output_dir, 'common')]
+        supervisor._upload_outputs(files)
+        self.assertEqual(supervisor.stg_config.upload_output.call_args_list,
+                         [mock.call(os.path.join(output_dir, 'event-0'),
+                                    supervisor.parsed_events[0], [files[0]]),
+                          mock.call(os.path.join(output_dir, 'event-1'),
+                                    supervisor.parsed_events[1], [files[1]]),
+                          mock.call(output_dir, supervisor.parsed_events[0], [files[2]])])
+
+    def test_parse_input_consecutive(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            # First invocation with several events writes the manifest
+            supervisor = self._get_supervisor()
+            supervisor.parsed_events = [mock.Mock(provider_id='default', bucket_name='bucket',
+                                                  object_key=f'file{i}', event_time=None,
+                                                  **{'get_type.return_value': 'MINIO'})
+                                        for i in range(2)]
+            supervisor.parsed_event = supervisor.parsed_events[0]
+            supervisor.stg_config = mock.MagicMock()
+            supervisor.stg_config.download_inputs.return_value = [
+                (event, os.path.join(supervisor.input_tmp_dir.name, f'file{i}'))
+                for i, event in enumerate(supervisor.parsed_events)]
+            supervisor.stg_config.stage_inputs.return_value = []
+            supervisor._parse_input()
+            self.assertEqual(os.environ['INPUT_FILE_PATH'], supervisor.input_tmp_dir.name)
+            self.assertIn('INPUT_MANIFEST_PATH', os.environ)
+            # The next one without input doesn't see the previous variables
+            supervisor = self._get_supervisor()
+            supervisor.parsed_events = [mock.Mock()]
+            supervisor.parsed_event = supervisor.parsed_events[0]
+            supervisor.stg_config = mock.MagicMock()
+            supervisor.stg_config.download_input.return_value = ''
+            supervisor.stg_config.stage_inputs.return_value = []
+            os.environ['STAGED_INPUT_DIR'] = '/tmp/previous/.staged'
+            supervisor._parse_input()
+            self.assertNotIn('INPUT_FILE_PATH', os.environ)
+            self.assertNotIn('INPUT_MANIFEST_PATH', os.environ)
+            # Nothing staged in this invocation
+            self.assertNotIn('STAGED_INPUT_DIR', os.environ)
+
+    def test_parse_input_staging(self):
+        supervisor = self._get_supervisor()
+        supervisor.parsed_events = [mock.Mock()]
+        supervisor.parsed_event = supervisor.parsed_events[0]
+        supervisor.stg_config = mock.MagicMock()
+        # Each download waits for the other one to start
+        started = threading.Barrier(2, timeout=5)
+
+        def _download_input(*args):
+            started.wait()
+            return ''
+
+        def _stage_inputs(stage_dir):
+            started.wait()
+            return [os.path.join(stage_dir, 'bucket/key')]
+
+        supervisor.stg_config.download_input.side_effect = _download_input
+        supervisor.stg_config.stage_inputs.side_effect = _stage_inputs
+        with mock.patch.dict('os.environ', {}, clear=True):
+            supervisor._parse_input()
+            self.assertFalse(started.broken)
+            supervisor.stg_config.download_pool.assert_called_once()
+            # Staged in its own subfolder
+            stage_dir = os.path.join(supervisor.input_tmp_dir.name, '.staged')
+            supervisor.stg_config.stage_inputs.assert_called_once_with(stage_dir)
+            self.assertEqual(os.environ['STAGED_INPUT_DIR'], stage_dir)
+
+    @mock.patch('faassupervisor.supervisor.ResultCache.get_key')
+    @mock.patch('faassupervisor.supervisor.ResultCache.from_config')
+    def test_run_cached_result(self, mock_result_cache, mock_get_key):
+        supervisor = self._get_supervisor()
+        supervisor.parsed_events = [mock.Mock()]
+        supervisor.parsed_event = supervisor.parsed_events[0]
+        supervisor.stg_config = mock.MagicMock()
+        supervisor.stg_config.download_input.return_value = ''
+        supervisor.stg_config.stage_inputs.return_value = []
+        supervisor.supervisor = mock.Mock()
+        supervisor.output_watcher = None
+        mock_get_key.return_value = 'key'
+        with mock.patch.dict('os.environ', {}, clear=True):
+            mock_result_cache.return_value.fetch.return_value = True
+            supervisor.run()
+            supervisor.supervisor.execute_function.assert_not_called()
+            supervisor.stg_config.upload_output.assert_called_once()
+            mock_result_cache.return_value.store.assert_not_called()
+            mock_result_cache.return_value.fetch.return_value = False
+            supervisor.input_stream = None
+            supervisor.run()
+            supervisor.supervisor.execute_function.assert_called_once()
+            mock_result_cache.return_value.store.assert_called_once_with(
+                'key', supervisor.output_tmp_dir.name)
+
+    @mock.patch('faassupervisor.supervisor.ResultCache.get_key')
+    @mock.patch('faassupervisor.supervisor.ResultCache.from_config')
+    def test_run_failed_not_cached(self, mock_result_cache, mock_get_key):
+        supervisor = self._get_supervisor()
+        supervisor.parsed_events = [mock.Mock()]
+        supervisor.parsed_event = supervisor.parsed_events[0]
+        supervisor.stg_config = mock.MagicMock()
+        supervisor.stg_config.download_input.return_value = ''
+        supervisor.stg_config.stage_inputs.return_value = []
+        supervisor.supervisor = mock.Mock()
+        supervisor.supervisor.execute_function.return_value = False
+        supervisor.output_watcher = None
+        supervisor.input_stream = None
+        mock_get_key.return_value = 'key'
+        mock_result_cache.return_value.fetch.return_value = False
+        with mock.patch.dict('os.environ', {}, clear=True):
+            supervisor.run()
+            supervisor.supervisor.execute_function.assert_called_once()
+            supervisor.stg_config.upload_output.assert_called_once()
+            mock_result_cache.return_value.store.assert_not_called()
 
 
 class LambdaSupervisorTest(unittest.TestCase):
@@ -156,6 +354,25 @@ class LambdaSupervisorTest(unittest.TestCase):
                 'AWS_LAMBDA_REQUEST_ID': '123'}
         self.assertEqual(mock_popen.call_args_list[0][1]['env'], res)
 
+class MainBatchTest(unittest.TestCase):
+
+    @mock.patch('faassupervisor.supervisor.configure_logger')
+    @mock.patch('faassupervisor.supervisor.Supervisor')
+    @mock.patch('faassupervisor.supervisor.main')
+    def test_main_batch_rucio_events(self, mock_main, mock_supervisor, _):
+        rucio_events = [{'event_type': 'close',
+                         'payload': {'scope': 'user', 'name': f'dataset{i}'}} for i in range(2)]
+        with mock.patch.dict('os.environ', {}, clear=True):
+            responses = main_batch([rucio_events[0], MINIO_EVENT, rucio_events[1]])
+        # Rucio events (without file name) are processed one by one
+        self.assertEqual(mock_main.call_args_list,
+                         [mock.call(rucio_events[0]), mock.call(rucio_events[1])])
+        mock_supervisor.assert_called_once()
+        parsed_events = mock_supervisor.call_args.kwargs['parsed_events']
+        self.assertEqual([parsed_event.get_type() for parsed_event in parsed_events], ['MINIO'])
+        self.assertEqual(len(responses), 3)
+
+
 # class SupervisorTest(unittest.TestCase):
 #     @mock.patch('faassupervisor.utils.ConfigUtils.read_cfg_var')
 #     @mock.patch('faassupervisor.supervisor._create_supervisor')
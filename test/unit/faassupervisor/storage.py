@@ -13,24 +13,50 @@
 # limitations under the License.
 """Unit tests for the faassupervisor.storage module and classes."""
 
+import base64
+import errno
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 from unittest import mock
 from unittest.mock import call
 from collections import namedtuple
-from faassupervisor.storage.providers import get_bucket_name, get_file_key
-from faassupervisor.storage.config import StorageConfig, AuthData, create_provider
+import requests
+from faassupervisor.storage.providers import get_bucket_name, get_file_key, get_file_md5
+from faassupervisor.storage.config import StorageConfig, AuthData, create_provider, \
+    clear_runtime_cache
 from faassupervisor.storage.providers.local import Local
 from faassupervisor.storage.providers.minio import Minio
 from faassupervisor.storage.providers.onedata import Onedata
 from faassupervisor.storage.providers.s3 import S3
 from faassupervisor.storage.providers.rucio import Rucio
+from faassupervisor.storage.providers.webdav import WebDav
 from faassupervisor.events import parse_event
 from faassupervisor.events.minio import MinioEvent
 from faassupervisor.events.unknown import UnknownEvent
 from faassupervisor.events.s3 import S3Event
 from faassupervisor.events.onedata import OnedataEvent
-from faassupervisor.utils import StrUtils
+from faassupervisor.utils import StrUtils, FileUtils
+from faassupervisor.exceptions import InvalidStorageProviderError, OutputUploadError, \
+    S3DownloadSizeError, InputStreamError, OnedataDownloadError, WebDavDownloadError, \
+    StorageOperationNotSupportedError
+from faassupervisor.storage.cache import InputCache
+from faassupervisor.storage.origins import FileOrigins
+from faassupervisor.storage.results import ResultCache, LocalResultStore, S3ResultStore
+from faassupervisor.storage.routing import OutputRouter
+from faassupervisor.storage.stream import InputStream
+from faassupervisor.storage.uploader import OutputUploader
+from faassupervisor.storage.watcher import OutputWatcher
 from rucio.common.exception import DataIdentifierNotFound
+from botocore.exceptions import ClientError
+from webdav3.exceptions import MethodNotSupported, RemoteResourceNotFound
 from rucio.common.config import config_get, config_has_section
 
 
@@ -145,6 +171,14 @@ class AuthDataTest(unittest.TestCase):
 
 class StorageConfigTest(unittest.TestCase):
 
+    MINIO_CREDS = {
+            'access_key': 'test_minio_access',
+            'secret_key': 'test_minio_secret'
+    }
+
+    def setUp(self):
+        clear_runtime_cache()
+
     def test_parse_config_valid(self):
         with mock.patch.dict('os.environ',
                              {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
@@ -250,6 +284,41 @@ class StorageConfigTest(unittest.TestCase):
             onedata2_auth = StorageConfig()._get_input_auth_data(parsed_event)
             self.assertEqual(onedata2_auth.get_credential('space'), 'space_ok')
 
+    @mock.patch('faassupervisor.storage.config.create_provider')
+    @mock.patch('faassupervisor.storage.config.StorageConfig._parse_config')
+    def test_reuse_runtime_cache(self, mock_parse, mock_create):
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
+                             clear=True):
+            auth = AuthData('MINIO', self.MINIO_CREDS, 'test_minio')
+            provider = StorageConfig()._get_provider(auth)
+            self.assertEqual(StorageConfig()._get_provider(auth), provider)
+            mock_parse.assert_called_once()
+            mock_create.assert_called_once_with(auth)
+            # Config changes must discard the cached values
+            os.environ['FUNCTION_CONFIG'] = StrUtils.utf8_to_base64_string(CONFIG_FILE_NO_OUTPUT)
+            StorageConfig()._get_provider(auth)
+            self.assertEqual(mock_parse.call_count, 2)
+            self.assertEqual(mock_create.call_count, 2)
+
+    @mock.patch('faassupervisor.utils.FileUtils.get_all_files_in_dir')
+    @mock.patch('faassupervisor.storage.config.create_provider')
+    def test_share_providers_between_download_and_upload(self, mock_create, mock_get_files):
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
+                             clear=True):
+            mock_get_files.return_value = ['/tmp/test/result-1.txt', '/tmp/test/result-2.txt']
+            event = mock.Mock(spec=MinioEvent)
+            event.get_type.return_value = 'MINIO'
+            type(event).provider_id = mock.PropertyMock(return_value='test_minio')
+            config = StorageConfig()
+            config.download_input(event, '/tmp/input')
+            config.upload_output('/tmp/test')
+            # One MinIO provider (input and output) and one S3 provider
+            self.assertEqual(mock_create.call_count, 2)
+            self.assertEqual(config.provider_misses, 2)
+            self.assertEqual(config.provider_hits, 3)
+
     def test_get_invalid_auth(self):
         invalid_auth = StorageConfig()._get_auth_data('INVALID_TYPE')
         self.assertIsNone(invalid_auth)
@@ -260,6 +329,142 @@ class StorageConfigTest(unittest.TestCase):
         StorageConfig().download_input(event, '/tmp/test')
         mock_download_file.assert_called_once_with(event, '/tmp/test')
 
+    @mock.patch('faassupervisor.storage.config.create_provider')
+    def test_download_input_cached(self, mock_create):
+        def _download(event, input_dir):
+            file_path = os.path.join(input_dir, event.file_name)
+            with open(file_path, 'w') as f:
+                f.write('data')
+            return file_path
+        mock_create.return_value.download_file.side_effect = _download
+        event = mock.Mock(spec=MinioEvent)
+        event.get_type.return_value = 'MINIO'
+        type(event).provider_id = mock.PropertyMock(return_value='test_minio')
+        type(event).bucket_name = mock.PropertyMock(return_value='bucket')
+        type(event).object_key = mock.PropertyMock(return_value='input/file.txt')
+        type(event).object_etag = mock.PropertyMock(return_value='etag')
+        type(event).file_name = mock.PropertyMock(return_value='file.txt')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = CONFIG_FILE_OK + f"input_cache:\n  path: {tmp_dir}/cache\n"
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config)},
+                                 clear=True):
+                for input_dir in ['input1', 'input2']:
+                    input_dir_path = os.path.join(tmp_dir, input_dir)
+                    os.mkdir(input_dir_path)
+                    file_path = StorageConfig().download_input(event, input_dir_path)
+                    self.assertEqual(file_path, os.path.join(input_dir_path, 'file.txt'))
+                    with open(file_path) as f:
+                        self.assertEqual(f.read(), 'data')
+            mock_create.return_value.download_file.assert_called_once()
+
+    @mock.patch('faassupervisor.storage.config.create_provider')
+    def test_download_inputs(self, mock_create):
+        mock_create.return_value.is_thread_safe.return_value = False
+        mock_create.return_value.download_file.side_effect = \
+            lambda event, input_dir: os.path.join(input_dir, event.file_name)
+        parsed_events = []
+        for key in ['a/file1', 'a/file2', 'b/file1']:
+            event = mock.Mock(spec=MinioEvent)
+            event.get_type.return_value = 'MINIO'
+            type(event).provider_id = mock.PropertyMock(return_value='test_minio')
+            type(event).file_name = mock.PropertyMock(return_value=key.split('/')[1])
+            parsed_events.append(event)
+        with tempfile.TemporaryDirectory() as input_dir:
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
+                                 clear=True):
+                downloads = StorageConfig().download_inputs(parsed_events, input_dir)
+            # Files with the same name are placed in subfolders
+            self.assertEqual(downloads, [(parsed_events[0], os.path.join(input_dir, 'file1')),
+                                         (parsed_events[1], os.path.join(input_dir, 'file2')),
+                                         (parsed_events[2], os.path.join(input_dir, '2', 'file1'))])
+            self.assertEqual(mock_create.call_count, 1)
+
+    @mock.patch('faassupervisor.storage.config.create_provider')
+    def test_stage_inputs(self, mock_create):
+        provider = mock_create.return_value
+        provider.get_type.return_value = 'MINIO'
+        provider.stg_auth = AuthData('MINIO', self.MINIO_CREDS, 'test_minio')
+        provider.list_objects.side_effect = lambda path: {
+            'models/': [{'bucket': 'models', 'key': 'net/weights.pt', 'size': 3, 'etag': 'e1'},
+                        {'bucket': 'models', 'key': '../../evil', 'size': 3, 'etag': 'e2'}],
+            'config/app.yaml': [{'bucket': 'config', 'key': 'app.yaml', 'size': 3, 'etag': 'e3'}]
+        }[path]
+
+        def _download(stg_object, file_path):
+            with open(file_path, 'w') as f:
+                f.write(stg_object['etag'])
+        provider.download_object.side_effect = _download
+        config_file = CONFIG_FILE_OK.replace(
+            'input:\n', 'input:\n- storage_provider: minio.test_minio\n  path: input\n'
+                        '  stage: [\'models/\', \'config/app.yaml\']\n')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_file += f"input_cache:\n  path: {tmp_dir}/cache\n"
+            input_dir = os.path.join(tmp_dir, 'input')
+            os.mkdir(input_dir)
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config_file)},
+                                 clear=True):
+                config = StorageConfig()
+                staged = config.stage_inputs(input_dir)
+                self.assertEqual(staged, [os.path.join(input_dir, 'models/net/weights.pt'),
+                                          os.path.join(input_dir, 'config/app.yaml')])
+                with open(staged[0]) as f:
+                    self.assertEqual(f.read(), 'e1')
+                self.assertEqual(config.file_origins.get(staged[1])['key'], 'app.yaml')
+                # Second staging is served from the input cache
+                input_dir = os.path.join(tmp_dir, 'input2')
+                os.mkdir(input_dir)
+                StorageConfig().stage_inputs(input_dir)
+                self.assertEqual(provider.download_object.call_count, 2)
+                self.assertTrue(os.path.isfile(os.path.join(input_dir, 'config/app.yaml')))
+
+    def test_download_pool(self):
+        provider = mock.Mock()
+        provider.is_thread_safe.return_value = True
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def _download(download):
+            with lock:
+                active.append(download)
+                max_active.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(download)
+            return download[1]
+
+        config_file = CONFIG_FILE_OK + "download_concurrency: 2\n"
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config_file)},
+                             clear=True):
+            config = StorageConfig(read_config=False)
+            results = {}
+
+            def _run(name):
+                results[name] = config._run_downloads(
+                    _download, [(provider, f'{name}{i}') for i in range(3)])
+
+            with config.download_pool():
+                # Both callers (trigger and staged inputs) share the pool
+                callers = [threading.Thread(target=_run, args=(name,))
+                           for name in ['input', 'staged']]
+                for caller in callers:
+                    caller.start()
+                for caller in callers:
+                    caller.join()
+        self.assertEqual(results, {'input': ['input0', 'input1', 'input2'],
+                                   'staged': ['staged0', 'staged1', 'staged2']})
+        self.assertEqual(max(max_active), 2)
+
+    def test_stage_inputs_not_defined(self):
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
+                             clear=True):
+            self.assertEqual(StorageConfig().stage_inputs('/tmp/input'), [])
+
     @mock.patch('faassupervisor.utils.FileUtils.get_all_files_in_dir')
     @mock.patch('faassupervisor.storage.providers.s3.S3.upload_file')
     @mock.patch('faassupervisor.storage.providers.minio.Minio.upload_file')
@@ -301,6 +506,514 @@ class StorageConfigTest(unittest.TestCase):
 #            StorageConfig().upload_output('/home/caterina/Documentos/test')
 
 
+class OutputUploaderTest(unittest.TestCase):
+
+    def _get_provider(self, thread_safe=True):
+        provider = mock.Mock(spec=S3)
+        provider.is_thread_safe.return_value = thread_safe
+        return provider
+
+    def test_sequential_upload(self):
+        provider = self._get_provider()
+        uploader = OutputUploader()
+        uploader.submit(provider, '/tmp/output/f1', 'f1', 'bucket')
+        uploader.submit(provider, '/tmp/output/f2', 'f2', 'bucket')
+        uploader.wait()
+        self.assertEqual(provider.upload_file.call_args_list,
+                         [call('/tmp/output/f1', 'f1', 'bucket'),
+                          call('/tmp/output/f2', 'f2', 'bucket')])
+
+    def test_concurrent_upload(self):
+        providers = [self._get_provider(), self._get_provider(thread_safe=False)]
+        uploader = OutputUploader(4)
+        limiter = threading.BoundedSemaphore(2)
+        for i in range(20):
+            uploader.submit(providers[i % 2], f'/tmp/output/f{i}', f'f{i}', 'bucket', limiter)
+        uploader.wait()
+        self.assertEqual(uploader.uploaded, 20)
+        self.assertEqual(providers[0].upload_file.call_count, 10)
+        self.assertEqual(providers[1].upload_file.call_count, 10)
+
+    def test_upload_errors(self):
+        provider = self._get_provider()
+        provider.upload_file.side_effect = [None, Exception('err1'), None, Exception('err2')]
+        uploader = OutputUploader(2)
+        for i in range(4):
+            uploader.submit(provider, f'/tmp/output/f{i}', f'f{i}', 'bucket')
+        with self.assertRaises(OutputUploadError) as err:
+            uploader.wait()
+        self.assertIn('Failed to upload 2 of 4 output files', str(err.exception))
+        self.assertEqual(provider.upload_file.call_count, 4)
+
+    def test_discard_unchanged(self):
+        provider = self._get_provider()
+        provider.is_unchanged.side_effect = lambda file_path, *_: file_path.endswith('1')
+        uploads = [(provider, f'/tmp/output/f{i}', f'f{i}', 'bucket', None) for i in range(3)]
+        uploader = OutputUploader()
+        self.assertEqual(uploader.discard_unchanged(uploads), [uploads[0], uploads[2]])
+        self.assertEqual(uploader.skipped, 1)
+        # Check errors force the upload
+        provider.is_unchanged.side_effect = Exception('error')
+        self.assertEqual(uploader.discard_unchanged(uploads), uploads)
+
+    @mock.patch('faassupervisor.utils.FileUtils.get_all_files_in_dir')
+    @mock.patch('faassupervisor.storage.providers.s3.S3.is_unchanged')
+    @mock.patch('faassupervisor.storage.providers.s3.S3.upload_file')
+    def test_upload_output_skip_unchanged(self, mock_upload, mock_unchanged, mock_get_files):
+        mock_get_files.return_value = ['/tmp/test/file1.txt', '/tmp/test/file2.txt']
+        mock_unchanged.side_effect = lambda file_path, *_: file_path.endswith('1.txt')
+        config_file = CONFIG_FILE_OK.replace('  path: bucket/folder',
+                                             '  path: bucket/folder\n  skip_unchanged: true')
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config_file)},
+                             clear=True):
+            StorageConfig().upload_output('/tmp/test')
+            mock_upload.assert_called_once_with('/tmp/test/file2.txt', 'file2.txt', 'bucket/folder')
+
+    @mock.patch('faassupervisor.utils.FileUtils.get_all_files_in_dir')
+    @mock.patch('faassupervisor.storage.config.OutputUploader')
+    def test_upload_output_concurrency(self, mock_uploader, mock_get_files):
+        mock_get_files.return_value = []
+        config_file = CONFIG_FILE_OK.replace('  path: bucket/folder', '  path: bucket/folder\n  concurrency: 8')
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config_file)},
+                             clear=True):
+            StorageConfig().upload_output('/tmp/test')
+            mock_uploader.assert_called_once_with(8)
+            os.environ['UPLOAD_CONCURRENCY'] = '16'
+            StorageConfig().upload_output('/tmp/test')
+            self.assertEqual(mock_uploader.call_args, call(16))
+
+
+class OutputRouterTest(unittest.TestCase):
+
+    OUTPUTS = [
+        {'storage_provider': 's3', 'path': 'bucket'},
+        {'storage_provider': 'minio', 'path': 'bucket', 'prefix': ['result-', 'res'], 'suffix': ['txt', '.jpg']},
+        {'storage_provider': 'minio', 'path': 'bucket', 'prefix': [], 'suffix': ['.out']},
+        {'storage_provider': 'minio', 'path': 'bucket', 'prefix': ['img/'], 'glob': ['img/*/frame-*.png']}
+    ]
+
+    def test_route(self):
+        router = OutputRouter(self.OUTPUTS)
+        self.assertEqual(router.route('file.txt'), [0])
+        self.assertEqual(router.route('result-file.txt'), [0, 1])
+        self.assertEqual(router.route('resfile.jpg'), [0, 1])
+        self.assertEqual(router.route('result-file.out'), [0, 2])
+        self.assertEqual(router.route('img/a/frame-1.png'), [0, 3])
+        self.assertEqual(router.route('img/frame-1.png'), [0])
+
+    def test_route_without_outputs(self):
+        self.assertEqual(OutputRouter([]).route('file.txt'), [])
+
+
+class OutputWatcherTest(unittest.TestCase):
+
+    def test_upload_complete_files(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            callback = mock.Mock()
+            watcher = OutputWatcher(output_dir, callback)
+            file1 = os.path.join(output_dir, 'file1')
+            file2 = os.path.join(output_dir, 'file2')
+            with open(file1, 'w') as f:
+                f.write('complete')
+            # Files must be marked as complete
+            watcher._upload_complete_files()
+            callback.assert_not_called()
+            open(f'{file1}.done', 'w').close()
+            watcher._upload_complete_files()
+            callback.assert_called_once_with([file1])
+            watcher._upload_complete_files()
+            callback.assert_called_once()
+            # New (not marked) and modified files are pending when stopping
+            with open(file2, 'w') as f:
+                f.write('partial')
+            self.assertEqual(watcher.stop(), [file2])
+            with open(file1, 'a') as f:
+                f.write(' and modified')
+            self.assertEqual(watcher.stop(), [file1, file2])
+
+    def test_upload_error(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            callback = mock.Mock(side_effect=OutputUploadError(failed=1, total=1, details=''))
+            watcher = OutputWatcher(output_dir, callback)
+            file1 = os.path.join(output_dir, 'file1')
+            with open(file1, 'w') as f:
+                f.write('complete')
+            open(f'{file1}.done', 'w').close()
+            watcher._upload_complete_files()
+            callback.assert_called_once_with([file1])
+            # Any error keeps the watcher running
+            callback.side_effect = ClientError({'Error': {'Code': '500'}}, 'PutObject')
+            watcher._upload_complete_files()
+            self.assertEqual(callback.call_count, 2)
+            with mock.patch('faassupervisor.storage.watcher.get_logger') as mock_logger:
+                self.assertEqual(watcher.stop(), [file1])
+                self.assertEqual(mock_logger.return_value.warning.call_count, 2)
+
+    def test_marker_named_files(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            watcher = OutputWatcher(output_dir, mock.Mock())
+            # Files ending with the suffix are only markers if the marked file exists
+            results = os.path.join(output_dir, 'results.done')
+            open(results, 'w').close()
+            self.assertEqual(watcher.stop(), [results])
+
+
+class InputStreamTest(unittest.TestCase):
+
+    def _get_event(self):
+        event = mock.Mock(spec=S3Event)
+        type(event).file_name = mock.PropertyMock(return_value='s3_file')
+        return event
+
+    def test_stream_input(self):
+        provider = mock.Mock(spec=S3)
+        provider.download_stream.side_effect = lambda event, data: data.write(b'streamed')
+        with tempfile.TemporaryDirectory() as input_dir:
+            input_stream = InputStream(provider, self._get_event(), input_dir)
+            fifo_path = input_stream.start()
+            self.assertEqual(fifo_path, os.path.join(input_dir, 's3_file'))
+            with open(fifo_path, 'rb') as f:
+                self.assertEqual(f.read(), b'streamed')
+            input_stream.stop()
+
+    def test_stream_not_read(self):
+        provider = mock.Mock(spec=S3)
+        provider.download_stream.side_effect = lambda event, data: data.write(b'x' * 1000000)
+        with tempfile.TemporaryDirectory() as input_dir:
+            input_stream = InputStream(provider, self._get_event(), input_dir)
+            input_stream.start()
+            input_stream.stop()
+
+    def test_stream_error(self):
+        provider = mock.Mock(spec=S3)
+        provider.download_stream.side_effect = Exception('error')
+        with tempfile.TemporaryDirectory() as input_dir:
+            input_stream = InputStream(provider, self._get_event(), input_dir)
+            with open(input_stream.start(), 'rb') as f:
+                self.assertEqual(f.read(), b'')
+            with self.assertRaises(InputStreamError):
+                input_stream.stop()
+
+    def test_stream_not_supported(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertIsNone(StorageConfig().stream_input(UnknownEvent(''), '/tmp/input'))
+
+
+class InputCacheTest(unittest.TestCase):
+
+    def _create_file(self, path, size):
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_get_key(self):
+        self.assertEqual(InputCache.get_key('S3', 'default', 'bucket', 'key', 'etag'),
+                         InputCache.get_key('S3', 'default', 'bucket', 'key', 'etag'))
+        self.assertNotEqual(InputCache.get_key('S3', 'default', 'bucket', 'key', 'etag'),
+                            InputCache.get_key('S3', 'default', 'bucket', 'key', 'etag2'))
+        self.assertIsNone(InputCache.get_key('S3', 'default', 'bucket', 'key', None))
+
+    def test_fetch_and_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = InputCache(os.path.join(tmp_dir, 'cache'))
+            dst_path = os.path.join(tmp_dir, 'dst')
+            self.assertFalse(cache.fetch('key', dst_path))
+            cache.store('key', self._create_file(os.path.join(tmp_dir, 'src'), 10))
+            self.assertTrue(cache.fetch('key', dst_path))
+            self.assertEqual(os.path.getsize(dst_path), 10)
+            self.assertEqual(os.listdir(cache.tmp_path), [])
+
+    def test_fetch_and_store_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = InputCache(os.path.join(tmp_dir, 'cache'))
+            src_path = self._create_file(os.path.join(tmp_dir, 'src'), 10)
+            # Full disk while storing
+            with mock.patch('faassupervisor.storage.cache.shutil.copyfileobj',
+                            side_effect=OSError(errno.ENOSPC, 'No space left on device')), \
+                    mock.patch('faassupervisor.storage.cache.fcntl.ioctl', side_effect=OSError):
+                cache.store('key', src_path)
+            self.assertEqual(os.listdir(cache.objects_path), [])
+            self.assertEqual(os.listdir(cache.tmp_path), [])
+            # Read-only shared cache while fetching
+            cache.store('key', src_path)
+            dst_path = os.path.join(tmp_dir, 'dst')
+            with mock.patch('faassupervisor.storage.cache.os.utime',
+                            side_effect=PermissionError(errno.EPERM, 'Operation not permitted')):
+                self.assertFalse(cache.fetch('key', dst_path))
+            self.assertFalse(os.path.exists(dst_path))
+            self.assertTrue(cache.fetch('key', dst_path))
+
+    def test_entries_not_shared(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = InputCache(os.path.join(tmp_dir, 'cache'))
+            src_path = self._create_file(os.path.join(tmp_dir, 'src'), 10)
+            cache.store('key', src_path)
+            entry_path = os.path.join(cache.objects_path, 'key')
+            # The input file is still writable and not the cached inode
+            self.assertNotEqual(os.stat(src_path).st_mode & 0o777, 0o444)
+            self.assertNotEqual(os.stat(src_path).st_ino, os.stat(entry_path).st_ino)
+            dst_path = os.path.join(tmp_dir, 'dst')
+            self.assertTrue(cache.fetch('key', dst_path))
+            self.assertNotEqual(os.stat(dst_path).st_ino, os.stat(entry_path).st_ino)
+            # Modifying the fetched input doesn't change the entry
+            with open(dst_path, 'wb') as f:
+                f.write(b'modified')
+            self.assertEqual(FileUtils.read_file(entry_path, 'rb'), b'x' * 10)
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = InputCache(os.path.join(tmp_dir, 'cache'), max_size=25)
+            for i, key in enumerate(['key1', 'key2']):
+                cache.store(key, self._create_file(os.path.join(tmp_dir, key), 10))
+                os.utime(os.path.join(cache.objects_path, key), (i, i))
+            # Use key1 so key2 becomes the least recently used entry
+            self.assertTrue(cache.fetch('key1', os.path.join(tmp_dir, 'dst')))
+            cache.store('key3', self._create_file(os.path.join(tmp_dir, 'key3'), 10))
+            self.assertEqual(sorted(os.listdir(cache.objects_path)), ['key1', 'key3'])
+            # Files bigger than the budget are not cached
+            cache.store('key4', self._create_file(os.path.join(tmp_dir, 'key4'), 30))
+            self.assertEqual(sorted(os.listdir(cache.objects_path)), ['key1', 'key3'])
+
+    def test_from_config(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertIsNone(InputCache.from_config())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = f"input_cache:\n  path: {tmp_dir}\n  max_size: 1024\n"
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config)},
+                                 clear=True):
+                cache = InputCache.from_config()
+                self.assertEqual(cache.path, tmp_dir)
+                self.assertEqual(cache.max_size, 1024)
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def _get_event(self, etag='etag'):
+        event = mock.Mock(spec=MinioEvent)
+        event.get_type.return_value = 'MINIO'
+        type(event).provider_id = mock.PropertyMock(return_value='test_minio')
+        type(event).bucket_name = mock.PropertyMock(return_value='bucket')
+        type(event).object_key = mock.PropertyMock(return_value='input/file.txt')
+        type(event).object_etag = mock.PropertyMock(return_value=etag)
+        return event
+
+    def _create_outputs(self, output_dir):
+        os.makedirs(os.path.join(output_dir, 'folder'))
+        for file_name in ['out1', 'folder/out2']:
+            with open(os.path.join(output_dir, file_name), 'w') as f:
+                f.write(file_name)
+
+    def test_get_key(self):
+        with mock.patch.dict('os.environ', {'SCRIPT': 'c2NyaXB0'}, clear=True):
+            key = ResultCache.get_key([self._get_event()])
+            self.assertEqual(key, ResultCache.get_key([self._get_event()]))
+            self.assertNotEqual(key, ResultCache.get_key([self._get_event('etag2')]))
+            self.assertIsNone(ResultCache.get_key([self._get_event(None)]))
+            os.environ['SCRIPT'] = 'c2NyaXB0Mg=='
+            self.assertNotEqual(key, ResultCache.get_key([self._get_event()]))
+
+    def test_local_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_cache = ResultCache(LocalResultStore(os.path.join(tmp_dir, 'results')))
+            output_dir = os.path.join(tmp_dir, 'output')
+            restore_dir = os.path.join(tmp_dir, 'restore')
+            os.mkdir(restore_dir)
+            self._create_outputs(output_dir)
+            self.assertFalse(result_cache.fetch('key', restore_dir))
+            result_cache.store('key', output_dir)
+            # Storing the same result again is ignored
+            result_cache.store('key', output_dir)
+            self.assertTrue(result_cache.fetch('key', restore_dir))
+            with open(os.path.join(restore_dir, 'folder', 'out2')) as f:
+                self.assertEqual(f.read(), 'folder/out2')
+            self.assertEqual(os.listdir(os.path.join(tmp_dir, 'results')), ['key'])
+
+    @mock.patch('boto3.client')
+    def test_s3_store(self, mock_boto):
+        provider = Minio(AuthData('MINIO', MinioProviderTest.MINIO_CREDS))
+        provider.upload_file = mock.Mock()
+        result_store = S3ResultStore(provider, 'bucket/results/')
+        with tempfile.TemporaryDirectory() as output_dir:
+            self._create_outputs(output_dir)
+            result_store.store('key', output_dir)
+            self.assertCountEqual(provider.upload_file.call_args_list,
+                                  [call(os.path.join(output_dir, 'folder/out2'),
+                                        'folder/out2', 'bucket/results/key'),
+                                   call(os.path.join(output_dir, 'out1'),
+                                        'out1', 'bucket/results/key')])
+            put_args = mock_boto.return_value.put_object.call_args[1]
+            self.assertEqual(put_args['Key'], 'results/key/.manifest.json')
+            self.assertEqual(sorted(json.loads(put_args['Body'])), ['folder/out2', 'out1'])
+        mock_boto.return_value.get_object.return_value = {'Body': io.BytesIO(put_args['Body'])}
+        mock_boto.return_value.download_file.side_effect = \
+            lambda bucket_name, file_key, file_path, **kwargs: open(file_path, 'w').close()
+        with tempfile.TemporaryDirectory() as restore_dir:
+            self.assertTrue(result_store.fetch('key', restore_dir))
+            self.assertCountEqual(os.listdir(restore_dir), ['folder', 'out1'])
+            self.assertTrue(os.path.isfile(os.path.join(restore_dir, 'folder', 'out2')))
+        self.assertEqual(mock_boto.return_value.download_file.call_count, 2)
+
+    @mock.patch('boto3.client')
+    def test_s3_fetch_partial(self, mock_boto):
+        provider = Minio(AuthData('MINIO', MinioProviderTest.MINIO_CREDS))
+        file_origins = FileOrigins()
+        result_cache = ResultCache(S3ResultStore(provider, 'bucket/results', file_origins))
+        mock_boto.return_value.get_object.return_value = {
+            'Body': io.BytesIO(json.dumps(['out1', 'folder/out2']).encode('utf-8'))}
+
+        def _download_file(bucket_name, file_key, file_path, **kwargs):
+            if file_key.endswith('out2'):
+                raise ValueError('connection lost')
+            with open(file_path, 'w') as f:
+                f.write(file_key)
+
+        mock_boto.return_value.download_file.side_effect = _download_file
+        with tempfile.TemporaryDirectory() as restore_dir:
+            self.assertFalse(result_cache.fetch('key', restore_dir))
+            # Nothing is moved to the output folder nor registered
+            self.assertEqual(os.listdir(restore_dir), [])
+            self.assertEqual(len(file_origins), 0)
+
+    def test_from_config(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertIsNone(ResultCache.from_config(StorageConfig()))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = CONFIG_FILE_OK + f"result_cache:\n  path: {tmp_dir}\n"
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config)},
+                                 clear=True):
+                result_cache = ResultCache.from_config(StorageConfig())
+                self.assertIsInstance(result_cache.result_store, LocalResultStore)
+            config = CONFIG_FILE_OK + ("result_cache:\n  store: s3\n  path: bucket/results\n"
+                                       "  storage_provider: minio.test_minio\n")
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config)},
+                                 clear=True):
+                result_cache = ResultCache.from_config(StorageConfig())
+                self.assertIsInstance(result_cache.result_store, S3ResultStore)
+                self.assertEqual(result_cache.result_store.stg_provider.get_type(), 'MINIO')
+
+
+class FileOriginsTest(unittest.TestCase):
+
+    ORIGIN = {'type': 'MINIO', 'provider_id': 'test_minio',
+              'bucket': 'bucket', 'key': 'input/file', 'etag': 'etag'}
+
+    def test_get_origin(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_origins = FileOrigins()
+            input_path = os.path.join(tmp_dir, 'input')
+            with open(input_path, 'w') as f:
+                f.write('data')
+            file_origins.register(input_path, self.ORIGIN)
+            self.assertEqual(len(file_origins), 1)
+            self.assertEqual(file_origins.get(input_path), self.ORIGIN)
+            # Hardlinks and copies with the same content
+            os.link(input_path, os.path.join(tmp_dir, 'link'))
+            self.assertEqual(file_origins.get(os.path.join(tmp_dir, 'link')), self.ORIGIN)
+            with open(os.path.join(tmp_dir, 'copy'), 'w') as f:
+                f.write('data')
+            self.assertEqual(file_origins.get(os.path.join(tmp_dir, 'copy')), self.ORIGIN)
+            with open(os.path.join(tmp_dir, 'other'), 'w') as f:
+                f.write('atad')
+            self.assertIsNone(file_origins.get(os.path.join(tmp_dir, 'other')))
+            # Renamed files are still identified
+            os.rename(input_path, os.path.join(tmp_dir, 'renamed'))
+            self.assertEqual(file_origins.get(os.path.join(tmp_dir, 'renamed')), self.ORIGIN)
+            # Modified files are not
+            with open(os.path.join(tmp_dir, 'renamed'), 'a') as f:
+                f.write('more data')
+            self.assertIsNone(file_origins.get(os.path.join(tmp_dir, 'renamed')))
+            # Copies are identified by the digest recorded when registered
+            self.assertEqual(file_origins.get(os.path.join(tmp_dir, 'copy')), self.ORIGIN)
+
+    @mock.patch('faassupervisor.storage.origins.get_file_md5')
+    def test_get_origin_hashing(self, mock_md5):
+        mock_md5.side_effect = get_file_md5
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_origins = FileOrigins()
+            input_path = os.path.join(tmp_dir, 'input')
+            with open(input_path, 'wb') as f:
+                f.write(b'data')
+            # The MD5 ETag is used as the digest of the input
+            file_origins.register(input_path, {**self.ORIGIN,
+                                               'etag': f'"{hashlib.md5(b"data").hexdigest()}"'})
+            # Registering a file without MD5 ETag doesn't hash it either
+            other_input_path = os.path.join(tmp_dir, 'other_input')
+            with open(other_input_path, 'wb') as f:
+                f.write(b'other input')
+            file_origins.register(other_input_path, self.ORIGIN)
+            mock_md5.assert_not_called()
+            # Outputs with a different size are not hashed
+            with open(os.path.join(tmp_dir, 'bigger'), 'wb') as f:
+                f.write(b'more data')
+            self.assertIsNone(file_origins.get(os.path.join(tmp_dir, 'bigger')))
+            mock_md5.assert_not_called()
+            with open(os.path.join(tmp_dir, 'copy'), 'wb') as f:
+                f.write(b'data')
+            self.assertIsNotNone(file_origins.get(os.path.join(tmp_dir, 'copy')))
+            mock_md5.assert_called_once_with(os.path.join(tmp_dir, 'copy'))
+            # The registered file is hashed lazily and only once
+            mock_md5.reset_mock()
+            for file_name in ['copy2', 'copy3']:
+                with open(os.path.join(tmp_dir, file_name), 'wb') as f:
+                    f.write(b'other input')
+                self.assertIsNotNone(file_origins.get(os.path.join(tmp_dir, file_name)))
+            self.assertEqual(mock_md5.call_args_list,
+                             [call(os.path.join(tmp_dir, 'copy2')), call(other_input_path),
+                              call(os.path.join(tmp_dir, 'copy3'))])
+
+    def test_upload_output_copy(self):
+        provider = mock.Mock(spec=Minio)
+        provider.is_thread_safe.return_value = True
+        provider.can_copy_from.side_effect = lambda origin: origin['type'] == 'MINIO'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for file_name in ['result-copy.txt', 'result-new.txt']:
+                with open(os.path.join(tmp_dir, file_name), 'w') as f:
+                    f.write(file_name)
+            with mock.patch.dict('os.environ',
+                                 {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
+                                 clear=True):
+                config = StorageConfig()
+                config.file_origins.register(os.path.join(tmp_dir, 'result-copy.txt'),
+                                             self.ORIGIN)
+                with mock.patch.object(config, '_get_provider', return_value=provider):
+                    config.upload_output(tmp_dir, output_files=[
+                        os.path.join(tmp_dir, 'result-copy.txt'),
+                        os.path.join(tmp_dir, 'result-new.txt')])
+        # Both files are routed to the two outputs
+        self.assertEqual(provider.copy_file.call_args_list,
+                         [call(self.ORIGIN, 'result-copy.txt', 'bucket/folder'),
+                          call(self.ORIGIN, 'result-copy.txt', 'bucket')])
+        self.assertEqual(provider.upload_file.call_count, 2)
+
+    def test_copy_fallback(self):
+        provider = mock.Mock(spec=S3)
+        provider.copy_file.side_effect = Exception('PreconditionFailed')
+        uploader = OutputUploader()
+        uploader.submit(provider, '/tmp/output/f1', 'f1', 'bucket', origin=self.ORIGIN)
+        uploader.wait()
+        provider.upload_file.assert_called_once_with('/tmp/output/f1', 'f1', 'bucket')
+
+
+class ProviderRegistryTest(unittest.TestCase):
+
+    def test_supervisor_import_does_not_load_providers(self):
+        code = ("import sys, faassupervisor.supervisor;"
+                "print(','.join(m for m in sys.modules "
+                "if m.split('.')[0] in ('boto3', 'webdav3', 'rucio') "
+                "or m.startswith('faassupervisor.storage.providers.')))")
+        out = subprocess.check_output([sys.executable, '-c', code]).decode().strip()
+        self.assertEqual(out, '')
+
+    def test_create_invalid_provider(self):
+        with self.assertRaises(InvalidStorageProviderError):
+            create_provider(AuthData('INVALID', {}))
+
+
 class ProvidersModuleTest(unittest.TestCase):
 
     def test_get_bucket_name(self):
@@ -312,6 +1025,15 @@ class ProvidersModuleTest(unittest.TestCase):
                          'folder1/folder2/file')
         self.assertEqual(get_file_key('bucket', 'file'), 'file')
 
+    def test_get_file_md5(self):
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(b'a' * 10)
+            tmp_file.flush()
+            self.assertEqual(get_file_md5(tmp_file.name), hashlib.md5(b'a' * 10).hexdigest())
+            parts_md5 = hashlib.md5(b'a' * 4).digest() * 2 + hashlib.md5(b'a' * 2).digest()
+            self.assertEqual(get_file_md5(tmp_file.name, 4),
+                             f'{hashlib.md5(parts_md5).hexdigest()}-3')
+
 
 class LocalProviderTest(unittest.TestCase):
 
@@ -325,6 +1047,20 @@ class LocalProviderTest(unittest.TestCase):
         provider.download_file(parsed_event, '/tmp/local')
         parsed_event.save_event.assert_called_once_with('/tmp/local')
 
+    def test_unsupported_operations(self):
+        provider = Local(None)
+        self.assertFalse(provider.supports_streaming())
+        with self.assertRaises(StorageOperationNotSupportedError):
+            provider.download_stream(mock.Mock(spec=UnknownEvent), io.BytesIO())
+        self.assertFalse(provider.can_copy_from({'type': 'S3'}))
+        with self.assertRaises(StorageOperationNotSupportedError):
+            provider.copy_file({'type': 'S3'}, 'file', 'folder')
+        self.assertFalse(provider.supports_staging())
+        with self.assertRaises(StorageOperationNotSupportedError):
+            provider.list_objects('bucket/prefix')
+        with self.assertRaises(StorageOperationNotSupportedError):
+            provider.download_object({'bucket': 'bucket', 'key': 'key'}, '/tmp/file')
+
 
 class MinioProviderTest(unittest.TestCase):
 
@@ -347,7 +1083,8 @@ class MinioProviderTest(unittest.TestCase):
                                            region_name=None,
                                            verify=True,
                                            aws_access_key_id='test_minio_access',
-                                           aws_secret_access_key='test_minio_secret')
+                                           aws_secret_access_key='test_minio_secret',
+                                           config=None)
 
     @mock.patch('boto3.client')
     def test_get_client_custom_endpoint(self, mock_boto):
@@ -358,7 +1095,35 @@ class MinioProviderTest(unittest.TestCase):
                                            region_name=None,
                                            verify=True,
                                            aws_access_key_id='test_minio_access',
-                                           aws_secret_access_key='test_minio_secret')
+                                           aws_secret_access_key='test_minio_secret',
+                                           config=None)
+
+    @mock.patch('boto3.client')
+    def test_get_client_transfer_settings(self, mock_boto):
+        minio_provider = Minio(AuthData('MINIO', {**self.MINIO_CREDS,
+                                                  'multipart_threshold': 67108864,
+                                                  'multipart_chunksize': '33554432',
+                                                  'max_concurrency': 32,
+                                                  'retry_mode': 'adaptive',
+                                                  'max_attempts': 5,
+                                                  'connect_timeout': 5,
+                                                  'read_timeout': 'invalid'}))
+        config = mock_boto.call_args[1]['config']
+        self.assertEqual(config.max_pool_connections, 32)
+        self.assertEqual(config.connect_timeout, 5)
+        self.assertEqual(config.retries, {'mode': 'adaptive', 'max_attempts': 5})
+        transfer_config = minio_provider.transfer_args['Config']
+        self.assertEqual(transfer_config.multipart_threshold, 67108864)
+        self.assertEqual(transfer_config.multipart_chunksize, 33554432)
+        self.assertEqual(transfer_config.max_concurrency, 32)
+        mopen = mock.mock_open()
+        with mock.patch('builtins.open', mopen, create=True):
+            minio_provider.upload_file('/tmp/output/processed.jpg', 'processed.jpg', 'minio_bucket')
+            self.assertEqual(mock_boto.mock_calls[1],
+                             call().upload_fileobj(mopen.return_value,
+                                                   'minio_bucket',
+                                                   'processed.jpg',
+                                                   Config=transfer_config))
 
     @mock.patch('boto3.client')
     def test_download_file(self, mock_boto):
@@ -411,30 +1176,157 @@ class OnedataProviderTest(unittest.TestCase):
         self.assertEqual(provider.get_type(), 'ONEDATA')
         self.assertEqual(provider.stg_auth.creds, self.ONEDATA_CREDS)
 
-    @mock.patch('requests.get')
-    def test_download_file(self, mock_requests):
-        onedata_provider = Onedata(AuthData('ONEDATA', self.ONEDATA_CREDS))
-        # Mock requests.get response
-        response = namedtuple('response', ['content', 'status_code'])
-        mock_requests.return_value = response('test response', 200)
-        # Create mock event
+    def test_session(self):
+        onedata_provider = Onedata(AuthData('ONEDATA', {**self.ONEDATA_CREDS,
+                                                        'pool_size': 32,
+                                                        'max_retries': 'invalid'}))
+        adapter = onedata_provider.session.get_adapter('https://test_oneprovider.host')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(adapter.max_retries.total, onedata_provider._MAX_RETRIES)
+        self.assertNotIn('PUT', adapter.max_retries.allowed_methods)
+        # The session (and its connections) is reused by the cached provider
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE_OK)},
+                             clear=True):
+            clear_runtime_cache()
+            session = StorageConfig().get_provider('onedata.test_onedata').session
+            self.assertIs(StorageConfig().get_provider('onedata.test_onedata').session, session)
+
+    @staticmethod
+    def _get_event():
         event = mock.Mock(spec=OnedataEvent)
         type(event).file_name = mock.PropertyMock(return_value='onedata_file')
         type(event).object_key = mock.PropertyMock(return_value='/onedata_file_key')
+        return event
+
+    @staticmethod
+    def _serve(content, ranges=True, ignored_ranges=()):
+        """Returns a mocked 'get' that serves 'content' (honoring ranges if enabled)."""
+        def get(url, headers, stream):
+            response = mock.MagicMock()
+            response.__enter__.return_value = response
+            requested_range = headers.get('Range')
+            if not ranges or not requested_range or requested_range in ignored_ranges:
+                response.status_code = 200
+                response.iter_content.return_value = [content]
+                return response
+            start, end = (int(pos) for pos in requested_range[len('bytes='):].split('-'))
+            if start >= len(content):
+                response.status_code = 416
+                return response
+            end = min(end, len(content) - 1)
+            response.status_code = 206
+            response.headers = {'Content-Range': f'bytes {start}-{end}/{len(content)}'}
+            response.iter_content.return_value = [content[start:end + 1]]
+            return response
+        return get
+
+    @mock.patch('requests.Session.head')
+    @mock.patch('requests.Session.get')
+    def test_download_file(self, mock_requests, mock_head):
+        onedata_provider = Onedata(AuthData('ONEDATA', {**self.ONEDATA_CREDS,
+                                                        'chunk_size': '4'}))
+        # Mock streamed requests.get response
+        response = mock_requests.return_value.__enter__.return_value
+        response.status_code = 200
+        response.iter_content.return_value = [b'test', b' res', b'ponse']
         # Mock file management
         mopen = mock.mock_open()
         with mock.patch('builtins.open', mopen, create=True):
-            file_path = onedata_provider.download_file(event, '/tmp/input')
+            file_path = onedata_provider.download_file(self._get_event(), '/tmp/input')
             # Check returned file path
             self.assertEqual(file_path, '/tmp/input/onedata_file')
-            # Check request to onedata endpoint
+            # Check request to onedata endpoint (the size is not requested)
+            mock_head.assert_not_called()
             mock_requests.assert_called_once_with('https://test_oneprovider.host/cdmi/onedata_file_key',
-                                                  headers={'X-Auth-Token': 'test_onedata_token'})
+                                                  headers={'X-Auth-Token': 'test_onedata_token',
+                                                           'Range': 'bytes=0-16777215'},
+                                                  stream=True)
+            response.iter_content.assert_called_once_with(chunk_size=4)
             # Check file writing
             mopen.assert_called_once_with('/tmp/input/onedata_file', 'wb')
+            self.assertEqual(mopen.return_value.write.call_args_list,
+                             [mock.call(b'test'), mock.call(b' res'), mock.call(b'ponse')])
+
+    @mock.patch('requests.Session.get')
+    def test_download_file_by_id(self, mock_requests):
+        response = mock_requests.return_value.__enter__.return_value
+        response.status_code = 200
+        response.iter_content.return_value = [b'test']
+        event = self._get_event()
+        type(event).object_id = mock.PropertyMock(return_value='0000034500046EE9C6775')
+        with mock.patch('builtins.open', mock.mock_open(), create=True):
+            # Disabled by default
+            Onedata(AuthData('ONEDATA', self.ONEDATA_CREDS)).download_file(event, '/tmp/input')
+            mock_requests.assert_called_once_with('https://test_oneprovider.host/cdmi/onedata_file_key',
+                                                  headers=mock.ANY, stream=True)
+            mock_requests.reset_mock()
+            onedata_provider = Onedata(AuthData('ONEDATA', {**self.ONEDATA_CREDS,
+                                                            'download_by_id': True}))
+            onedata_provider.download_file(event, '/tmp/input')
+            mock_requests.assert_called_once_with(
+                'https://test_oneprovider.host/cdmi/cdmi_objectid/0000034500046EE9C6775',
+                headers=mock.ANY, stream=True)
+            # Fall back to the path if the event has no id
+            mock_requests.reset_mock()
+            type(event).object_id = mock.PropertyMock(return_value=None)
+            onedata_provider.download_file(event, '/tmp/input')
+            mock_requests.assert_called_once_with('https://test_oneprovider.host/cdmi/onedata_file_key',
+                                                  headers=mock.ANY, stream=True)
 
-    @mock.patch('requests.get')
-    @mock.patch('requests.put')
+    @mock.patch('requests.Session.get')
+    def test_download_file_error(self, mock_requests):
+        onedata_provider = Onedata(AuthData('ONEDATA', self.ONEDATA_CREDS))
+        response = mock_requests.return_value.__enter__.return_value
+        response.status_code = 200
+        response.iter_content.side_effect = requests.exceptions.ChunkedEncodingError('error')
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                onedata_provider.download_file(self._get_event(), tmpdirname)
+            # The partial file is removed
+            self.assertEqual(os.listdir(tmpdirname), [])
+            response.status_code = 404
+            with self.assertRaises(OnedataDownloadError):
+                onedata_provider.download_file(self._get_event(), tmpdirname)
+            self.assertEqual(os.listdir(tmpdirname), [])
+
+    @mock.patch('requests.Session.get')
+    def test_download_file_ranged(self, mock_get):
+        onedata_provider = Onedata(AuthData('ONEDATA', {**self.ONEDATA_CREDS,
+                                                        'ranged_download_threshold': '8',
+                                                        'range_size': '4',
+                                                        'range_concurrency': '2'}))
+        content = b'0123456789'
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            for served, expected_ranges in [
+                    # Concurrent ranges above the threshold
+                    (content, ['bytes=0-3', 'bytes=4-7', 'bytes=8-9']),
+                    # The rest of the file in one range below the threshold
+                    (content[:6], ['bytes=0-3', 'bytes=4-5']),
+                    # Small file, one request
+                    (content[:3], ['bytes=0-3']),
+                    # Empty file
+                    (b'', ['bytes=0-3', None])]:
+                mock_get.reset_mock()
+                mock_get.side_effect = self._serve(served)
+                file_path = onedata_provider.download_file(self._get_event(), tmpdirname)
+                self.assertEqual(FileUtils.read_file(file_path, 'rb'), served)
+                self.assertCountEqual([call.kwargs['headers'].get('Range')
+                                       for call in mock_get.call_args_list], expected_ranges)
+            # Ranges not supported by the server, the whole file is sent
+            mock_get.reset_mock()
+            mock_get.side_effect = self._serve(content, ranges=False)
+            file_path = onedata_provider.download_file(self._get_event(), tmpdirname)
+            self.assertEqual(FileUtils.read_file(file_path, 'rb'), content)
+            mock_get.assert_called_once()
+            # Range ignored after the first one, downloaded again with a single GET
+            mock_get.side_effect = self._serve(content, ignored_ranges=('bytes=8-9',))
+            file_path = onedata_provider.download_file(self._get_event(), tmpdirname)
+            self.assertEqual(FileUtils.read_file(file_path, 'rb'), content)
+            self.assertIsNone(mock_get.call_args.kwargs['headers'].get('Range'))
+
+    @mock.patch('requests.Session.get')
+    @mock.patch('requests.Session.put')
     def test_upload_file(self, mock_put, mock_get):
         onedata_provider = Onedata(AuthData('ONEDATA', self.ONEDATA_CREDS))
         response = namedtuple('response', ['status_code'])
@@ -458,6 +1350,35 @@ class OnedataProviderTest(unittest.TestCase):
             # Check file writing
             mopen.assert_called_once_with('/tmp/output/onedata_file', 'rb')
 
+    @mock.patch('requests.Session.get')
+    @mock.patch('requests.Session.put')
+    def test_upload_file_known_folders(self, mock_put, mock_get):
+        onedata_provider = Onedata(AuthData('ONEDATA', self.ONEDATA_CREDS))
+        response = namedtuple('response', ['status_code'])
+        onedata_url = 'https://test_oneprovider.host/cdmi/test_onedata_space'
+        # Only 'out' exists
+        mock_get.side_effect = lambda url, headers: response(
+            200 if url == f'{onedata_url}/out/' else 404)
+        mock_put.side_effect = lambda url, **kwargs: response(201)
+        with mock.patch('builtins.open', mock.mock_open(), create=True):
+            onedata_provider.upload_file('/tmp/output/f1', 'f1', 'out/a/b')
+            self.assertEqual([call.args[0] for call in mock_get.call_args_list],
+                             [f'{onedata_url}/out/a/b/', f'{onedata_url}/out/',
+                              f'{onedata_url}/out/a/'])
+            self.assertEqual([call.args[0] for call in mock_put.call_args_list],
+                             [f'{onedata_url}/out/a/', f'{onedata_url}/out/a/b/',
+                              f'{onedata_url}/out/a/b/f1'])
+            mock_get.reset_mock()
+            mock_put.reset_mock()
+            # Known folders are not checked again
+            onedata_provider.upload_file('/tmp/output/f2', 'f2', 'out/a/b')
+            onedata_provider.upload_file('/tmp/output/f3', 'f3', 'out/a')
+            mock_get.assert_not_called()
+            self.assertEqual(mock_put.call_count, 2)
+            # Only the unknown subfolder is checked
+            onedata_provider.upload_file('/tmp/output/f4', 'c/f4', 'out/a')
+            mock_get.assert_called_once_with(f'{onedata_url}/out/a/c/', headers=mock.ANY)
+
 
 class S3ProviderTest(unittest.TestCase):
 
@@ -475,7 +1396,24 @@ class S3ProviderTest(unittest.TestCase):
     @mock.patch('boto3.client')
     def test_get_client_without_creds(self, mock_boto):
         S3(AuthData('S3', None))
-        mock_boto.assert_called_once_with('s3')
+        mock_boto.assert_called_once_with('s3', config=None)
+
+    @mock.patch('boto3.client')
+    def test_get_client_settings_without_creds(self, mock_boto):
+        config_file = ("name: test-func\nstorage_providers:\n  s3:\n    default:\n"
+                       "      region: eu-west-1\n      max_pool_connections: 50\n"
+                       "      multipart_chunksize: 16777216\n")
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(config_file)},
+                             clear=True):
+            s3_auth = StorageConfig()._get_auth_data('S3')
+        s3_provider = S3(s3_auth)
+        # Credentials from the environment with the tuning settings of the entry
+        self.assertEqual(mock_boto.call_args[0], ('s3',))
+        self.assertEqual(set(mock_boto.call_args[1]), {'region_name', 'config'})
+        self.assertEqual(mock_boto.call_args[1]['region_name'], 'eu-west-1')
+        self.assertEqual(mock_boto.call_args[1]['config'].max_pool_connections, 50)
+        self.assertEqual(s3_provider.transfer_args['Config'].multipart_chunksize, 16777216)
 
     @mock.patch('boto3.client')
     def test_get_client_with_creds(self, mock_boto):
@@ -483,7 +1421,8 @@ class S3ProviderTest(unittest.TestCase):
         mock_boto.assert_called_once_with('s3',
                                            region_name=None,
                                            aws_access_key_id='test_s3_access',
-                                           aws_secret_access_key='test_s3_secret')
+                                           aws_secret_access_key='test_s3_secret',
+                                           config=None)
 
     @mock.patch('boto3.client')
     def test_download_file(self, mock_boto):
@@ -507,6 +1446,50 @@ class S3ProviderTest(unittest.TestCase):
                                                      's3_folder/s3_file',
                                                      mopen.return_value))
 
+    def _get_sized_event(self, size):
+        event = mock.Mock(spec=S3Event)
+        type(event).bucket_name = mock.PropertyMock(return_value='s3_bucket')
+        type(event).file_name = mock.PropertyMock(return_value='s3_file')
+        type(event).object_key = mock.PropertyMock(return_value='s3_folder/s3_file')
+        type(event).object_size = mock.PropertyMock(return_value=size)
+        type(event).object_etag = mock.PropertyMock(return_value='etag')
+        return event
+
+    @mock.patch('boto3.client')
+    def test_download_small_file(self, mock_boto):
+        s3_provider = S3(AuthData('S3', None))
+        mock_boto.return_value.get_object.return_value = {'Body': io.BytesIO(b'small')}
+        with tempfile.TemporaryDirectory() as input_dir:
+            file_path = s3_provider.download_file(self._get_sized_event(5), input_dir)
+            mock_boto.return_value.get_object.assert_called_once_with(Bucket='s3_bucket',
+                                                                      Key='s3_folder/s3_file')
+            mock_boto.return_value.download_fileobj.assert_not_called()
+            with open(file_path, 'rb') as f:
+                self.assertEqual(f.read(), b'small')
+
+    @mock.patch('boto3.client')
+    def test_download_large_file(self, mock_boto):
+        s3_provider = S3(AuthData('S3', {**self.S3_CREDS,
+                                         'single_get_threshold': 10,
+                                         'ranged_download_threshold': 20,
+                                         'multipart_chunksize': 7}))
+        content = bytes(range(50))
+
+        def get_object(**kwargs):
+            start, end = kwargs['Range'].replace('bytes=', '').split('-')
+            self.assertEqual(kwargs['IfMatch'], '"etag"')
+            return {'Body': io.BytesIO(content[int(start):int(end) + 1])}
+
+        mock_boto.return_value.get_object.side_effect = get_object
+        with tempfile.TemporaryDirectory() as input_dir:
+            file_path = s3_provider.download_file(self._get_sized_event(50), input_dir)
+            self.assertEqual(mock_boto.return_value.get_object.call_count, 8)
+            with open(file_path, 'rb') as f:
+                self.assertEqual(f.read(), content)
+            # Fail if the object is smaller than expected
+            with self.assertRaises(S3DownloadSizeError):
+                s3_provider.download_file(self._get_sized_event(60), input_dir)
+
     @mock.patch('boto3.client')
     def test_upload_file(self, mock_boto):
         s3_provider = S3(AuthData('S3', None))
@@ -522,6 +1505,212 @@ class S3ProviderTest(unittest.TestCase):
                                                    's3_bucket',
                                                    's3_folder/processed.jpg'))
 
+    @mock.patch('boto3.client')
+    def test_is_unchanged(self, mock_boto):
+        s3_provider = S3(AuthData('S3', None))
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(b'a' * 10)
+            tmp_file.flush()
+            etag = hashlib.md5(b'a' * 10).hexdigest()
+            mock_boto.return_value.head_object.return_value = {'ContentLength': 10,
+                                                               'ETag': f'"{etag}"'}
+            self.assertTrue(s3_provider.is_unchanged(tmp_file.name, 'file', 's3_bucket/folder'))
+            mock_boto.return_value.head_object.assert_called_once_with(Bucket='s3_bucket',
+                                                                        Key='folder/file')
+            mock_boto.return_value.head_object.return_value = {'ContentLength': 9,
+                                                               'ETag': f'"{etag}"'}
+            self.assertFalse(s3_provider.is_unchanged(tmp_file.name, 'file', 's3_bucket'))
+            # Multipart uploads use the size of the first part
+            mock_boto.return_value.head_object.side_effect = [
+                {'ContentLength': 10, 'ETag': f'"{get_file_md5(tmp_file.name, 4)}"'},
+                {'ContentLength': 4}
+            ]
+            self.assertTrue(s3_provider.is_unchanged(tmp_file.name, 'file', 's3_bucket'))
+            mock_boto.return_value.head_object.side_effect = ClientError({}, 'HeadObject')
+            self.assertFalse(s3_provider.is_unchanged(tmp_file.name, 'file', 's3_bucket'))
+
+
+    @mock.patch('boto3.client')
+    def test_list_objects(self, mock_boto):
+        s3_provider = S3(AuthData('S3', None))
+        self.assertTrue(s3_provider.supports_staging())
+        paginator = mock_boto.return_value.get_paginator.return_value
+        paginator.paginate.return_value = [
+            {'Contents': [{'Key': 'models/', 'Size': 0, 'ETag': '"e0"'},
+                          {'Key': 'models/a.pt', 'Size': 10, 'ETag': '"e1"'}]},
+            {'Contents': [{'Key': 'models/b.pt', 'Size': 20, 'ETag': '"e2"'}]}
+        ]
+        self.assertEqual(s3_provider.list_objects('bucket/models/'),
+                         [{'bucket': 'bucket', 'key': 'models/a.pt', 'size': 10, 'etag': 'e1'},
+                          {'bucket': 'bucket', 'key': 'models/b.pt', 'size': 20, 'etag': 'e2'}])
+        paginator.paginate.assert_called_once_with(Bucket='bucket', Prefix='models/')
+        s3_provider.list_objects('bucket')
+        self.assertEqual(paginator.paginate.call_args, call(Bucket='bucket', Prefix=''))
+        mock_boto.return_value.head_object.return_value = {'ContentLength': 5, 'ETag': '"e3"'}
+        self.assertEqual(s3_provider.list_objects('bucket/config/app.yaml'),
+                         [{'bucket': 'bucket', 'key': 'config/app.yaml', 'size': 5, 'etag': 'e3'}])
+
+    @mock.patch('boto3.client')
+    def test_copy_file(self, mock_boto):
+        s3_provider = S3(AuthData('S3', None))
+        origin = {'type': 'S3', 'provider_id': 'default',
+                  'bucket': 'in_bucket', 'key': 'input/file', 'etag': '"etag"'}
+        self.assertTrue(s3_provider.can_copy_from(origin))
+        self.assertFalse(s3_provider.can_copy_from({**origin, 'type': 'MINIO'}))
+        self.assertFalse(s3_provider.can_copy_from({**origin, 'provider_id': 'other'}))
+        s3_provider.copy_file(origin, 'file', 'out_bucket/folder')
+        mock_boto.return_value.copy.assert_called_once_with(
+            {'Bucket': 'in_bucket', 'Key': 'input/file'},
+            'out_bucket',
+            'folder/file',
+            ExtraArgs={'CopySourceIfMatch': '"etag"'})
+
+
+class WebDavProviderTest(unittest.TestCase):
+
+    WEBDAV_CREDS = {
+        'hostname': 'test.webdav',
+        'login': 'user',
+        'password': 'pass'
+    }
+
+    @mock.patch('webdav3.client.Client.execute_request')
+    def test_is_unchanged(self, mock_request):
+        webdav_provider = WebDav(AuthData('WEBDAV', self.WEBDAV_CREDS))
+        file_md5 = hashlib.md5(b'data')
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(b'data')
+            tmp_file.flush()
+            digest = base64.b64encode(file_md5.digest()).decode()
+            mock_request.return_value.headers = {'Digest': f'adler32=1234,md5={digest}'}
+            self.assertTrue(webdav_provider.is_unchanged(tmp_file.name, 'file', 'folder'))
+            mock_request.assert_called_once_with('check', '/folder/file',
+                                                 headers_ext=['Want-Digest: MD5'])
+            # The same (quoted) path used to upload the file is checked
+            mock_request.reset_mock()
+            webdav_provider.is_unchanged(tmp_file.name, 'my file%.txt', '/folder/')
+            mock_request.assert_called_once_with('check', '/folder/my%20file%25.txt',
+                                                 headers_ext=['Want-Digest: MD5'])
+            mock_request.reset_mock()
+            with mock.patch('builtins.open', mock.mock_open(), create=True):
+                webdav_provider._known_folders.add('folder')
+                webdav_provider.upload_file(tmp_file.name, 'my file%.txt', '/folder/')
+            self.assertEqual(mock_request.call_args.args[:2], ('upload', '/folder/my%20file%25.txt'))
+            mock_request.return_value.headers = {'ETag': f'"{file_md5.hexdigest()}"'}
+            self.assertTrue(webdav_provider.is_unchanged(tmp_file.name, 'file', 'folder'))
+            mock_request.return_value.headers = {'ETag': '"1234-5678"'}
+            self.assertFalse(webdav_provider.is_unchanged(tmp_file.name, 'file', 'folder'))
+            mock_request.side_effect = RemoteResourceNotFound('folder/file')
+            self.assertFalse(webdav_provider.is_unchanged(tmp_file.name, 'file', 'folder'))
+
+    @mock.patch('webdav3.client.Client.check')
+    @mock.patch('webdav3.client.Client.execute_request')
+    def test_upload_file(self, mock_request, mock_check):
+        webdav_provider = WebDav(AuthData('WEBDAV', self.WEBDAV_CREDS))
+        self.assertTrue(webdav_provider.is_thread_safe())
+        mock_check.return_value = False
+
+        def execute_request(action, path, data=None):
+            if action == 'mkdir' and path == '/out/':
+                # Already exists
+                raise MethodNotSupported(name=action, server='test.webdav')
+            return mock.Mock(status_code=201)
+        mock_request.side_effect = execute_request
+        with mock.patch('builtins.open', mock.mock_open(), create=True) as mopen:
+            webdav_provider.upload_file('/tmp/output/f1', 'f1', 'out/a/b')
+            mock_check.assert_called_once_with('out/a/b')
+            self.assertEqual(mock_request.call_args_list,
+                             [call('mkdir', '/out/'), call('mkdir', '/out/a/'),
+                              call('mkdir', '/out/a/b/'),
+                              call('upload', '/out/a/b/f1', data=mopen.return_value)])
+            mock_check.reset_mock()
+            mock_request.reset_mock()
+            # Known folders are not checked again
+            webdav_provider.upload_file('/tmp/output/f2', 'f2', 'out/a')
+            webdav_provider.upload_file('/tmp/output/f3', 'c/f3', 'out/a/b')
+            mock_check.assert_called_once_with('out/a/b/c')
+            self.assertEqual(mock_request.call_args_list,
+                             [call('upload', '/out/a/f2', data=mopen.return_value),
+                              call('mkdir', '/out/a/b/c/'),
+                              call('upload', '/out/a/b/c/f3', data=mopen.return_value)])
+            # The folder is checked again after a failed upload
+            mock_check.reset_mock()
+            mock_request.side_effect = RemoteResourceNotFound('out/a/f4')
+            with self.assertRaises(RemoteResourceNotFound):
+                webdav_provider.upload_file('/tmp/output/f4', 'f4', 'out/a')
+            mock_check.return_value = True
+            mock_request.side_effect = None
+            webdav_provider.upload_file('/tmp/output/f4', 'f4', 'out/a')
+            mock_check.assert_called_once_with('out/a')
+
+    @staticmethod
+    def _get_download_response(content, total, offset=0, fail_at=None, status_code=None):
+        """Returns a mocked GET response of 'content' from 'offset' that fails at 'fail_at'."""
+        def iter_content(chunk_size):
+            for start in range(offset, fail_at or len(content), chunk_size):
+                yield content[start:min(start + chunk_size, fail_at or len(content))]
+            if fail_at is not None:
+                raise requests.exceptions.ChunkedEncodingError('stalled')
+        response = mock.MagicMock()
+        response.__enter__.return_value = response
+        response.status_code = status_code or (206 if offset else 200)
+        response.headers = {'Content-Range': f'bytes {offset}-{total - 1}/{total}'} if offset \
+            else {'Content-Length': str(total)}
+        response.iter_content.side_effect = iter_content
+        return response
+
+    @mock.patch('time.sleep')
+    @mock.patch('webdav3.client.Client.execute_request')
+    def test_download_file(self, mock_request, mock_sleep):
+        webdav_provider = WebDav(AuthData('WEBDAV', {**self.WEBDAV_CREDS, 'chunk_size': '3'}))
+        content = b'0123456789'
+        event = mock.Mock()
+        type(event).file_name = mock.PropertyMock(return_value='file')
+        type(event).object_key = mock.PropertyMock(return_value='/folder/file')
+        # Stalled twice, resumed from the received bytes
+        mock_request.side_effect = [self._get_download_response(content, 10, fail_at=6),
+                                    self._get_download_response(content, 10, offset=6, fail_at=8),
+                                    self._get_download_response(content, 10, offset=8)]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            file_path = webdav_provider.download_file(event, tmpdirname)
+            self.assertEqual(file_path, os.path.join(tmpdirname, 'file'))
+            self.assertEqual(FileUtils.read_file(file_path, 'rb'), content)
+            self.assertEqual(mock_request.call_args_list,
+                             [call('download', '/folder/file', headers_ext=None),
+                              call('download', '/folder/file', headers_ext=['Range: bytes=6-']),
+                              call('download', '/folder/file', headers_ext=['Range: bytes=8-'])])
+            self.assertEqual(mock_sleep.call_count, 2)
+            # Range not supported, the download starts again
+            mock_request.side_effect = [self._get_download_response(content, 10, fail_at=4),
+                                        self._get_download_response(content, 10)]
+            webdav_provider.download_file(event, tmpdirname)
+            self.assertEqual(FileUtils.read_file(file_path, 'rb'), content)
+            # No progress after the retries
+            mock_request.reset_mock()
+            mock_request.side_effect = [self._get_download_response(content, 10, fail_at=2)] + \
+                [self._get_download_response(content, 10, offset=2, fail_at=2)] * 3
+            with self.assertRaises(WebDavDownloadError):
+                webdav_provider.download_file(event, tmpdirname)
+            self.assertEqual(mock_request.call_count, 1 + webdav_provider.max_retries)
+            self.assertEqual(os.listdir(tmpdirname), [])
+            # Not found errors are not retried
+            mock_request.reset_mock()
+            mock_request.side_effect = RemoteResourceNotFound('/folder/file')
+            with self.assertRaises(RemoteResourceNotFound):
+                webdav_provider.download_file(event, tmpdirname)
+            mock_request.assert_called_once()
+
+    def test_pooled_client(self):
+        webdav_provider = WebDav(AuthData('WEBDAV', self.WEBDAV_CREDS))
+        with webdav_provider._pooled_client() as client:
+            self.assertIs(client, webdav_provider.client)
+            # Concurrent uses get their own client
+            with webdav_provider._pooled_client() as other_client:
+                self.assertIsNot(other_client, client)
+        # Idle clients are reused
+        with webdav_provider._pooled_client() as reused_client:
+            self.assertIn(reused_client, (client, other_client))
+
 
 class RucioProviderTest(unittest.TestCase):
 
@@ -578,6 +1767,26 @@ class RucioProviderTest(unittest.TestCase):
         self.assertEqual(config_get('client', 'account'), rucio_provider.scope)
         self.assertEqual(config_get('client', 'auth_type'), 'oidc')
 
+    @mock.patch('faassupervisor.storage.providers.rucio.Client')
+    @mock.patch('faassupervisor.utils.OIDCUtils.refresh_access_token')
+    def test_client_config_per_provider(self, mock_refesh, mock_client):
+        mock_refesh.return_value = 'new_access_token'
+        hosts = []
+        mock_client.side_effect = lambda **kwargs: hosts.append(
+            (kwargs['rucio_host'], config_get('client', 'rucio_host'),
+             config_get('client', 'auth_token_file_path')))
+        rucio_provider = Rucio(AuthData('RUCIO', self.RUCIO_CREDS))
+        other_provider = Rucio(AuthData('RUCIO', {**self.RUCIO_CREDS,
+                                                  'host': 'https://other_rucio.host'},
+                                        'other'))
+        # The global config belongs to the last provider created
+        rucio_provider._get_rucio_client()
+        other_provider._get_rucio_client()
+        self.assertEqual(hosts, [('https://test_rucio.host', 'https://test_rucio.host',
+                                  rucio_provider.token_temp_file),
+                                 ('https://other_rucio.host', 'https://other_rucio.host',
+                                  other_provider.token_temp_file)])
+
     @mock.patch('faassupervisor.storage.providers.rucio.UploadClient')
     @mock.patch('faassupervisor.storage.providers.rucio.Client')
     @mock.patch('faassupervisor.storage.providers.rucio.RSEClient')
@@ -16,9 +16,12 @@
 import sys
 import io
 import os
+import tempfile
 import unittest
 from unittest import mock
 from faassupervisor.utils import SysUtils, StrUtils, FileUtils, ConfigUtils, OIDCUtils
+from faassupervisor.config_compiler import compile_config
+from faassupervisor.exceptions import StorageAuthError
 
 # pylint: disable=missing-docstring
 # pylint: disable=no-self-use
@@ -191,19 +194,69 @@ class ConfigUtilsTest(unittest.TestCase):
         with mock.patch.dict('os.environ',
                              {'AWS_EXECUTION_ENV': 'AWS_Lambda_'},
                              clear=True):
-            is_file.return_value = True
+            is_file.side_effect = lambda path: path == '/var/task/function_config.yaml'
             mopen = mock.mock_open(read_data=CONFIG_FILE)
             with mock.patch('builtins.open', mopen, create=True):
                 var = ConfigUtils.read_cfg_var('name')
                 mopen.assert_called_once_with('/var/task/function_config.yaml')
                 self.assertEqual(var, 'test-func')
 
+    def test_read_cfg_var_config_artifact(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = os.path.join(tmp_dir, 'function_config.yaml')
+            FileUtils.create_file_with_content(config_path, CONFIG_FILE)
+            artifact_path = compile_config(config_path)
+            self.assertEqual(artifact_path, os.path.join(tmp_dir, 'function_config.compiled.json'))
+            with mock.patch.object(ConfigUtils, '_BINARY_OSCAR_STORAGE_CONFIG_PATH', config_path):
+                with mock.patch.dict('os.environ', {}, clear=True):
+                    ConfigUtils.clear_config_cache()
+                    with mock.patch('yaml.safe_load') as mock_load:
+                        self.assertEqual(ConfigUtils.read_cfg_var('name'), 'test-func')
+                        mock_load.assert_not_called()
+                    # Stale artifacts are ignored
+                    FileUtils.create_file_with_content(config_path, 'name: other-func')
+                    self.assertEqual(ConfigUtils.read_cfg_var('name'), 'other-func')
+
+    def test_compile_invalid_config(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = os.path.join(tmp_dir, 'function_config.yaml')
+            FileUtils.create_file_with_content(config_path, 'storage_providers:\n  s3:\n    user: test')
+            with self.assertRaises(StorageAuthError):
+                compile_config(config_path)
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'function_config.compiled.json')))
+
     def test_read_cfg_var_config_encoded(self):
         with mock.patch.dict('os.environ',
                              {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE)},
                              clear=True):
             self.assertEqual(ConfigUtils.read_cfg_var('name'), 'test-func')
 
+    @mock.patch('yaml.safe_load')
+    def test_read_cfg_var_config_cached(self, mock_load):
+        mock_load.return_value = {'name': 'test-func', 'output': [{'path': 'bucket'}]}
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string(CONFIG_FILE)},
+                             clear=True):
+            ConfigUtils.clear_config_cache()
+            self.assertEqual(ConfigUtils.read_cfg_var('name'), 'test-func')
+            output = ConfigUtils.read_cfg_var('output')
+            output[0]['path'] = 'modified'
+            self.assertEqual(ConfigUtils.read_cfg_var('output'), [{'path': 'bucket'}])
+            self.assertEqual(mock_load.call_count, 1)
+            # Config changes must invalidate the cached values
+            os.environ['FUNCTION_CONFIG'] = StrUtils.utf8_to_base64_string('name: other-func')
+            mock_load.return_value = {'name': 'other-func'}
+            self.assertEqual(ConfigUtils.read_cfg_var('name'), 'other-func')
+            self.assertEqual(mock_load.call_count, 2)
+
+    def test_read_cfg_var_environment_over_cached_config(self):
+        with mock.patch.dict('os.environ',
+                             {'FUNCTION_CONFIG': StrUtils.utf8_to_base64_string('log_level: INFO')},
+                             clear=True):
+            self.assertEqual(ConfigUtils.read_cfg_var('log_level'), 'INFO')
+            os.environ['LOG_LEVEL'] = 'DEBUG'
+            self.assertEqual(ConfigUtils.read_cfg_var('log_level'), 'DEBUG')
+
 
 class OIDCUtilsTest(unittest.TestCase):
 